@@ -1,9 +1,26 @@
 PAGE_SIZE = 4096
-RECORD_SIZE = 128 // 8
+RECORD_SIZE = 8            # Default slot width of data columns in bytes (8, 4, 2 or 1)
 MAX_BUFFER_PAGES = None   # Maximum number of pages in buffer (None -> uncapped)
+MAX_BUFFER_MB = None      # Memory budget of the buffer in MB (None -> MAX_BUFFER_PAGES)
 PRINT_ERRORS = True
 DEBUG_PRINT = True
 UID_DIR = "db_storage/"
-MERGE_UPDATE_THRESHOLD = 100_000 # Number of updates to trigger merge
-MERGE_BATCH_SIZE = 1_000         # Number of base pages processed per batch
+MERGE_UPDATE_THRESHOLD = 100_000 # Number of pending tail records that wake the merge right away
+MERGE_BATCH_SIZE = 8             # Number of tail pages merged per round
+MERGE_INTERVAL = 0.5             # Seconds between merge rounds while there are pending tail records
+MERGE_CPU_SHARE = 0.25           # Fraction of time the merge may spend merging (sleeps the rest)
+MERGE_KEEP_VERSIONS = None       # Versions of each record kept after a merge (None -> all, else older tail pages are freed)
+INDEX_REBUILD_WORKERS = None     # Processes rebuilding indices (None -> one per core, 1 -> no pool)
 USE_LRU_NOT_MRU = True           # Whether to use LRU or MRU cache eviction
+REPLACEMENT_POLICY = None        # "lru", "mru", "clock" or "2q" (None -> LRU or MRU per USE_LRU_NOT_MRU)
+SCAN_RING_PAGES = 64             # Pages that scans cycle through instead of the cache (0 -> no ring)
+EVICT_BATCH_SHARE = 0.05         # Share of the buffer budget freed at once when it's exceeded
+WRITER_INTERVAL = 0.2            # Seconds between background writes of dirty pages (None -> only on eviction/close)
+WRITER_BATCH_PAGES = 512         # Dirty pages written per background round
+CHECKPOINT_INTERVAL = 10         # Seconds between checkpoints (all dirty pages written, log truncated up to them)
+MMAP_BASE_PAGES = False          # Whether base pages are read through memory maps of their segments
+WAL_ENABLED = True               # Whether databases keep a redo log (replayed on open after a crash)
+WAL_COMMIT_DELAY = 0.001         # Seconds a commit may wait for others to share its sync (group commit latency target)
+WAL_FLUSH_INTERVAL = 0.05        # Seconds before changes outside transactions are synced to the log
+LOCK_STRIPES = 64                # Mutexes the record locks of a table are hashed across
+COPY_TAIL_ON_INSERT = False      # Whether inserts write a copy of the base record as first tail (else on first update)
@@ -1,12 +1,14 @@
 import json
+import time
 
 from lstore.table import Table
 import os
 
 from lstore import config
 
-from lstore.storage.rid import RID
 from lstore.storage.buffer.page_table import PageTable
+from lstore.storage.meta_col import MetaCol
+from lstore.storage.wal import WriteAheadLog
 
 from lstore.index_types.index_config import IndexConfig
 
@@ -17,6 +19,9 @@ class Database():
         self.tables = dict()
         self.path = "./CS451"
 
+        # Redo log (once opened)
+        self.wal = None
+
         self._create_db_storage()
         self._set_uid_gen_path()
 
@@ -34,30 +39,70 @@ class Database():
         self._create_db_storage()
         self._set_uid_gen_path()
 
+        # Changes logged since the last clean close (ie it crashed)
+        wal = WriteAheadLog(self.path) if config.WAL_ENABLED else None
+        log_groups = wal.read() if wal is not None else []
+
         # Load metadata from file to recreate tables if metadata exists
         metadata_path = os.path.join(self.path, self.metadata_file)
         if os.path.exists(metadata_path):
             with open(metadata_path, 'r') as meta_file:
                 metadata: dict = json.load(meta_file)
             for table_name, table_info in metadata.get("tables", {}).items():
-                self._restore_table(table_name, table_info)
+                self._restore_table(table_name, table_info, log_groups)
+
+        self._replay_log(log_groups)
+
+        self.wal = wal
+        for table in self.tables.values():
+            table.wal = wal
+
+        if wal is not None:
+            # Keep the log until every table has checkpointed the replayed state
+            for name, table in self.tables.items():
+                wal.set_redo_lsn(name, table.page_writer.redo_lsn)
+
+            for table in self.tables.values():
+                table.page_writer.checkpoint()
+
+        # Index snapshots are stale once anything changes (until a clean close)
+        self._save_metadata()
 
     def close(self):
         """
         Closes the database by ensuring all in-memory data is safely flushed to disk.
         """
+        # Marks index snapshots as belonging to this version of the data
+        index_stamp = time.time_ns()
+
         for table in self.tables.values():
-            # Ensures any dirty pages are written to disk
-            table.flush_pages()
+            # Let the background merge finish its current page
+            table.merge_mgr.stop()
+            table.page_writer.stop()
+
+            # Ensures any dirty pages left are written to disk
+            table.page_writer.checkpoint()
+
+            # Save indices so reopening doesn't need to rebuild them
+            table.index.save_snapshot(table.disk.path, index_stamp)
+            table.disk.close()
 
         # Save metadata about tables
-        self._save_metadata()
+        self._save_metadata(index_stamp)
         self.tables.clear()
         self.path = None
 
-    def _save_metadata(self):
+        # Everything logged is on disk now
+        if self.wal is not None:
+            self.wal.truncate()
+            self.wal.close()
+            self.wal = None
+
+    def _save_metadata(self, index_stamp=None):
         """
         Saves the metadata for the database to the metadata file.
+
+        :param index_stamp: Validity stamp of the saved index snapshots
         """
         metadata = {"tables": dict()}
 
@@ -70,6 +115,8 @@ class Database():
                 "key_index": table.key,
                 "index_cols": index_cols,
                 "delete_tracker": list(table.delete_tracker),
+                "record_sizes": table.record_sizes[len(MetaCol):],
+                "index_stamp": index_stamp,
                 # Save additional table settings as needed
             }
 
@@ -80,27 +127,129 @@ class Database():
         if config.DEBUG_PRINT:
             print("Metadata saved successfully.")
 
-    def _restore_table(self, name, table_info):
+    def _restore_table(self, name, table_info, log_groups=()):
         """
-        Restores a table using the metadata loaded from disk.
+        Restores a table using the metadata loaded from disk, and the deleted
+        keys and log position from its last checkpoint.
+
+        :param log_groups: Groups of records in the log w/ their LSNs
         """
         num_columns = table_info.get("num_columns")
         key_index = table_info.get("key_index")
-        index_config = IndexConfig()  # Customize this if you have saved index details
+        index_cols = table_info.get("index_cols")
+        index_config = IndexConfig(index_columns=index_cols)
 
         delete_tracker = table_info.get("delete_tracker")
 
-        table = Table(name, num_columns, key_index, self.path, index_config, delete_tracker)
+        # Tables saved w/o slot widths use the old 16 byte big-endian slots
+        record_sizes = table_info.get("record_sizes")
+        if record_sizes is None:
+            raise ValueError(
+                f"Table '{name}' was saved in the old 16 byte slot format, which can't be read")
+
+        table = Table(name, num_columns, key_index, self.path, index_config,
+                      delete_tracker, record_sizes)
         self.tables[name] = table  # Recreate the table in the database
+        table.page_writer.restore_checkpoint()
+
+        # Index snapshots predate the changes left to replay
+        rebuild_index = any(
+            op["table"] == name
+            for lsn, ops in log_groups if lsn > table.page_writer.redo_lsn
+            for op in ops
+        )
 
-        # Reconstruct the index
-        table.reconstruct_index(table_info.get("index_cols"))
+        # Load indices saved on close, reconstruct them if missing or stale
+        if rebuild_index or not table.index.load_snapshot(
+                table.disk.path, table_info.get("index_stamp")):
+            table.reconstruct_index(index_cols)
 
         if config.DEBUG_PRINT:
             print(f"Restored and indexed table '{name}' with {num_columns} columns.")
 
+    def _replay_log(self, log_groups: list[tuple[int, list[dict]]]):
+        """
+        Redoes the changes in the log (in order) on top of the tables as they
+        were left on disk, skipping the ones their last checkpoint has on
+        disk. Changes are applied by primary key so redoing ones already on
+        disk is harmless: inserted rows replace any record w/ their key,
+        updates and deletes only apply to live records.
+        """
+        if config.DEBUG_PRINT and log_groups:
+            print(f"Replaying {len(log_groups)} log record group(s)...")
+
+        for lsn, ops in log_groups:
+            for op in ops:
+                table = self.tables.get(op["table"])
+                if table is not None and lsn <= table.page_writer.redo_lsn:
+                    continue  # On disk as of the table's last checkpoint
+
+                try:
+                    self._replay_op(op)
+                except Exception as e:
+                    if config.PRINT_ERRORS:
+                        print(f"Error replaying {op['op']} on table '{op['table']}': {e}")
+
+    def _replay_op(self, op: dict):
+        name = op["table"]
+
+        if op["op"] == "create":
+            if name not in self.tables:
+                table = Table(name, op["num_columns"], op["key_index"], self.path,
+                              IndexConfig(index_columns=op["index_cols"]),
+                              record_size=op["record_sizes"])
+
+                # Pages written before the crash are all redone from the log
+                table.disk.clear()
+                self.tables[name] = table
+            return
+
+        table = self.tables.get(name)
+        if table is None:
+            return  # Dropped later on
+
+        if op["op"] == "drop":
+            self.drop_table(name)
+
+        elif op["op"] == "insert":
+            for row in op["rows"]:
+                primary_key = row[table.key]
+
+                rid = self._get_live_rid(table, primary_key)
+                if rid is not None:
+                    table.delete(rid, primary_key)
+                elif table.index.locate(table.key, primary_key):
+                    table.delete_tracker.add(primary_key)  # Deleted on disk
+
+                table.insert(tuple(row))
+
+        elif op["op"] == "update":
+            for primary_key, columns in op["updates"]:
+                rid = self._get_live_rid(table, primary_key)
+                if rid is not None:
+                    table.update(rid, tuple(columns), primary_key)
+
+        elif op["op"] == "delete":
+            for primary_key in op["keys"]:
+                rid = self._get_live_rid(table, primary_key)
+                if rid is not None:
+                    table.delete(rid, primary_key)
+
+    @staticmethod
+    def _get_live_rid(table, primary_key):
+        """Gets the RID of the live record w/ a primary key (None if none)."""
+        rids = table.index.locate(table.key, primary_key)
+        if not rids or primary_key in table.delete_tracker:
+            return None
+
+        # Reused keys keep the RIDs of their deleted records, only one is live
+        records = table.buffer.get_records(rids, [0] * table.num_columns, 0)
+        if not records:
+            return None  # Deleted on disk
+
+        return records[0].rid
+
     def _set_uid_gen_path(self):
-        RID.initialize_uid_gen(self.path)
         PageTable.initialize_uid_gen(self.path)
 
     def _create_db_storage(self):
@@ -116,13 +265,14 @@ class Database():
         if not os.path.exists(merge_path):
             os.makedirs(merge_path)
 
-    def create_table(self, name, num_columns, key_index, index_config=None):
+    def create_table(self, name, num_columns, key_index, index_config=None, record_size=None):
         """
         # Creates a new table
         :param name: string         #Table name
         :param num_columns: int     #Number of Columns: all columns are integer
         :param key: int             #Index of table key in columns
         :param index_config
+        :param record_size: int or list[int]  #Slot width in bytes (8, 4, 2, 1), per column if list
         """
         if name in self.tables:
             print(f"Table '{name}' already exists, skipping creation")
@@ -132,8 +282,29 @@ class Database():
         if index_config is None:
             index_config = IndexConfig()
 
-        table = Table(name, num_columns, key_index, self.path, index_config)
+        table = Table(name, num_columns, key_index, self.path, index_config,
+                      record_size=record_size)
         self.tables[name] = table  # Add the table to the database's table dictionary.
+
+        if self.wal is not None:
+            # Changes logged before are none of the table's
+            table.page_writer.redo_lsn = self.wal.get_last_lsn()
+            self.wal.set_redo_lsn(name, table.page_writer.redo_lsn)
+
+            indices = table.index.indices
+            self.wal.commit([{
+                "op": "create",
+                "table": name,
+                "num_columns": num_columns,
+                "key_index": key_index,
+                "index_cols": [i for i in range(len(indices)) if indices[i] is not None],
+                "record_sizes": table.record_sizes[len(MetaCol):],
+            }])
+            table.wal = self.wal
+
+            # Checkpoints truncate the log past the creation
+            self._save_metadata()
+
         return table
 
     """
@@ -145,7 +316,14 @@ class Database():
         # Deletes the specified table
         """
         if name in self.tables:
-            del self.tables[name]
+            table = self.tables.pop(name)
+            table.merge_mgr.stop()
+            table.page_writer.stop()
+
+            if self.wal is not None:
+                self.wal.commit([{"op": "drop", "table": name}])
+                self.wal.set_redo_lsn(name, None)
+                self._save_metadata()
         else:
             raise Exception(f"Table '{name}' does not exist.")
 
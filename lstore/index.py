@@ -7,6 +7,9 @@ this object.
 Indices are usually B-Trees, but other data structures can be used as well.
 """
 
+import os
+from array import array
+
 from lstore import config
 
 from lstore.index_types.index_config import IndexConfig
@@ -15,6 +18,8 @@ from lstore.index_types.bptree import BPTreeIndex
 
 from lstore.index_types.dict_index import DictIndex
 
+from lstore.storage.rid import RID
+
 class Index:
 
     def __init__(self, table, key, num_columns, index_config):
@@ -59,6 +64,15 @@ class Index:
         # If an index exists, use it to look up the RIDs
         return self.indices[column].get(value)
 
+    def locate_many(self, column, values):
+        """
+        # Returns the RIDs of all records for each of the given values on column "column"
+        """
+        if self.indices[column] is None:
+            return [self.locate(column, value) for value in values]
+
+        return self.indices[column].get_many(list(values))
+
     def locate_range(self, begin, end, column, is_prim_key = False):
         """
         # Returns the RIDs of all records with values in column "column" between "begin" and "end"
@@ -84,7 +98,7 @@ class Index:
         if self.indices[column_number] is None:
             # Create a Index to serve as the index for this column
             if cfg.index_type == BPTreeIndex:
-                self.indices[column_number] = cfg.index_type(cfg.node_size)
+                self.indices[column_number] = cfg.index_type(cfg.node_size, cfg.fill_factor)
             else:
                 self.indices[column_number] = cfg.index_type()
 
@@ -135,9 +149,12 @@ class Index:
         index = self.indices[col_number]
         proj_idx = [1 if i == col_number else 0 for i in range(self.table.num_columns)]
 
+        pairs = []
         for primary_key, rid in key_rids_pairs:
             vals = self.table.select(primary_key, self.table.key, proj_idx)[0]
-            index.insert(vals.columns[0], rid)
+            pairs.append((vals.columns[0], rid))
+
+        index.bulk_load(pairs)
 
     #new_______________for reconstructing index
     def clear(self):
@@ -150,12 +167,87 @@ class Index:
 
     def bulk_insert(self, col_number, records):
         """
-        Bulk insert records into the index for a specific column.
+        Bulk insert records into the index for a specific column. Empty indices
+        (ie rebuilds) are bulk loaded in one pass instead.
         :param col_number: Column number to index.
         :param records: List of (value, RID) tuples.
         """
-        if self.indices[col_number] is None:
+        index = self.indices[col_number]
+        if index is None:
+            return
+
+        if index.is_empty():
+            index.bulk_load(records)
             return
 
         for value, rid in records:
             self.insert_val(col_number, value, rid, (col_number == self.key))
+
+    # Snapshots ------------------
+
+    def save_snapshot(self, path, stamp):
+        """
+        Writes each index as a sorted run of (value, RID) pairs, headed by the
+        validity stamp and number of pairs, to be loaded by load_snapshot.
+        :param path: Directory to write snapshot files to
+        :param stamp: Validity stamp (also saved in the database metadata)
+        """
+        for col in self.index_cols:
+            pairs = self.indices[col].scan_all()
+
+            vals = array("q", [val for val, _ in pairs])
+            rids = array("q", [int(rid) for _, rid in pairs])
+
+            with open(Index._get_snapshot_path(path, col), "wb") as file:
+                array("q", [stamp, len(pairs)]).tofile(file)
+                vals.tofile(file)
+                rids.tofile(file)
+
+    def load_snapshot(self, path, stamp) -> bool:
+        """
+        Loads indices saved by save_snapshot if there is one for every index
+        column and all carry the given stamp. Snapshot files are removed once
+        read, so a snapshot never outlives changes made after opening.
+
+        :return: False (leaving indices untouched) if missing or stale
+        """
+        runs = dict()
+
+        for col in self.index_cols:
+            snapshot_path = Index._get_snapshot_path(path, col)
+
+            if stamp is None or not os.path.exists(snapshot_path):
+                break
+
+            with open(snapshot_path, "rb") as file:
+                header = array("q")
+                header.fromfile(file, 2)
+                if header[0] != stamp:
+                    break
+
+                vals, rids = array("q"), array("q")
+                vals.fromfile(file, header[1])
+                rids.fromfile(file, header[1])
+
+            runs[col] = (vals, rids)
+
+        Index._remove_snapshot(path)
+
+        if len(runs) != len(self.index_cols):
+            return False
+
+        self.clear()
+        for col, (vals, rids) in runs.items():
+            self.bulk_insert(col, zip(vals, map(RID, rids)))
+
+        return True
+
+    @staticmethod
+    def _get_snapshot_path(path, col):
+        return os.path.join(path, f"index_{col}.run")
+
+    @staticmethod
+    def _remove_snapshot(path):
+        for filename in os.listdir(path):
+            if filename.startswith("index_") and filename.endswith(".run"):
+                os.remove(os.path.join(path, filename))
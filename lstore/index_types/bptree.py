@@ -1,6 +1,9 @@
 import math
 
+import time
 import threading
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
 
 from lstore import config
 
@@ -9,6 +12,21 @@ from lstore.index_types.index_type import IndexType
 
 from lstore.storage.rid import RID
 
+def _even_chunks(total, size, min_size=1):
+    """
+    Splits range(total) into as few (start, end) chunks of at most size items
+    as possible with sizes differing by at most one (so the last isn't tiny).
+    Chunks get at least min_size items even if that means exceeding size.
+    """
+    count = max(1, min(math.ceil(total / size), total // min_size))
+
+    start = 0
+    for i in range(count):
+        end = start + total // count + (i < total % count)
+        yield start, end
+        start = end
+
+
 class BPTree:
     def __init__(self, n):
         """
@@ -20,6 +38,11 @@ class BPTree:
         self.root = BPTreeNode(n) # Initializes tree with a root node
         self.root.is_leaf = True # In the beginning, the root is a leaf
 
+        # Fewest keys a non-root node can have (ie half full)
+        self.min_leaf_keys = math.ceil((n - 1) / 2)
+        self.min_internal_keys = math.ceil(n / 2) - 1
+
+        # Root latch, held by writers that may replace the root
         self.lock = threading.Lock()
 
     def insert(self, key_insert, value_insert):
@@ -28,29 +51,150 @@ class BPTree:
         key_insert: a single key to insert
         value_insert: a single value to insert
         """
-        leaf_node = self.search_node(key_insert) # 1) Find right leaf node
-        leaf_node.leaf_insert(leaf_node, key_insert, value_insert) # 2) Insert key/value pair
-        if len(leaf_node.keys) > self.n - 1: # 3) If full, split the node
-            self.split_node(leaf_node)
+        # 1) Find right leaf node, keeping ancestors it may split into latched
+        leaf_node, latched = self._latch_path(key_insert, self._is_insert_safe)
+        try:
+            # 2) Insert key/value pair
+            leaf_node.begin_write()
+            leaf_node.leaf_insert(leaf_node, key_insert, value_insert)
+            if len(leaf_node.keys) > self.n - 1: # 3) If full, split the node
+                self.split_node(leaf_node)
+        finally:
+            self._unlatch(latched)
 
     def delete(self, key_delete, value_delete):
         """
-        TODO: Implement for persistent memory
+        Deletes a key/value pair from the tree, removing the key once it has no
+        values and rebalancing (borrow or merge) nodes left less than half full
+        key_delete: a single key to delete
+        value_delete: a single value to delete
         """
-        leaf_node = self.search_node(key_delete)
-        leaf_node.leaf_delete(leaf_node, key_delete, value_delete)
-        
-        if len(leaf_node.keys) < math.ceil(self.n / 2):
-            pass
-            #print('UGHHH doing rebalancing later')
+        # 1) Find right leaf node, keeping ancestors it may merge into latched
+        leaf_node, latched = self._latch_path(key_delete, self._is_delete_safe)
+        try:
+            # 2) Delete key/value pair
+            leaf_node.begin_write()
+            if leaf_node.leaf_delete(leaf_node, key_delete, value_delete):
+                # 3) If the key was removed, rebalance from the leaf upwards
+                self.rebalance_node(leaf_node, latched)
+        finally:
+            self._unlatch(latched)
+
+    def get(self, key_search):
+        """
+        Gets a copy of the values of a key (None if missing) without latching
+        """
+        while True:
+            leaf, version = self._search_leaf(key_search)
+
+            try:
+                values = leaf.point_query_node(key_search)
+            except IndexError:
+                continue # Read the leaf mid-change (key w/o its values), retry
+            if values is not None:
+                values = values[:]
+
+            # Retry if leaf changed while reading
+            if leaf.version == version:
+                return values
+
+
+
+    def get_many(self, sorted_keys):
+        """
+        Gets copies of the values of many keys (None if missing) in one sweep
+        along the leaves instead of a traversal from the root per key
+        sorted_keys: keys to search for, sorted
+        """
+        results = []
+        if not sorted_keys:
+            return results
+
+        leaves = self._iter_leaves(sorted_keys[0])
+        keys, values = next(leaves, ((), ()))
 
+        for key_search in sorted_keys:
+            # Move forward to the leaf that could hold the key (search from the
+            # root again if it isn't the next one)
+            if keys and keys[-1] < key_search:
+                keys, values = next(leaves, ((), ()))
 
+                if keys and keys[-1] < key_search:
+                    leaves = self._iter_leaves(key_search)
+                    keys, values = next(leaves, ((), ()))
+
+            i = bisect_left(keys, key_search)
+            if i < len(keys) and keys[i] == key_search:
+                results.append(values[i][:])
+            else:
+                results.append(None)
+
+        return results
+
+    def bulk_load(self, sorted_pairs, fill_factor=1.0):
+        """
+        Builds the tree bottom-up from key/value pairs sorted by key, replacing
+        its contents. Leaves are packed up to fill_factor of their capacity and
+        linked, then each internal level is built on top of the one below.
+        sorted_pairs: iterable of (key, value) sorted by key
+        fill_factor: fraction of keys/children each node is filled with
+        """
+        # Group values of duplicate keys like leaf_insert does
+        keys, values = [], []
+        for key, value in sorted_pairs:
+            if keys and keys[-1] == key:
+                values[-1].append(value)
+            else:
+                keys.append(key)
+                values.append([value])
+
+        self.root = BPTreeNode(self.n)
+        self.root.is_leaf = True
+        if not keys:
+            return
+
+        # 1) Packed leaves with forward pointers
+        leaves = []
+        keys_per_leaf = max(1, int((self.n - 1) * fill_factor))
+        for start, end in _even_chunks(len(keys), keys_per_leaf):
+            leaf = BPTreeNode(self.n)
+            leaf.is_leaf = True
+            leaf.keys = keys[start:end]
+            leaf.values = values[start:end]
+
+            if leaves:
+                leaves[-1].forward_key = leaf
+            leaves.append(leaf)
+
+        # 2) Internal levels, separators are the smallest key of each subtree
+        level = leaves
+        level_mins = [leaf.keys[0] for leaf in leaves]
+        children_per_node = max(2, int(self.n * fill_factor))
+        while len(level) > 1:
+            parents, parent_mins = [], []
+            for start, end in _even_chunks(len(level), children_per_node, min_size=2):
+                parent = BPTreeNode(self.n)
+                parent.keys = level_mins[start + 1:end]
+                parent.values = level[start:end]
+                for child in parent.values:
+                    child.parent_node = parent
+
+                parents.append(parent)
+                parent_mins.append(level_mins[start])
+
+            level, level_mins = parents, parent_mins
+
+        self.root = level[0]
+
+    def is_empty(self):
+        return self.root.is_leaf and not self.root.keys
 
     def split_node(self, node_to_split):
         """
         Splits a given node and updates the tree structure
         """
-        
+        node_to_split.begin_write()
+
         new_node = BPTreeNode(self.n)
         new_node.is_leaf = node_to_split.is_leaf
         new_node.parent_node = node_to_split.parent_node 
@@ -110,10 +254,10 @@ class BPTree:
         """
         Inserts a key and child node into the parent node
         """
-        index = 0
-        # search for key's place in parent node
-        while index < len(parent_node.keys) and parent_node.keys[index] < key_insert:
-            index += 1
+        parent_node.begin_write()
+
+        # Binary search for key's place in parent node
+        index = bisect_left(parent_node.keys, key_insert)
 
         # Insert once place is found
         parent_node.keys.insert(index, key_insert)
@@ -125,6 +269,109 @@ class BPTree:
             self.split_node(parent_node)
 
 
+    def rebalance_node(self, node, latched):
+        """
+        Refills nodes with too few keys, from node up to the root. A node
+        borrows a key from a sibling that can spare one, otherwise it merges
+        with a sibling (which removes a key from the parent, so it continues
+        with the parent). Siblings are latched and added to latched.
+        """
+        while node is not self.root and len(node.keys) < self._min_keys(node):
+            parent_node = node.parent_node
+            parent_node.begin_write()
+            node.begin_write()
+
+            index = next(i for i, child in enumerate(parent_node.values) if child is node)
+
+            # 1) Borrow from the left sibling
+            if index > 0:
+                left_node = self._latch_sibling(parent_node.values[index - 1], latched)
+                if len(left_node.keys) > self._min_keys(left_node):
+                    self.borrow_left(parent_node, index, left_node, node)
+                    return
+
+            # 2) Borrow from the right sibling
+            if index + 1 < len(parent_node.values):
+                right_node = self._latch_sibling(parent_node.values[index + 1], latched)
+                if len(right_node.keys) > self._min_keys(right_node):
+                    self.borrow_right(parent_node, index, node, right_node)
+                    return
+
+            # 3) Merge into the left sibling (or the right sibling into node)
+            if index > 0:
+                self.merge_nodes(parent_node, index - 1, left_node, node)
+            else:
+                self.merge_nodes(parent_node, index, node, right_node)
+
+            node = parent_node
+
+        # If the root has a single child left, the child becomes the root
+        if node is self.root and not node.is_leaf and not node.keys:
+            node.begin_write()
+            self.root = node.values[0]
+            self.root.parent_node = None
+
+    def borrow_left(self, parent_node, index, left_node, node):
+        """
+        Moves the last key of left_node to the front of node (its right sibling
+        at index in parent_node), updating their separator
+        """
+        if node.is_leaf:
+            node.keys.insert(0, left_node.keys.pop())
+            node.values.insert(0, left_node.values.pop())
+            parent_node.keys[index - 1] = node.keys[0]
+        else:
+            # Rotate the separator down and left sibling's last key up
+            node.keys.insert(0, parent_node.keys[index - 1])
+            parent_node.keys[index - 1] = left_node.keys.pop()
+
+            child_node = left_node.values.pop()
+            node.values.insert(0, child_node)
+            child_node.parent_node = node
+
+    def borrow_right(self, parent_node, index, node, right_node):
+        """
+        Moves the first key of right_node to the end of node (its left sibling
+        at index in parent_node), updating their separator
+        """
+        if node.is_leaf:
+            node.keys.append(right_node.keys.pop(0))
+            node.values.append(right_node.values.pop(0))
+            parent_node.keys[index] = right_node.keys[0]
+        else:
+            # Rotate the separator down and right sibling's first key up
+            node.keys.append(parent_node.keys[index])
+            parent_node.keys[index] = right_node.keys.pop(0)
+
+            child_node = right_node.values.pop(0)
+            node.values.append(child_node)
+            child_node.parent_node = node
+
+    def merge_nodes(self, parent_node, index, left_node, right_node):
+        """
+        Moves all keys of right_node into left_node (siblings separated by the
+        key at index in parent_node) and removes right_node from the parent
+        """
+        right_node.begin_write()
+
+        if left_node.is_leaf:
+            left_node.keys.extend(right_node.keys)
+            left_node.values.extend(right_node.values)
+
+            # Unlink right node from the leaves
+            left_node.forward_key = right_node.forward_key
+        else:
+            # Separator comes down between the two halves
+            left_node.keys.append(parent_node.keys[index])
+            left_node.keys.extend(right_node.keys)
+            left_node.values.extend(right_node.values)
+
+            for child_node in right_node.values:
+                child_node.parent_node = left_node
+
+        del parent_node.keys[index]
+        del parent_node.values[index + 1]
+
     def search_node(self, key_search):
         """
         Traverses the tree from root-downward until a leaf node is found.
@@ -133,11 +380,9 @@ class BPTree:
         current_node = self.root  # Start at the root
 
         while not current_node.is_leaf:  # Keep going until leaf
-            i = 0
-            # Find the child to follow
-            while i < len(current_node.keys) and key_search >= current_node.keys[i]:
-                i += 1
-            current_node = current_node.values[i]
+            # Find the child to follow (after all keys <= key_search)
+            current_node = current_node.values[
+                bisect_right(current_node.keys, key_search)]
 
         # Once at a leaf node, return it
         return current_node
@@ -148,15 +393,9 @@ class BPTree:
         """
 
         potential_leaf = self.search_node(key_search)
-        leaf_keys = potential_leaf.keys
-        leaf_values = potential_leaf.values
-        for i in range(len(leaf_keys)):
-            if leaf_keys[i] == key_search:
-                value_search = leaf_values[i]
-                #print(f'Key:{key_search} and RID(s):{value_search} found in leaf node')
-                return True
-       #print(f'Key:{key_search} not found in leaf node')
-        return False # If the key/value pair is not found
+
+        # False if the key/value pair is not found
+        return potential_leaf.point_query_node(key_search) is not None
     
     # can take primary key, can also take values
     def get_range_val(self, val_low, val_high):
@@ -164,19 +403,15 @@ class BPTree:
         Performs range query on tree returns list of RIDS
         """
         results = []
-        # Find the leaf node with key_low
-        low_leaf = self.search_node(val_low)
-        while low_leaf:
-            leaf_key_max = low_leaf.keys[-1]
+        # Start at the leaf node with key_low and follow forward pointers
+        for keys, values in self._iter_leaves(val_low):
             # Range query on a leaf
-            leaf_results, next_leaf_pointer = low_leaf.range_query_leaf(val_low, val_high)
-            results.extend(leaf_results)
+            start = bisect_left(keys, val_low)
+            end = bisect_right(keys, val_high, start)
+            results.extend(values[start:end])
 
-            if leaf_key_max >= val_high:
+            if keys[-1] >= val_high:
                 break
-        
-            # Otherwise, move to the next leaf node
-            low_leaf = next_leaf_pointer
 
         return results
     
@@ -187,40 +422,169 @@ class BPTree:
         """
         results = []
 
-        # 1. Find the left-most (lowest) leaf node
-        current_node = self.root
-        while not current_node.is_leaf:
-            if not current_node.values:
-                break # Error handling for empty tree
-            current_node = current_node.values[0] # Always take the first child
-
-        # 2. Traverse leaf nodes using forward pointers
-        while current_node:
-            for key, vals in zip(current_node.keys, current_node.values):
+        for keys, values in self._iter_leaves():
+            for key, vals in zip(keys, values):
                 for val in vals:
                     results.append((key, val))
-            current_node = current_node.forward_key
 
         return results
 
+    # Latching (writers) --------------
+
+    def _is_insert_safe(self, node):
+        """Whether inserting one key into the node can't split it"""
+        return len(node.keys) < self.n - 1
+
+    def _is_delete_safe(self, node):
+        """Whether deleting one key from the node can't make it merge"""
+        if node is self.root:
+            return node.is_leaf or len(node.keys) > 1
+
+        return len(node.keys) > self._min_keys(node)
+
+    def _min_keys(self, node):
+        return self.min_leaf_keys if node.is_leaf else self.min_internal_keys
+
+    def _latch_path(self, key, is_safe):
+        """
+        Latch crabbing: latches nodes from the root to the leaf for key,
+        releasing all latched ancestors whenever a node is safe (ie the change
+        can't propagate above it). The root latch covers replacing the root.
+        Returns the leaf and the latched nodes (root latch as None).
+        """
+        self.lock.acquire()
+        latched = [None]
+
+        node = self.root
+        while True:
+            node.latch()
+
+            if is_safe(node):
+                self._unlatch(latched)
+                latched = []
+            latched.append(node)
+
+            if node.is_leaf:
+                return node, latched
+
+            node = node.values[bisect_right(node.keys, key)]
+
+    def _latch_sibling(self, node, latched):
+        """
+        Latches a sibling of a latched node (their parent is latched, so
+        writers holding the sibling only ever wait on nodes below it)
+        """
+        if node not in latched:
+            node.latch()
+            latched.append(node)
+        node.begin_write()
+
+        return node
+
+    def _unlatch(self, latched):
+        for node in latched:
+            if node is None:
+                self.lock.release()
+            else:
+                node.unlatch()
+
+    # Optimistic reads (readers) ------
+
+    @staticmethod
+    def _read_version(node):
+        """Waits until the node is not being changed and gets its version"""
+        version = node.version
+        while version & 1:
+            time.sleep(0)
+            version = node.version
+
+        return version
+
+    def _search_leaf(self, key_search=None):
+        """
+        Traverses the tree without latching to the leaf for key_search (left
+        most leaf if None), validating each node's version on the way down and
+        restarting if one changed. Returns the leaf and its version.
+        """
+        while True:
+            node = self.root
+            version = self._read_version(node)
+
+            try:
+                while not node.is_leaf:
+                    if key_search is None:
+                        child = node.values[0]
+                    else:
+                        child = node.values[bisect_right(node.keys, key_search)]
+                    child_version = self._read_version(child)
+
+                    if node.version != version:
+                        break
+
+                    node, version = child, child_version
+                else:
+                    return node, version
+            except IndexError:
+                pass # Read a node mid-change, restart
+
+    def _iter_leaves(self, key_low=None):
+        """
+        Generates copies of (keys, values) of leaves with keys, from the leaf
+        for key_low (left most if None) on, without latching. If a leaf
+        changes while being read, resumes after the last key generated.
+        """
+        last_key = None
+        leaf, version = self._search_leaf(key_low)
+
+        while leaf is not None:
+            keys, values, next_leaf = leaf.keys[:], leaf.values[:], leaf.forward_key
+
+            if leaf.version != version:
+                leaf, version = self._search_leaf(key_low if last_key is None else last_key)
+                continue
+
+            if last_key is not None:
+                start = bisect_right(keys, last_key)
+                keys, values = keys[start:], values[start:]
+
+            if keys:
+                last_key = keys[-1]
+                yield keys, values
+
+            leaf = next_leaf
+            if leaf is not None:
+                version = self._read_version(leaf)
+
 
 
 ### B+ Tree Implementation
 class BPTreeIndex(IndexType):
-    def __init__(self, n=100):
+    def __init__(self, n=100, fill_factor=1.0):
         self.n = n
+        self.fill_factor = fill_factor # Node fill when bulk loading
         self.tree = BPTree(n=n) # Adjust n as needed to test performance
     
     def get(self, val) -> list[RID]:
-        with self.tree.lock:
-            leaf = self.tree.search_node(val)
-            values = leaf.point_query_node(val)
-            if values is None:
-                return []
-            else:
-                # Return the latest inserted value in a list
-                return values
+        values = self.tree.get(val)
+        if values is None:
+            return []
+        else:
+            # Return the latest inserted value in a list
+            return values
         
+    def get_many(self, vals) -> list[list[RID]]:
+        """
+        Gets RIDs of each val (in the order given) w/ one sorted sweep
+        """
+        order = sorted(range(len(vals)), key=vals.__getitem__)
+        found = self.tree.get_many([vals[i] for i in order])
+
+        results = [None] * len(vals)
+        for i, values in zip(order, found):
+            results[i] = [] if values is None else values
+
+        return results
+
     def get_range_val(self, begin, end):
         """
         Gets list of RIDs with column value all between begin and end value
@@ -237,20 +601,29 @@ class BPTreeIndex(IndexType):
         return self.get_range_val(begin, end)
     
     def insert(self, val, rid):
-        with self.tree.lock:
-            self.tree.insert(val, rid)
+        self.tree.insert(val, rid)
 
     def delete(self, val, rid):
-        """
-        !!! Values will be deleted from leafs, but tree won't rebalance yet.
-        """
-        with self.tree.lock:
-            self.tree.delete(val, rid)
+        self.tree.delete(val, rid)
 
     def update(self, val, new_val, rid):
         self.delete(val, rid)
         self.insert(new_val, rid)
 
+    def bulk_load(self, pairs):
+        """
+        Replaces contents with the given (val, rid) pairs. Sorts them once
+        (linear if already sorted) and builds the tree bottom-up.
+        """
+        tree = BPTree(n=self.n)
+        tree.bulk_load(sorted(pairs, key=itemgetter(0)), self.fill_factor)
+
+        with self.tree.lock:
+            self.tree = tree
+
+    def is_empty(self):
+        return self.tree.is_empty()
+
     def scan_all(self):
         """
         Obtains all key/value pairs in the entire tree
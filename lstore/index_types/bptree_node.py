@@ -1,6 +1,7 @@
 import math
 
 import threading
+from bisect import bisect_left, bisect_right
 
 from lstore import config
 
@@ -18,7 +19,23 @@ class BPTreeNode:
         self.forward_key = None # Pointer to the next leaf node
         self.is_leaf = False # Boolean denoting if the node is a leaf
 
+        # Latch for writers, version for optimistic readers (odd while changing)
         self.lock = threading.Lock()
+        self.version = 0
+
+    def latch(self):
+        self.lock.acquire()
+
+    def unlatch(self):
+        # Publish changes to readers before letting other writers in
+        if self.version & 1:
+            self.version += 1
+        self.lock.release()
+
+    def begin_write(self):
+        """Marks a latched node as changing, so readers retry until unlatched"""
+        if not self.version & 1:
+            self.version += 1
 
     def leaf_insert(self, leaf, key_insert, value_insert):
         """
@@ -28,61 +45,50 @@ class BPTreeNode:
         value_insert: a single value (RID) to insert
         """
         current_keys = self.keys
-        current_vals = self.values
-        # 1) Leaf node is empty (easy case)
-        if len(current_keys) == 0:
-            self.keys.append(key_insert)
-            self.values.append([value_insert])
-            #print(f'Key:{key_insert} and RID:{value_insert} inserted on empty leaf node')
 
-        # 2) Leaf node is not empty
+        # Binary search for first key >= key_insert
+        i = bisect_left(current_keys, key_insert)
+
+        # 1) Key exists, append value to its list
+        if i < len(current_keys) and current_keys[i] == key_insert:
+            self.values[i].append(value_insert)
+            #print(f'Appening a new value {value_insert} to existing key {key_insert}')
+
+        # 2) New key, insert in place (also handles empty leaf)
         else:
-            inserted = False
-            for i in range(len(current_keys)):
-                # First try to insert on lower keys and values
-                if key_insert < current_keys[i]:
-                    self.keys.insert(i, key_insert)
-                    self.values.insert(i, [value_insert])
-                    #print(f'Key:{key_insert} and RID:{value_insert} inserted on leaf node')
-                    inserted = True
-                    break
-                
-                elif key_insert == current_keys[i]: 
-                    self.values[i].append(value_insert)
-                    #print(f'Appening a new value {value_insert} to existing key {key_insert}')
-                    inserted = True
-                    break
-                
-            if not inserted:
-                self.keys.append(key_insert)
-                self.values.append([value_insert])
-                #print(f'Key:{key_insert} and RID:{value_insert} inserted on leaf node')
-                return
+            current_keys.insert(i, key_insert)
+            self.values.insert(i, [value_insert])
+            #print(f'Key:{key_insert} and RID:{value_insert} inserted on leaf node')
             
     def leaf_delete(self, leaf, key_delete, value_delete):
 
-        """Deletes a specific value from the leaf node"""
+        """
+        Deletes a specific value from the leaf node, removing its key once it
+        has no more values. Returns whether the key was removed.
+        """
 
         current_keys = self.keys
         current_values = self.values
 
         if self.is_leaf:
-            for i in range(len(current_keys)):
-                if key_delete == current_keys[i]:
-                    try:
-                        current_values[i].remove(value_delete)
-                        #print(f'Key {key_delete}, Value {value_delete} removed')
-                        if current_keys[i] == 0:
-                            del current_keys[i]
-                            del current_values[i]
-                            #print(f'Key {key_delete} is empty, no more vals')
-                        break
-                    except ValueError:
-                        #print(f'Value {value_delete}, not found in leaf node')
-                        break
+            i = bisect_left(current_keys, key_delete)
+            if i < len(current_keys) and key_delete == current_keys[i]:
+                try:
+                    current_values[i].remove(value_delete)
+                    #print(f'Key {key_delete}, Value {value_delete} removed')
+                    if not current_values[i]:
+                        del current_keys[i]
+                        del current_values[i]
+                        #print(f'Key {key_delete} is empty, no more vals')
+                        return True
+                except ValueError:
+                    pass
+                    #print(f'Value {value_delete}, not found in leaf node')
         else:
             pass
             # print(f'Key {key_delete} not found in leaf node')
+
+        return False
         
 
     def point_query_node(self, search_key):
@@ -92,10 +98,10 @@ class BPTreeNode:
         current_keys = self.keys
 
         if self.is_leaf:
-            for i in range(len(current_keys)):
-                if current_keys[i] == search_key:
-                    #print(f'Key:{search_key} found in leaf node')
-                    return current_vals[i]
+            i = bisect_left(current_keys, search_key)
+            if i < len(current_keys) and current_keys[i] == search_key:
+                #print(f'Key:{search_key} found in leaf node')
+                return current_vals[i]
                 
             if config.DEBUG_PRINT:
                 pass
@@ -125,11 +131,10 @@ class BPTreeNode:
         else:
             next_pointer = self.forward_key
 
-        for i in range(len(current_keys)):
-            if current_keys[i] > key_high:
-                break # More efficient to end loop when done
-            if key_low <= current_keys[i]:
-                results.append(current_vals[i])
+        # Binary search for the start and end of the range in the leaf
+        start = bisect_left(current_keys, key_low)
+        end = bisect_right(current_keys, key_high, start)
+        results.extend(current_vals[start:end])
 
         return(results, next_pointer)
 
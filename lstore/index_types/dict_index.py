@@ -42,8 +42,17 @@ class DictIndex(IndexType):
         # Val is value if not primary key
         self.data[key] = val
 
-    def delete(self, val):
+    def delete(self, val, rid=None):
         del self.data[val]
 
+    def scan_all(self):
+        """
+        Returns all key/value pairs sorted by key
+        """
+        return sorted(self.data.items())
+
     def clear(self):
         self.data = dict()
+
+    def is_empty(self):
+        return not self.data
@@ -11,14 +11,18 @@ class IndexConfig:
     """
     index_type: Two options, for now: 1) BPTreeIndex 2) DictIndex (hash)
     node_size: only applies to the BPTreeIndex, number of items in leaf
+    fill_factor: only applies to the BPTreeIndex, fraction of each node filled
+        when bulk loading (rebuilds, new indexes). Lower leaves room to insert
     """
     def __init__(
         self, 
         index_type: Type[IndexType] = BPTreeIndex,
-        node_size: int = 10,
-        index_columns: list[int] = None
+        node_size: int = 128,
+        index_columns: list[int] = None,
+        fill_factor: float = 0.9
     ) -> None:
         self.index_type = index_type
         self.node_size = node_size
+        self.fill_factor = fill_factor
         self.index_cols = index_columns
         
\ No newline at end of file
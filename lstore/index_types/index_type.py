@@ -28,3 +28,22 @@ class IndexType(ABC):
     @abstractmethod
     def clear(self):
         raise NotImplementedError()
+
+    @abstractmethod
+    def is_empty(self):
+        raise NotImplementedError()
+
+    def bulk_load(self, pairs):
+        """
+        Replaces contents with (val, rid) pairs. Override for faster builds.
+        """
+        self.clear()
+
+        for val, rid in pairs:
+            self.insert(val, rid)
+
+    def get_many(self, vals):
+        """
+        Gets RIDs of each val (in the order given). Override for faster lookups.
+        """
+        return [self.get(val) for val in vals]
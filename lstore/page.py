@@ -1,108 +1,152 @@
+from array import array
+
 from lstore import config
 
+# Native typecodes for the supported slot widths (in bytes)
+TYPECODES = {1: "b", 2: "h", 4: "i", 8: "q"}
+
+
 class Page:
-    record_size = config.RECORD_SIZE # In bytes
     page_size = config.PAGE_SIZE     # 4096 bytes
 
-    header_size = record_size * 1  # Currently: (num_records)
+    header_size = 8                  # Currently: (num_records) as int64
+    max_record_size = max(TYPECODES) # Widest slot (metadata columns)
 
-    def __init__(self, page_id):
+    # Records per page, same for every column so pages of a record line up
+    capacity = (page_size - header_size) // max_record_size
+
+    def __init__(self, page_id, record_size=config.RECORD_SIZE, data=None):
         self.id = page_id
-        self.data = bytearray(Page.page_size)
+        self.record_size = record_size  # In bytes
+
+        # Raw block (written to disk as is) and typed views of header/slots
+        if data is None:
+            data = bytearray(Page.block_size(record_size))
+        self._set_data(data)
 
-        self.offset = Page.header_size  # Start after header
+        self.offset = 0  # Number of filled slots (ie next free slot)
 
         self.is_dirty = False       # Dirty flag
         self.pin_count = 0          # Pin count
 
     @classmethod
-    def from_data(cls, data, page_id):
-        page = cls(page_id)
+    def from_data(cls, data, page_id, record_size=config.RECORD_SIZE):
+        """
+        Wraps a block read from disk. Buffers (ie bytearray or a view of a
+        memory mapped segment) are used directly without copying, read-only
+        views are copied on the first write. Other data is copied once.
+        """
+        if not isinstance(data, (bytearray, memoryview)):
+            data = bytearray(data)
 
-        page.offset = int.from_bytes(
-            data[:Page.record_size], byteorder="big", signed=True)
+        page = cls(page_id, record_size, data)
+        page.offset = page._read_offset()
 
-        page.data = bytearray(data)
+        return page
+
+    def copy(self):
+        """
+        Copy of the page w/ its own block (eg a new version to modify while
+        readers keep using this one).
+        """
+        page = Page(self.id, self.record_size, bytearray(self.data))
+        page.offset = self.offset
 
         return page
-    
+
+    @staticmethod
+    def block_size(record_size):
+        """Size in bytes of a page holding values of the given width."""
+        return Page.header_size + Page.capacity * record_size
+
     def __iter__(self):
         """
-        Generator that allows iteration through contents of page
+        Iterates through the filled slots of the page (without the header)
         """
-        record_size = Page.record_size
-        
-        start_index = Page.header_size
-        end_index = Page.header_size + record_size
-
-        # While less than the number of filled bytes in the page
-        while end_index <= self.offset:
-            yield int.from_bytes(
-                self.data[start_index:end_index], byteorder="big", signed=True)
-
-            start_index = end_index
-            end_index = end_index + record_size
-    
+        return iter(self.vals[:self.offset])
+
     def write(self, value):
+        self._make_writable()
+
         # Cache vals
         offset = self.offset
-        record_size = Page.record_size
 
-        start_index = offset
-        end_index = offset + record_size
+        if offset < Page.capacity:
+            self.vals[offset] = value
 
-        if end_index <= Page.page_size:
-            # Num records header + filled slots
-            self.data[start_index:end_index] = value.to_bytes(
-                record_size, byteorder='big', signed=True)
-
-            self._set_offset(end_index)
+            self._set_offset(offset + 1)
         else:
             # If the page is full, raise an exception
             raise Exception("Page is full. Cannot write more records.")
 
-        # Returning the offset where the value was written
-        return start_index
-        
+        # Returning the slot where the value was written
+        return offset
+
+    def write_many(self, values):
+        """
+        Writes values to the next free slots at once.
+        :param values: Sequence of values, must fit in the remaining capacity
+        :returns: The slot where the first value was written
+        """
+        self._make_writable()
+
+        offset = self.offset
+        end = offset + len(values)
+
+        if end > Page.capacity:
+            raise Exception("Page is full. Cannot write more records.")
+
+        self.vals[offset:end] = array(self.vals.format, values)
+
+        self._set_offset(end)
+
+        return offset
+
     def read(self, offset):
         """
         Reads a value at the given offset.
-        :param offset: The byte offset where the value starts.
+        :param offset: The slot where the value is stored.
         :returns: The integer value read from the offset.
         """
-        # Extract the bytes from the page's data starting at the offset
-        value_bytes = self.data[offset:offset + Page.record_size]
+        return self.vals[offset]
 
-        # Convert the extracted bytes to an integer and return it
-        return int.from_bytes(value_bytes, byteorder='big', signed=True)
-    
     def update(self, val, offset):
         """
         Updates the value at the given offset.
         :param val: The new value to be written.
-        :param offset: The byte offset where the value should be updated.
+        :param offset: The slot where the value should be updated.
         """
-        record_size = Page.record_size # Cache to skip namespace lookups
+        self._make_writable()
+
+        self.vals[offset] = val
 
-        # Convert the new value to bytes and overwrite the old data
-        self.data[offset:offset + record_size] = val.to_bytes(
-            record_size, byteorder='big', signed=True)
-        
     # Helpers ------------------
 
+    def _set_data(self, data):
+        self.data = data
+
+        view = memoryview(data)
+        self._header = view[:Page.header_size].cast("q")
+        self.vals = view[Page.header_size:].cast(TYPECODES[self.record_size])
+
+    def _make_writable(self):
+        # Mapped blocks are read-only, copy the block once before modifying it.
+        # Readers that got the old vals keep reading the (unchanged) mapping
+        if self.vals.readonly:
+            self._set_data(bytearray(self.data))
+
     def _read_offset(self):
-        return int.from_bytes(
-            self.data[:Page.record_size], byteorder="big", signed=True)
+        return self._header[0]
 
     def _set_offset(self, value):
+        self._make_writable()
+
         self.offset = value
-        self.data[:Page.record_size] = value.to_bytes(
-            Page.record_size, byteorder="big", signed=True)
-        
+        self._header[0] = value
+
     def _increment_offset(self):
-        record_size = Page.record_size
-        
-        self.offset += record_size
+        self._make_writable()
+
+        self.offset += 1
 
-        self.data[:Page.record_size] = self.offset.to_bytes(
-            Page.record_size, byteorder="big", signed=True)
+        self._header[0] = self.offset
@@ -2,6 +2,8 @@ from typing import Literal
 
 from lstore.table import Table, Record
 from lstore.index import Index
+from lstore.storage.thread_local import ThreadLocalSingleton
+from lstore.storage.thread_lock import RollbackCurrentTransaction
 
 from lstore import config
 
@@ -31,6 +33,11 @@ class Query:
             return False  # Record not found
 
         rid = rid_list[0]
+        self._lock_records([rid], exclusive=True)
+
+        # Key can't be reused by another transaction until this one ends
+        self._lock_keys([primary_key])
+
         # Log state for rollback if in a transaction
         if self.transaction_context:
             record = self.table.buffer.get_record(
@@ -47,8 +54,27 @@ class Query:
         # Return True upon succesful insertion
         # Returns False if insert fails for whatever reason
         """
+        # Lock the key before the record exists (and is indexed)
+        self._lock_keys([columns[self.table.key]])
+
         # Insert the record into the table
-        self.table.insert(columns)
+        rid = self.table.insert(columns)
+        self._lock_inserted([rid], [columns])
+        return True
+
+    def insert_many(self, rows, copy_tail=None) -> bool:
+        """
+        # Insert many records at once (all or none)
+        # :param rows: Iterable of column tuples, one per record
+        # :param copy_tail: Whether to write the initial tail copy of each record (None for config default)
+        # Return True upon succesful insertion
+        # Returns False if insert fails for whatever reason
+        """
+        rows = list(rows)
+        self._lock_keys([row[self.table.key] for row in rows])
+
+        rids = self.table.insert_batch(rows, copy_tail)
+        self._lock_inserted(rids, rows)
         return True
 
     def select(
@@ -98,6 +124,7 @@ class Query:
             return False  # Record not found
 
         rid = rid_list[0]
+        self._lock_records([rid], exclusive=True)
 
         # Log state for rollback if in a transaction
         if self.transaction_context:
@@ -109,6 +136,27 @@ class Query:
         self.table.update(rid, columns, primary_key)
         return True
 
+    def update_many(self, updates) -> bool:
+        """
+        # Update many records at once (all or none)
+        # :param updates: List of (primary_key, columns) w/ columns as in update
+        # Returns True if all updates are succesful
+        # Returns False if a key doesn't exist or would be duplicated
+        """
+        if self._in_transaction():
+            self._lock_records([
+                rid for primary_key, _ in updates
+                for rid in self.table.index.locate(self.table.key, primary_key)[:1]
+            ], exclusive=True)
+
+        try:
+            self.table.update_batch([
+                (primary_key, tuple(columns)) for primary_key, columns in updates])
+        except (Table.MissingKeyError, Table.DuplicateKeyError):
+            return False
+
+        return True
+
     def sum(self, start_range, end_range, aggregate_column_index):
         """
         :param start_range: int         # Start of the key range to aggregate 
@@ -155,6 +203,9 @@ class Query:
         """
         Core select functionality for use by select and select_version.
         """
+        if self._in_transaction():
+            self._lock_records(self.table.index.locate(search_key_index, search_key))
+
         # Get projected list of records
         records = self.table.select(
             search_key,
@@ -166,6 +217,11 @@ class Query:
         return records
         
     def _select_core_range(self, start_range, end_range, search_key_index, projected_columns_index, relative_version=0):
+        if self._in_transaction():
+            self._lock_records(self.table.index.locate_range(
+                start_range, end_range, search_key_index,
+                is_prim_key=(search_key_index == self.table.key)))
+
         records = self.table.select_range(
             start_range,
             end_range,
@@ -179,15 +235,11 @@ class Query:
     def _sum_core(self, start_range, end_range, aggregate_column_index, relative_version=0):
         """
         Core summation functionality for use by sum and sum_version.
-
-        TODO: REMOVE THAT WE GRAB WHOLE RECORDS WHEN CHECKING VALS
+        Scans the key and aggregate columns only (no whole records).
         """
-        total_sum = 0
-        records = self.select_version_range(
-                start_range, end_range, self.table.key, [1] * self.table.num_columns, relative_version)
-        if records:
-            for record in records:
-                total_sum += record.columns[aggregate_column_index]
+        _, total_sum = self.table.scan_range(
+            start_range, end_range, self.table.key, aggregate_column_index, relative_version)
+
         return total_sum
         
     def count(self, start_range, end_range, column_index, relative_version = 0):
@@ -195,16 +247,51 @@ class Query:
         Counts number of records with column value between start_range and end_range. 
         set start range and end range equal to eachother if you just want num records with column value equal to that one number
         """
-        proj_col_idx = [0] * self.table.num_columns
-        proj_col_idx[column_index] = 1
+        total_count, _ = self.table.scan_range(
+            start_range, end_range, column_index, rel_version=relative_version)
 
-        total_count = 0
-        records = self.select_version_range(start_range, end_range, column_index, proj_col_idx, relative_version)
-        if records:
-            total_count = len(records)
         return total_count
 
 
+    def _lock_records(self, rids, exclusive=False):
+        """
+        Locks records (by base RID) for the running transaction until it ends.
+        Raises RollbackCurrentTransaction if an older transaction holds one.
+        """
+        if exclusive:
+            acquire = self.table.lock_mgr.acquire_exclusive
+        else:
+            acquire = self.table.lock_mgr.acquire_shared
+
+        for rid in rids:
+            acquire(int(rid))
+
+    def _lock_keys(self, primary_keys):
+        """
+        Locks primary keys (ie of rows about to be inserted) for writing by
+        the running transaction until it ends.
+        Raises RollbackCurrentTransaction if an older transaction holds one.
+        """
+        for primary_key in primary_keys:
+            self.table.lock_mgr.acquire_exclusive(("key", primary_key))
+
+    def _lock_inserted(self, rids, rows):
+        """
+        Locks inserted records, undoing the inserts if that rolls back the
+        transaction (ie a reader found a record already), as they aren't
+        logged for rollback yet.
+        """
+        try:
+            self._lock_records(rids, exclusive=True)
+        except RollbackCurrentTransaction:
+            for row in rows:
+                self.table.rollback_insert(row[self.table.key])
+            raise
+
+    @staticmethod
+    def _in_transaction() -> bool:
+        return ThreadLocalSingleton.get_instance().transaction is not None
+
     @staticmethod
     def _print_error(err):
         if config.PRINT_ERRORS:
@@ -47,6 +47,19 @@ class Buffer:
         """
         return self.bufferpool.write(columns)
 
+    def insert_records(self, rows: list[tuple[int]], copy_tail: bool = None) -> list[RID]:
+        """
+        Creates new RIDs and inserts new records with the given data a page
+        at a time.
+
+        :param rows: New data values for each record
+        :param copy_tail: Whether to write a copy of each record as first tail
+            (None for config.COPY_TAIL_ON_INSERT)
+
+        :return: The created RIDs to be stored in the index (in order of rows)
+        """
+        return self.bufferpool.write_many(rows, copy_tail)
+
     def update_record(self, rid: RID, columns: tuple[int | None]):
         """
         Updates data record by adding a tail record with the data in columns.
@@ -57,6 +70,15 @@ class Buffer:
         # Update and save to page directory (for bufferpool to find)
         self.bufferpool.update(rid, 0, columns)
 
+    def update_records(self, rids: list[RID], columns_list: list[tuple[int | None]]):
+        """
+        Updates many data records, adding their tail records a page at a time.
+
+        :param rids: Base RIDs
+        :param columns_list: New data values for each RID
+        """
+        self.bufferpool.update_many(rids, columns_list)
+
     def get_record(
         self,
         rid: RID,
@@ -72,6 +94,50 @@ class Buffer:
         """
         return self.bufferpool.read(rid, proj_col_idx, rel_version)
 
+    def get_records(
+        self,
+        rids: list[RID],
+        proj_col_idx: list[Literal[0, 1]],
+        rel_version: int
+    ) -> list[Record]:
+        """
+        :param rids: RIDs of base records to retrieve
+        :param proj_col_idx: List of 0s or 1s indicating which columns to return
+        :param rel_version: Relative version to return. 0 is latest, -<n> are prev
+
+        :return: Populated Records of non-deleted RIDs (in the given order)
+        """
+        return self.bufferpool.read_many(rids, proj_col_idx, rel_version)
+
+    def scan_range(
+        self,
+        search_col: int,
+        start_range: int,
+        end_range: int,
+        agg_col: int | None,
+        rel_version: int,
+        pages_ids: list[int] | None = None
+    ) -> tuple[int, int]:
+        """
+        :param search_col: Data column to filter on
+        :param start_range: Smallest value to include
+        :param end_range: Largest value to include
+        :param agg_col: Data column to sum (None to only count)
+        :param rel_version: Relative version to sum. 0 is latest, -<n> are prev
+        :param pages_ids: Base pages ids to scan (None -> all)
+
+        :return: Number of records in range and sum of their agg_col values
+        """
+        return self.bufferpool.scan_range(
+            search_col, start_range, end_range, agg_col, rel_version, pages_ids)
+
+    def scan_hint(self):
+        """
+        Context manager marking the calling thread's reads as a sequential
+        scan, so they don't push frequently used pages out of the cache.
+        """
+        return self.bufferpool.scan_hint()
+
     def delete_record(self, rid: RID):
         """
         Marks record as deleted by setting base record's indirection to special
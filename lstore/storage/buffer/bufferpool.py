@@ -8,18 +8,29 @@ from typing import Literal
 
 import threading
 from collections import OrderedDict  # MRU cache
+from contextlib import contextmanager
 
 from lstore.storage.record import Record
 from lstore.storage.meta_col import MetaCol
+from lstore.storage.thread_local import ThreadLocalSingleton
 from lstore.storage.rid import RID
 
 from lstore.storage.buffer.page_table import PageTable, PageTableEntry
+from lstore.storage.buffer.replacement import ReplacementPolicy, make_policy
 
 from lstore import config
 
 from lstore.page import Page
 from lstore.storage.disk import Disk
 
+try:
+    import numpy as np
+except ImportError:  # Optional, scans fall back to plain Python loops
+    np = None
+
+# Whether each thread's page accesses are part of a sequential scan
+_scan_hints = threading.local()
+
 class Bufferpool:
     """
     A simple bufferpool that uses a hash table to store pages in memory,
@@ -33,27 +44,61 @@ class Bufferpool:
 
         self.tcols = self.table.num_total_cols
 
-        # Cache config
-        self.use_lru = config.USE_LRU_NOT_MRU
-        self.max_buffer_size = config.MAX_BUFFER_PAGES
+        # Cache budget, in bytes if config.MAX_BUFFER_MB is set, else in pages.
+        # Every page tracked for eviction costs its size (or 1) per column
+        if config.MAX_BUFFER_MB is not None:
+            self.page_costs = [Page.block_size(size) for size in self.table.record_sizes]
+            self.max_buffer_size = int(config.MAX_BUFFER_MB * 2**20)
+        else:
+            self.page_costs = [1] * self.tcols
+            self.max_buffer_size = config.MAX_BUFFER_PAGES
+
         if self.max_buffer_size is not None:
             # Ensure the buffer size can at least contain sets of read/write base/tail pages (4)
-            self.max_buffer_size = max(self.tcols * 4, self.max_buffer_size)
+            self.max_buffer_size = max(sum(self.page_costs) * 4, self.max_buffer_size)
+
+            # Once over budget, victims are evicted in a batch down to this
+            self.evict_target = self.max_buffer_size - max(
+                max(self.page_costs), int(self.max_buffer_size * config.EVICT_BATCH_SHARE))
+
+        # Cost of pages tracked for eviction (cache and scan ring)
+        self.buffer_used = 0
 
         # Global page table for LRU/MRU eviction
-        self.page_table = PageTable(self.tcols)  # Maps page_id -> list of page objects per column
+        self.page_table = PageTable(self.table.record_sizes)  # Maps page_id -> list of page objects per column
         
         # Pointers to pages in page_table (only as ordered sets)
         # Allows tracking base/tails in memory and and getting latest for writing
         self.base_trackers = OrderedDict()
         self.tail_trackers = OrderedDict()
 
-        # Saves page id and col as tuple in key for eviction
-        self.evict_queue = OrderedDict()
+        # Replacement policy, w/ page id and col as tuple in keys for eviction
+        policy = config.REPLACEMENT_POLICY
+        if policy is None:
+            policy = "lru" if config.USE_LRU_NOT_MRU else "mru"
+        self.evict_queue: ReplacementPolicy = make_policy(
+            policy, (self.max_buffer_size or 0) // min(self.page_costs))
+
+        # Small FIFO that pages first read by scans cycle through
+        self.scan_ring = OrderedDict()
+        self.scan_ring_size = config.SCAN_RING_PAGES
+
+        # Guards admissions/removals of tracked pages (accesses don't take it)
+        self.evict_queue_lock = threading.Lock()
+
+        # Only one thread evicts at a time (others don't wait for it)
+        self.evict_lock = threading.Lock()
+
+        # Serializes batched writes of dirty pages (background writer/flush)
+        self.flush_lock = threading.Lock()
 
-        self._new_vals_buffer = [None for _ in range(self.tcols)]
+        # Pages id -> number of running transactions that changed the pages.
+        # Those are only written once the transactions end (no-steal), so
+        # uncommitted changes never reach disk (the log only redoes)
+        self.uncommitted = dict()
+        self.uncommitted_lock = threading.Lock()
 
-    def write(self, columns: tuple[int]) -> RID:
+    def write(self, columns: tuple[int], copy_tail: bool = None) -> RID:
         """
         Writes a new record w/ the given data columns.
         Marks the page as dirty if modified.
@@ -62,41 +107,120 @@ class Bufferpool:
         page directory.
 
         :param columns: Tuple of data values for each column
+        :param copy_tail: Whether to also write the first tail record (copy of
+            base). If not, the base indirection points to the base record
+            itself and the copy is only written on its first update. Defaults
+            to config.COPY_TAIL_ON_INSERT
 
         :return: new RID
         """
-        with self.page_table.lock:
-            pages_b = self._get_latest_page_entry(True)
-            pages_t = self._get_latest_page_entry(False)
+        if copy_tail is None:
+            copy_tail = config.COPY_TAIL_ON_INSERT
 
-            pages_b.lock.acquire()
-            pages_t.lock.acquire()
+        pages_b = self._latch_latest_entry(True)
+        pages_t = self._latch_latest_entry(False) if copy_tail else None
 
-        # Create base rid
-        pages_id_b, offset_b = pages_b.get_loc()
-        rid: RID = RID.from_params(pages_id_b, offset_b, is_base=1, tombstone=0)
+        try:
+            # Create base rid
+            pages_id_b, offset_b = pages_b.get_loc()
+            rid: RID = RID.from_params(pages_id_b, offset_b, is_base=1, tombstone=0)
+
+            if copy_tail:
+                # Create 'tail' rid (copy of base)
+                pages_id_t, offset_t = pages_t.get_loc()
+                tail_rid: RID = RID.from_params(pages_id_t, offset_t, is_base=0, tombstone=0)
+            else:
+                tail_rid = rid
+
+            new_vals = [None] * self.tcols
+
+            # Write base record
+            new_vals[MetaCol.INDIR] = int(tail_rid)
+            new_vals[MetaCol.RID] = int(rid)
+            new_vals[MetaCol.SCHEMA] = 0
+            new_vals[MetaCol.BASE_RID] = int(rid)
+            new_vals[len(MetaCol):self.tcols] = columns # All data columns
+            pages_b.write_vals(new_vals)
+
+            if copy_tail:
+                # Write first tail record (copy of base record)
+                new_vals[MetaCol.INDIR] = 0
+                new_vals[MetaCol.RID] = int(tail_rid)
+                pages_t.write_vals(new_vals)
+
+                self.table.merge_mgr.note_tail_records(pages_id_t, 1)
+        finally:
+            if pages_t is not None:
+                pages_t.latch.release_exclusive()
+            pages_b.latch.release_exclusive()
 
-        # Create 'tail' rid (copy of base)
-        pages_id_t, offset_t = pages_t.get_loc()
-        tail_rid: RID = RID.from_params(pages_id_t, offset_t, is_base=0, tombstone=0)
+        # Return new base rid for index
+        return rid
 
-        # Cache buffer
-        new_vals = self._new_vals_buffer
+    def write_many(self, rows: list[tuple[int]], copy_tail: bool = None) -> list[RID]:
+        """
+        Writes new records a page at a time. Each run of records that fits in
+        the latest pages is written column by column in one go.
 
-        # Write base record
-        new_vals[MetaCol.INDIR] = int(tail_rid)
-        new_vals[MetaCol.RID] = int(rid)
-        new_vals[MetaCol.SCHEMA] = 0
-        new_vals[len(MetaCol):self.tcols] = columns # All data columns
-        pages_b.write_vals(new_vals)
+        :param rows: Tuples of data values for each column
+        :param copy_tail: Whether to also write the first tail record (copy of
+            base), see write
 
-        # Write first tail record (copy of base record)
-        new_vals[MetaCol.INDIR] = 0
-        new_vals[MetaCol.RID] = int(tail_rid)
-        pages_t.write_vals(new_vals)
+        :return: new RIDs (in the order of rows)
+        """
+        if copy_tail is None:
+            copy_tail = config.COPY_TAIL_ON_INSERT
 
-        # Return new base rid for index
-        return rid
+        rids = []
+
+        start = 0
+        while start < len(rows):
+            pages_b = self._latch_latest_entry(True)
+            pages_t = self._latch_latest_entry(False) if copy_tail else None
+
+            try:
+                # Fill rest of the base (and tail) pages
+                pages_id_b, offset_b = pages_b.get_loc()
+                count = min(len(rows) - start, PageTableEntry.capacity - offset_b)
+                if copy_tail:
+                    pages_id_t, offset_t = pages_t.get_loc()
+                    count = min(count, PageTableEntry.capacity - offset_t)
+
+                chunk = rows[start:start + count]
+                data_cols = list(zip(*chunk))
+                zeros = [0] * count
+
+                base_rids = [
+                    int(RID.from_params(pages_id_b, offset, is_base=1, tombstone=0))
+                    for offset in range(offset_b, offset_b + count)
+                ]
+
+                if copy_tail:
+                    tail_rids = [
+                        int(RID.from_params(pages_id_t, offset, is_base=0, tombstone=0))
+                        for offset in range(offset_t, offset_t + count)
+                    ]
+
+                    # Write first tail records (copies of base records)
+                    pages_t.write_cols([zeros, tail_rids, zeros, base_rids, *data_cols])
+
+                    self.table.merge_mgr.note_tail_records(pages_id_t, count)
+
+                    indirs = tail_rids
+                else:
+                    indirs = base_rids
+
+                pages_b.write_cols([indirs, base_rids, zeros, base_rids, *data_cols])
+            finally:
+                if pages_t is not None:
+                    pages_t.latch.release_exclusive()
+                pages_b.latch.release_exclusive()
+
+            rids.extend(map(RID, base_rids))
+            start += count
+
+        # Return new base rids for index
+        return rids
 
     def update(self, rid: RID, tombstone: Literal[0, 1], columns: tuple[int | None]):
         """
@@ -112,67 +236,102 @@ class Bufferpool:
         :param columns: New data values. Vals are none if no update for that col
         """
         pages_id_b, offset_b = rid.get_loc()
-        self._validate_not_deleted(rid, pages_id_b, offset_b)
 
-        with self.page_table.lock:
-            pages_b = self.page_table.get_entry(pages_id_b)
-            pages_t = self._get_latest_page_entry(False)
+        # Base latch is held until the new tail is written, so readers never
+        # follow the base indirection to an empty slot
+        pages_b = self._latch_entry(pages_id_b)
+        try:
+            self._validate_not_deleted(rid, pages_id_b, offset_b)
 
-            pages_b.lock.acquire()
-            pages_t.lock.acquire()
+            # Keep the original values in a tail record before the first update
+            if RID(self._read_val(MetaCol.INDIR, pages_id_b, offset_b)).is_base:
+                self._write_tail_copies([rid])
 
-        # Create new RID
-        pages_id_t, offset_t = pages_t.get_loc()
-        tail_rid = RID.from_params(pages_id_t, offset_t, is_base=0, tombstone=tombstone)
+            pages_t = self._latch_latest_entry(False)
+            try:
+                # Create new RID
+                pages_id_t, offset_t = pages_t.get_loc()
+                tail_rid = RID.from_params(pages_id_t, offset_t, is_base=0, tombstone=tombstone)
 
-        # Cache for performance
-        _read_val_cached = self._read_val
-        new_vals = self._new_vals_buffer
+                new_vals = self._fill_tail_vals(
+                    rid, tail_rid, columns, [None] * self.tcols, pages_b)
 
-        # Indirection -----------------
+                pages_t.write_vals(new_vals)
 
-        # Set new tail indir to prev tail rid and base indir to new rid
-        indir_rid = RID(_read_val_cached(MetaCol.INDIR, pages_id_b, offset_b))
-        new_vals[MetaCol.INDIR] = int(indir_rid)
-        self._overwrite_val(MetaCol.INDIR, rid, tail_rid, pages_b)
+                self.table.merge_mgr.note_tail_records(pages_id_t, 1)
+            finally:
+                pages_t.latch.release_exclusive()
+        finally:
+            pages_b.latch.release_exclusive()
 
-        # RID ----------- -------------
+    def update_many(self, rids: list[RID], columns_list: list[tuple[int | None]]):
+        """
+        Updates many records, appending their tail records a page at a time.
+        Records are updated in the given order (the same RID may repeat).
 
-        new_vals[MetaCol.RID] = int(tail_rid)
+        :param rids: Base record RIDs
+        :param columns_list: New data values for each RID. Vals are none if no
+            update for that col
+        """
+        for rid in rids:
+            self._validate_not_deleted(rid, *rid.get_loc())
+
+        new_vals = [None] * self.tcols
+
+        start = 0
+        while start < len(rids):
+            # Next run of distinct records that fits in a tail page, stopping
+            # before a repeated RID since its previous tail record wouldn't be
+            # written yet
+            end = min(len(rids), start + PageTableEntry.capacity)
+            chunk_rids = set()
+            for i in range(start, end):
+                if rids[i] in chunk_rids:
+                    end = i
+                    break
+                chunk_rids.add(rids[i])
+
+            # Base page entries of the run (latched once each, in order)
+            base_entries = {}
+            try:
+                for pages_id_b in sorted({rid.get_loc()[0] for rid in chunk_rids}):
+                    base_entries[pages_id_b] = self._latch_entry(pages_id_b)
 
-        # Schema encoding & data ------
+                # Keep the original values in tail records before the first updates
+                self._write_tail_copies([
+                    rid for rid in dict.fromkeys(rids[start:end])
+                    if RID(self._read_val(MetaCol.INDIR, *rid.get_loc())).is_base
+                ])
 
-        # Get record indices for previous tail record
-        pages_id_i, offset_i = indir_rid.get_loc()
+                pages_t = self._latch_latest_entry(False)
+                try:
+                    # Fill rest of the tail page
+                    pages_id_t, offset_t = pages_t.get_loc()
+                    end = min(end, start + PageTableEntry.capacity - offset_t)
 
-        # Get latest schema encoding (go to latest tail if recently merged)
-        schema_encoding = _read_val_cached(MetaCol.SCHEMA, pages_id_b, offset_b)
-        # If latest tail record previously merged into base record
-        if schema_encoding == -1:  
-            schema_encoding = _read_val_cached(MetaCol.SCHEMA, pages_id_i, offset_i)
+                    tail_cols = [[] for _ in range(self.tcols)]
+                    for i in range(start, end):
+                        rid = rids[i]
 
-        # Go through columns while updating schema encoding and data
-        metalen = len(MetaCol)
-        for data_col, val in enumerate(columns):
-            real_col = metalen + data_col
+                        tail_rid = RID.from_params(
+                            pages_id_t, offset_t + i - start, is_base=0, tombstone=0)
+                        self._fill_tail_vals(
+                            rid, tail_rid, columns_list[i], new_vals,
+                            base_entries[rid.get_loc()[0]])
 
-            if val is None:
-                # Get previous value if cumulative
-                val = _read_val_cached(real_col, pages_id_i, offset_i)
-            else:
-                # Update schema by setting appropriate bit to 1
-                schema_encoding |= (1 << data_col)
-
-            new_vals[real_col] = val
+                        for col, val in enumerate(new_vals):
+                            tail_cols[col].append(val)
 
-        # Write both base and new tail record schema encoding
-        new_vals[MetaCol.SCHEMA] = schema_encoding
-        self._overwrite_val(MetaCol.SCHEMA, rid, schema_encoding, pages_b)
+                    pages_t.write_cols(tail_cols)
 
-        pages_t.write_vals(new_vals)
+                    self.table.merge_mgr.note_tail_records(pages_id_t, end - start)
+                finally:
+                    pages_t.latch.release_exclusive()
+            finally:
+                for pages_b in base_entries.values():
+                    pages_b.latch.release_exclusive()
 
-        # pages_t.lock.release()
-        # pages_b.lock.release()
+            start = end
 
     def read(
             self,
@@ -192,30 +351,240 @@ class Bufferpool:
         """
         pages_id, offset = rid.get_loc()
 
-        self._validate_not_deleted(rid, pages_id, offset)
+        # Base record can't change (nor its version chain be cut) while its
+        # version is resolved and read
+        pages_b = self._latch_entry(pages_id, exclusive=False)
+        try:
+            self._validate_not_deleted(rid, pages_id, offset)
+
+            # Cache for performance
+            _read_val_cached = self._read_val
+            _touch_page = self._update_evict_queue
+
+            # Each page read counts as one access (not every value read)
+            _touch_page(pages_id, MetaCol.INDIR)
+            _touch_page(pages_id, MetaCol.SCHEMA)
+
+            # If a column has tail records, get record indices for correct version
+            schema_encoding = _read_val_cached(MetaCol.SCHEMA, pages_id, offset)
+
+            # If schema encoding is -1 (ie latest merged into base), else if updated...
+            if schema_encoding == -1 and rel_version == 0:
+                pages_id, offset = rid.get_loc()
+            elif schema_encoding:
+                pages_id, offset = self._get_versioned_indices(
+                    pages_id, offset, rel_version)
+
+            # Read projected data
+            meta_len = len(MetaCol)
+            columns = []
+            for i in range(meta_len, self.tcols):
+                if proj_col_idx[i - meta_len]:
+                    columns.append(_read_val_cached(i, pages_id, offset))
+                    _touch_page(pages_id, i)
+        finally:
+            pages_b.latch.release_shared()
 
-        # Cache for performance
-        _read_val_cached = self._read_val
+        return Record(self.table.key, columns, rid)
 
-        # If a column has tail records, get record indices for correct version
-        schema_encoding = _read_val_cached(MetaCol.SCHEMA, pages_id, offset)
-        
-        # If schema encoding is -1 (ie latest merged into base), else if updated...
-        if schema_encoding == -1 and rel_version == 0:
-            pages_id, offset = rid.get_loc()
-        elif schema_encoding:
-            pages_id, offset = self._get_versioned_indices(
-                pages_id, offset, rel_version)
+    def read_many(
+            self,
+            rids: list[RID],
+            proj_col_idx: list[Literal[0, 1]],
+            rel_version: int
+    ) -> list[Record]:
+        """
+        Reads many records at once (projected columns only). RIDs are visited
+        grouped by page so every touched page is looked up and pinned once,
+        instead of once per column per record.
+
+        :param rids: Base record RIDs
+        :param proj_col_idx: List of 0s or 1s indicating which columns to return
+        :param rel_version: Relative version to return. 0 is latest, -<n> are prev
 
-        # Read projected data
+        :return: Records of non-deleted RIDs, in the order the RIDs were given
+        """
         meta_len = len(MetaCol)
-        columns = [
-            _read_val_cached(i, pages_id, offset) 
-            for i in range(meta_len, self.tcols) 
-            if proj_col_idx[i - meta_len]
+        proj_cols = [
+            meta_len + data_col
+            for data_col, proj in enumerate(proj_col_idx) if proj
         ]
 
-        return Record(self.table.key, columns, rid)
+        # Pages touched by this batch, pinned until all records are read
+        pinned = {}
+        def get_page(col, pages_id):
+            page = pinned.get((pages_id, col))
+            if page is None:
+                page = self._pin_page(col, pages_id)
+                pinned[(pages_id, col)] = page
+            return page
+
+        tombstone_mask = RID.tombstone_mask
+
+        # Tail pages reached through version chains are kept until done
+        with self.table.merge_mgr.reading():
+            # Base page entry latched while its records' versions are resolved
+            pages_b = None
+
+            try:
+                # Resolve version chains w/ base records visited page by page
+                locs = [None] * len(rids)
+                for i in sorted(range(len(rids)), key=lambda i: rids[i].get_loc()):
+                    pages_id, offset = rids[i].get_loc()
+
+                    if pages_b is None or pages_b.pages_id != pages_id:
+                        if pages_b is not None:
+                            pages_b.latch.release_shared()
+                            pages_b = None
+                        pages_b = self._latch_entry(pages_id, exclusive=False)
+
+                    indir = get_page(MetaCol.INDIR, pages_id).vals[offset]
+                    if indir & tombstone_mask:
+                        continue  # Deleted
+
+                    schema_encoding = get_page(MetaCol.SCHEMA, pages_id).vals[offset]
+
+                    # Same as read: base if merged (latest) or never updated
+                    if schema_encoding and not (schema_encoding == -1 and rel_version == 0):
+                        version = rel_version
+                        while version <= 0:
+                            indir = RID(get_page(MetaCol.INDIR, pages_id).vals[offset])
+
+                            if indir <= 0:
+                                break
+
+                            pages_id, offset = indir.get_loc()
+
+                            if indir.is_base:
+                                break
+
+                            version += 1
+
+                    locs[i] = (pages_id, offset)
+
+                if pages_b is not None:
+                    pages_b.latch.release_shared()
+                    pages_b = None
+
+                # Read projected data w/ records grouped by (tail) page
+                columns = [None] * len(rids)
+                for i in sorted(
+                        (i for i, loc in enumerate(locs) if loc is not None),
+                        key=locs.__getitem__):
+                    pages_id, offset = locs[i]
+                    columns[i] = [
+                        get_page(col, pages_id).vals[offset] for col in proj_cols]
+            finally:
+                if pages_b is not None:
+                    pages_b.latch.release_shared()
+
+                for page in pinned.values():
+                    self._unpin_page(page)
+
+        return [
+            Record(self.table.key, cols, rid)
+            for rid, cols in zip(rids, columns) if cols is not None
+        ]
+
+    def scan_range(
+            self,
+            search_col: int,
+            start_range: int,
+            end_range: int,
+            agg_col: int | None = None,
+            rel_version: int = 0,
+            pages_ids: list[int] | None = None
+    ) -> tuple[int, int]:
+        """
+        Column scan over base pages. Counts live records whose latest value
+        in search_col is within [start_range, end_range] and sums their values
+        in agg_col (at the given version). Only the pages of these columns are
+        read, a page at a time, and tail records are only followed for rows
+        whose schema encoding says one of the columns was updated.
+
+        :param search_col: Data column to filter on
+        :param start_range: Smallest value to include
+        :param end_range: Largest value to include
+        :param agg_col: Data column to sum (None to only count)
+        :param rel_version: Relative version of agg_col values to sum
+        :param pages_ids: Base pages ids to scan, eg the ones holding the keys
+            in range (None -> all)
+
+        :return: Number of matching records and sum of their agg_col values
+        """
+        if pages_ids is None:
+            pages_ids = self._get_base_pages_ids()
+
+        meta_len = len(MetaCol)
+        real_search_col = meta_len + search_col
+        real_agg_col = None if agg_col is None else meta_len + agg_col
+
+        # Base values are stale for rows w/ these schema bits (unless merged)
+        tail_bits = 1 << search_col
+        if agg_col is not None:
+            tail_bits |= 1 << agg_col
+
+        count = total = 0
+        for pages_id in pages_ids:
+            # Copy metadata before getting data pages, so a record marked as
+            # merged is never read from a data page from before the merge
+            pages_b = self._latch_entry(pages_id, exclusive=False)
+            try:
+                num_records = self._get_page(MetaCol.RID, pages_id).offset
+                indirs = _snapshot(self._get_page(MetaCol.INDIR, pages_id).vals[:num_records])
+                schemas = _snapshot(self._get_page(MetaCol.SCHEMA, pages_id).vals[:num_records])
+
+                data_pages = [self._pin_page(real_search_col, pages_id)]
+                if agg_col is not None:
+                    data_pages.append(self._pin_page(real_agg_col, pages_id))
+            finally:
+                pages_b.latch.release_shared()
+
+            if not num_records:
+                for page in data_pages:
+                    self._unpin_page(page)
+                continue
+
+            try:
+                search_vals = data_pages[0].vals[:num_records]
+                agg_vals = None if agg_col is None else data_pages[1].vals[:num_records]
+
+                scan_block = _scan_block if np is None else _scan_block_np
+                block_count, block_total, tail_slots = scan_block(
+                    indirs, schemas, search_vals, agg_vals,
+                    start_range, end_range, tail_bits, rel_version)
+            finally:
+                for page in data_pages:
+                    self._unpin_page(page)
+
+            count += block_count
+            total += block_total
+
+            # Read updated rows through their tail records
+            # (w/o the base latch, so tail pages reached are kept until done)
+            with self.table.merge_mgr.reading():
+                for offset in tail_slots:
+                    schema_encoding = schemas[offset]
+
+                    # Latest version is in the base record if merged
+                    if schema_encoding == -1:
+                        latest_loc = (pages_id, offset)
+                    else:
+                        latest_loc = self._get_versioned_indices(pages_id, offset, 0)
+
+                    if not start_range <= self._read_val(real_search_col, *latest_loc) <= end_range:
+                        continue
+
+                    count += 1
+                    if agg_col is not None:
+                        if rel_version:
+                            agg_loc = self._get_versioned_indices(pages_id, offset, rel_version)
+                        else:
+                            agg_loc = latest_loc
+
+                        total += self._read_val(real_agg_col, *agg_loc)
+
+        return count, total
 
     def restore(self, rid: RID):
         """
@@ -225,25 +594,98 @@ class Bufferpool:
         try:
             pages_id, offset = rid.get_loc()
 
-            tail_rid = RID(self._read_val(MetaCol.INDIR, pages_id, offset))
-            pages_id_prev, offset_prev = tail_rid.get_loc()
-            
-            prev_rid = self._read_val(MetaCol.INDIR, pages_id_prev, offset_prev)
+            pages_b = self._latch_entry(pages_id)
+            try:
+                tail_rid = RID(self._read_val(MetaCol.INDIR, pages_id, offset))
+                pages_id_prev, offset_prev = tail_rid.get_loc()
+
+                prev_rid = self._read_val(MetaCol.INDIR, pages_id_prev, offset_prev)
 
-            self._overwrite_val(MetaCol.INDIR, rid, prev_rid)
+                self._overwrite_val(MetaCol.INDIR, rid, prev_rid, pages_b)
+            finally:
+                pages_b.latch.release_exclusive()
 
             if config.DEBUG_PRINT:
                 print(f"Record {rid} restored successfully.")
         except Exception as e:
             print(f"Error restoring record {rid}: {e}")
 
+    @contextmanager
+    def scan_hint(self):
+        """
+        Marks the calling thread's page accesses as part of a sequential scan
+        until exited. Pages the scan reads from disk cycle through a small ring
+        instead of the main cache, and cached pages it reads aren't promoted.
+        """
+        was_scanning = getattr(_scan_hints, "scanning", False)
+        _scan_hints.scanning = True
+        try:
+            yield
+        finally:
+            _scan_hints.scanning = was_scanning
+
     def flush_to_disk(self):
         """Flushes all pages in bufferpool's page table to the disk."""
-        for pages_id in self.page_table:
-            pages = self.page_table.get_entry(pages_id)
+        self.write_dirty_pages()
 
-            for col in range(self.tcols):
-                self._flush_page_to_disk(pages[col], pages_id, col)
+    def write_dirty_pages(self, limit: int = None, skip_latest: bool = False) -> tuple[int, int, bool]:
+        """
+        Writes dirty pages to disk in one batch (sorted and coalesced by the
+        disk) and marks them as clean. Pages stay in memory.
+
+        Base pages are copied before tail pages and written after them, so
+        base indirections on disk never point to tail records that aren't.
+        Pages changed by running transactions are left dirty, along w/ base
+        indirections then (they may point to tail records in those pages).
+
+        :param limit: Maximum number of base pages to write (None -> all).
+            Dirty tail pages are always written
+        :param skip_latest: Whether to skip the pages of the latest base
+            entry, which is still being filled (and dirtied again)
+
+        :return: Number of pages written, of writes issued and whether dirty
+            pages were left for running transactions
+        """
+        with self.flush_lock:
+            skipped = set()
+            if skip_latest:
+                with self.page_table.lock:
+                    if self.base_trackers:
+                        skipped.add(next(reversed(self.base_trackers)))
+
+            base_entries, tail_entries = [], []
+            try:
+                base_entries = self._pin_dirty_pages(0, limit, skipped)
+                base_blocks, bases_left = self._copy_dirty_pages(base_entries)
+
+                tail_entries = self._pin_dirty_pages(1)
+                tail_blocks, tails_left = self._copy_dirty_pages(tail_entries)
+
+                if tails_left:
+                    base_blocks = [block for block in base_blocks if block[1] != MetaCol.INDIR]
+                    for _, dirty in base_entries:
+                        for col, page in dirty:
+                            if col == MetaCol.INDIR:
+                                page.is_dirty = True
+
+                num_writes = self.table.disk.write_pages(tail_blocks)
+                num_writes += self.table.disk.write_pages(base_blocks)
+            finally:
+                for _, dirty in base_entries + tail_entries:
+                    for _, page in dirty:
+                        self._unpin_page(page)
+
+        return len(base_blocks) + len(tail_blocks), num_writes, bases_left or tails_left
+
+    def get_dirty_pages(self) -> list[tuple[int, int]]:
+        """Gets the (pages id, col) of pages in memory that are dirty."""
+        with self.page_table.lock:
+            return [
+                (pages_id, col)
+                for pages_id, pages in self.page_table.ptable.items()
+                for col, page in enumerate(pages.pages)
+                if page is not None and page.is_dirty
+            ]
 
     # Helpers ------------------------
 
@@ -259,25 +701,212 @@ class Bufferpool:
         if pages is None:
             pages, pages_id = self.page_table.create_pages(is_base)
             page_tracker[pages_id] = None  # Value doesn't matter, used as ordered set
+
+            self.table.page_writer.start()
         elif not pages.has_capacity():
+            full_pages_id = pages_id
             pages, pages_id = self.page_table.create_pages(is_base)
 
             # Add full pages to the evict queue
             if self.max_buffer_size:
                 for col in range(self.tcols):
-                    self.evict_queue[(pages_id, col)] = None
-                    self.evict_queue.move_to_end((pages_id, col), last=self.use_lru)
-                    self._evict_pages()
+                    self._add_to_evict_queue(full_pages_id, col, scanning=False)
+                    self.evict_queue.touch((full_pages_id, col))
 
             page_tracker[pages_id] = None  # Value doesn't matter, used as ordered set
 
         return pages
     
+    def _latch_latest_entry(self, is_base) -> PageTableEntry:
+        """
+        Gets the latest base/tail page entry w/ room for a record and latches
+        it exclusively (retries if it filled up or was dropped meanwhile).
+        """
+        while True:
+            with self.page_table.lock:
+                pages = self._get_latest_page_entry(is_base)
+
+            pages.latch.acquire_exclusive()
+            if pages.has_capacity() and pages is self.page_table.get_entry(pages.pages_id):
+                self._hold_uncommitted(pages.pages_id)
+                return pages
+
+            pages.latch.release_exclusive()
+
+    def _latch_entry(self, pages_id, exclusive=True) -> PageTableEntry:
+        """
+        Gets a page entry (create empty one if needed) and latches it, shared
+        for reads or exclusive for writes.
+        """
+        while True:
+            with self.page_table.lock:
+                pages = self.page_table.get_entry(pages_id)
+                if pages is None:
+                    pages = self.page_table.init_pages(pages_id)
+
+            if exclusive:
+                pages.latch.acquire_exclusive()
+            else:
+                pages.latch.acquire_shared()
+
+            # Entry may have been dropped (all pages evicted) before latching
+            if pages is self.page_table.get_entry(pages_id):
+                if exclusive:
+                    self._hold_uncommitted(pages_id)
+                return pages
+
+            if exclusive:
+                pages.latch.release_exclusive()
+            else:
+                pages.latch.release_shared()
+
+    def _hold_uncommitted(self, pages_id: int):
+        """
+        Marks pages latched for writing by a transaction as changed by it
+        until it ends (in its held locks), so they aren't written meanwhile.
+        """
+        thread_local = ThreadLocalSingleton.get_instance()
+        if thread_local.transaction is None:
+            return
+
+        key = (self, pages_id)
+        if key in thread_local.held_locks:
+            return
+
+        with self.uncommitted_lock:
+            self.uncommitted[pages_id] = self.uncommitted.get(pages_id, 0) + 1
+        thread_local.held_locks[key] = _HeldPages(self, pages_id)
+
+    def _release_uncommitted(self, pages_id: int):
+        with self.uncommitted_lock:
+            self.uncommitted[pages_id] -= 1
+            if not self.uncommitted[pages_id]:
+                del self.uncommitted[pages_id]
+
+        ThreadLocalSingleton.get_instance().held_locks.pop((self, pages_id), None)
+
+    def _pin_page(self, col: int, pages_id: int) -> Page:
+        """
+        Gets a page and pins it, so it's never evicted or freed until unpinned.
+        Counts as one access to the page.
+        """
+        with self.page_table.lock:
+            page = self._get_page(col, pages_id)
+            page.pin_count += 1
+
+            self._update_evict_queue(pages_id, col)
+
+        return page
+
+    def _unpin_page(self, page: Page):
+        with self.page_table.lock:
+            page.pin_count -= 1
+
+    def _fill_tail_vals(
+            self,
+            rid: RID,
+            tail_rid: RID,
+            columns: tuple[int | None],
+            new_vals: list,
+            pages_b: PageTableEntry = None
+    ) -> list:
+        """
+        Fills new_vals w/ the new tail record of a base record (cumulative
+        data, previous tail as indirection and updated schema encoding) and
+        points the base record to the new tail. Callers hold the latch of the
+        base record's pages exclusively (the merge marks records under it).
+        """
+        pages_id_b, offset_b = rid.get_loc()
+
+        # Cache for performance
+        _read_val_cached = self._read_val
+
+        # Indirection -----------------
+
+        # Set new tail indir to prev tail rid and base indir to new rid
+        indir_rid = RID(_read_val_cached(MetaCol.INDIR, pages_id_b, offset_b))
+        new_vals[MetaCol.INDIR] = int(indir_rid)
+        self._overwrite_val(MetaCol.INDIR, rid, int(tail_rid), pages_b)
+
+        # RID ----------- -------------
+
+        new_vals[MetaCol.RID] = int(tail_rid)
+        new_vals[MetaCol.BASE_RID] = int(rid)
+
+        # Schema encoding & data ------
+
+        # Get record indices for previous tail record
+        pages_id_i, offset_i = indir_rid.get_loc()
+
+        # Get latest schema encoding (go to latest tail if recently merged)
+        schema_encoding = _read_val_cached(MetaCol.SCHEMA, pages_id_b, offset_b)
+        # If latest tail record previously merged into base record
+        if schema_encoding == -1:  
+            schema_encoding = _read_val_cached(MetaCol.SCHEMA, pages_id_i, offset_i)
+
+        # Go through columns while updating schema encoding and data
+        metalen = len(MetaCol)
+        for data_col, val in enumerate(columns):
+            real_col = metalen + data_col
+
+            if val is None:
+                # Get previous value if cumulative
+                val = _read_val_cached(real_col, pages_id_i, offset_i)
+            else:
+                # Update schema by setting appropriate bit to 1
+                schema_encoding |= (1 << data_col)
+
+            new_vals[real_col] = val
+
+        # Write both base and new tail record schema encoding
+        new_vals[MetaCol.SCHEMA] = schema_encoding
+        self._overwrite_val(MetaCol.SCHEMA, rid, schema_encoding, pages_b)
+
+        return new_vals
+
+    def _write_tail_copies(self, rids: list[RID]):
+        """
+        Writes copies of base records as their first tail records (a page at a
+        time) and points the base records to them. Callers hold the latches
+        of the base records' pages.
+        """
+        start = 0
+        while start < len(rids):
+            pages_t = self._latch_latest_entry(False)
+            try:
+                pages_id_t, offset_t = pages_t.get_loc()
+                chunk = rids[start:start + PageTableEntry.capacity - offset_t]
+
+                tail_rids = []
+                tail_cols = [[] for _ in range(self.tcols)]
+                for i, rid in enumerate(chunk):
+                    pages_id_b, offset_b = rid.get_loc()
+                    tail_rid = RID.from_params(pages_id_t, offset_t + i, is_base=0, tombstone=0)
+                    tail_rids.append(tail_rid)
+
+                    for col in range(self.tcols):
+                        tail_cols[col].append(self._read_val(col, pages_id_b, offset_b))
+
+                    tail_cols[MetaCol.INDIR][-1] = 0
+                    tail_cols[MetaCol.RID][-1] = int(tail_rid)
+
+                # Write tails before linking them so readers never see empty slots
+                pages_t.write_cols(tail_cols)
+
+                self.table.merge_mgr.note_tail_records(pages_id_t, len(chunk))
+            finally:
+                pages_t.latch.release_exclusive()
+
+            for rid, tail_rid in zip(chunk, tail_rids):
+                self._overwrite_val(MetaCol.INDIR, rid, int(tail_rid))
+
+            start += len(chunk)
+
     def _overwrite_val(self, col: int, rid, val: int, pages: PageTableEntry = None):
         pages_id, offset = rid.get_loc()
 
-        # Get page entry if not given (create empty one if needed)
-        if pages is None:
+        # Get page entry if not given or evicted since (create empty one if needed)
+        if pages is None or pages is not self.page_table.get_entry(pages_id):
             pages = self.page_table.get_entry(pages_id)
             if pages is None:
                 pages = self.page_table.init_pages(pages_id)
@@ -289,16 +918,24 @@ class Bufferpool:
         
         pages.offset = page.offset
 
-        self._update_evict_queue(pages_id, col)
-
+        # Write before the page may be evicted (and flushed)
         page.update(val, offset)
         page.is_dirty = True
 
+        self._update_evict_queue(pages_id, col)
+
     def _read_val(self, col: int, pages_id: int, offset: int):
         """
         Reads a value from a page given a column (including metadata cols)
         and a page id/offset.
         """
+        return self._get_page(col, pages_id).read(offset)
+
+    def _get_page(self, col: int, pages_id: int) -> Page:
+        """
+        Gets a page given a column (including metadata cols) and a page id.
+        Not counted as an access, readers touch the pages of a record once.
+        """
         # Get page entry (create empty one if needed)
         pages = self.page_table.get_entry(pages_id)
         if pages is None:
@@ -311,9 +948,63 @@ class Bufferpool:
 
         pages.offset = page.offset
 
-        self._update_evict_queue(pages_id, col)
+        return page
+
+    def _swap_pages(self, pages_id: int, pages: dict[int, Page]):
+        """
+        Swaps new versions of pages (col -> page) of a page entry in (ie
+        merged base pages), without writing them or the old ones to disk.
+        """
+        with self.page_table.lock:
+            entry = self.page_table.get_entry(pages_id)
+            if entry is None:
+                entry = self.page_table.init_pages(pages_id)
+
+            new_cols = [col for col in pages if entry[col] is None]
+
+            entry.swap_pages(pages)
+
+            for col in new_cols:
+                self._add_to_evict_queue(pages_id, col)
+
+    def _free_pages(self, pages_id: int) -> int | None:
+        """
+        Drops a set of pages that's no longer needed (ie unreachable tail
+        pages) from memory, without flushing it, and from disk.
+
+        Returns the number of bytes freed on disk, or None if a page is pinned.
+        """
+        with self.page_table.lock:
+            entry = self.page_table.get_entry(pages_id)
+            if entry is not None:
+                if any(page is not None and page.pin_count for page in entry.pages):
+                    return None
+
+                self.page_table.remove_entry(pages_id)
+                with self.evict_queue_lock:
+                    for col in range(self.tcols):
+                        key = (pages_id, col)
+                        if key in self.evict_queue:
+                            self.evict_queue.remove(key)
+                        elif self.scan_ring.pop(key, False) is not None:
+                            continue
+
+                        self.buffer_used -= self.page_costs[col]
+
+            self.tail_trackers.pop(pages_id, None)
+
+        return self.table.disk.free_page(pages_id)
+
+    def _get_base_pages_ids(self) -> list[int]:
+        """
+        Gets ids of all base pages, whether on disk or only in memory.
+        """
+        with self.page_table.lock:
+            pages_ids = {pages_id for pages_id in self.page_table if pages_id % 2 == 0}
 
-        return page.read(offset)
+        pages_ids.update(self.table.disk.get_pages_ids(is_base=True))
+
+        return sorted(pages_ids)
         
     def _get_page_from_disk(self, pages: PageTableEntry, pages_id: int, col: int):
         """
@@ -329,17 +1020,45 @@ class Bufferpool:
 
         return page
         
-    def _add_to_evict_queue(self, pages_id, col):
-        if self.max_buffer_size:
-            self.evict_queue[(pages_id, col)] = None
+    def _add_to_evict_queue(self, pages_id, col, scanning=None):
+        """
+        Starts tracking a page brought into memory (in the scan ring if read
+        by a scan) and evicts a batch of pages if that's over budget.
+        """
+        if not self.max_buffer_size:
+            return
+
+        if scanning is None:
+            scanning = _is_scanning()
+
+        key = (pages_id, col)
+        with self.evict_queue_lock:
+            if key in self.evict_queue or key in self.scan_ring:
+                return
+
+            if self.scan_ring_size and scanning:
+                self.scan_ring[key] = None
+            else:
+                self.evict_queue.add(key)
+
+            self.buffer_used += self.page_costs[col]
+
+        # Admissions are the only time the pool grows, so the only time to evict
+        if self.buffer_used > self.max_buffer_size or len(self.scan_ring) > self.scan_ring_size:
+            self._evict_pages()
 
     def _update_evict_queue(self, pages_id, col):
-        if self.max_buffer_size:
-            try:
-                self.evict_queue.move_to_end((pages_id, col), last=self.use_lru)
-                self._evict_pages()
-            except KeyError:
-                pass
+        """Records an access to a page (once per page read, never evicts)."""
+        if self.max_buffer_size and not _is_scanning():
+            key = (pages_id, col)
+
+            if key in self.scan_ring:
+                # Pages brought in by a scan join the cache once used otherwise
+                with self.evict_queue_lock:
+                    if self.scan_ring.pop(key, False) is None:
+                        self.evict_queue.add(key)
+            else:
+                self.evict_queue.touch(key)
 
     def _get_versioned_indices(self, pages_id, offset, rel_version):
         """
@@ -351,11 +1070,15 @@ class Bufferpool:
             # Get previous tail record (or base record). base.indir == base.rid!
             indir = RID(self._read_val(MetaCol.INDIR, pages_id, offset))
 
-            if indir <= 0 or indir.is_base:
+            if indir <= 0:
                 break
 
             pages_id, offset = indir.get_loc()
 
+            # Oldest version is the base record itself if it has no tail copy
+            if indir.is_base:
+                break
+
             rel_version += 1
 
         return pages_id, offset
@@ -365,29 +1088,243 @@ class Bufferpool:
             raise KeyError(f"Record {int(rid)} was deleted")
 
     def _evict_pages(self):
-        if self.max_buffer_size:
-            while len(self.evict_queue) > self.max_buffer_size:
-                self._evict_latest_page()
+        if not self.max_buffer_size:
+            return
+
+        # Another thread is evicting already, the pool catches up after it
+        if not self.evict_lock.acquire(blocking=False):
+            return
+
+        try:
+            # Pages in use are put back and the pool stays over capacity until
+            # they're released (each page is tried at most once per call)
+            attempts = len(self.evict_queue) + len(self.scan_ring)
+            skipped, skipped_ring = [], []
+
+            # Scans recycle their own ring before touching the cache
+            while len(self.scan_ring) > self.scan_ring_size and attempts:
+                attempts -= 1
+                with self.evict_queue_lock:
+                    key = self.scan_ring.popitem(last=False)[0]
+                self._evict_victim(key, skipped_ring)
+
+            # Over budget, evict a batch at once so victims are only picked
+            # every so many admissions
+            if self.buffer_used > self.max_buffer_size:
+                while self.buffer_used > self.evict_target and attempts:
+                    attempts -= 1
+                    with self.evict_queue_lock:
+                        if self.evict_queue:
+                            key, skipped_to = self.evict_queue.evict(), skipped
+                        elif self.scan_ring:
+                            key, skipped_to = self.scan_ring.popitem(last=False)[0], skipped_ring
+                        else:
+                            break
+                    self._evict_victim(key, skipped_to)
+
+            with self.evict_queue_lock:
+                for key in skipped_ring:
+                    self.scan_ring[key] = None
+
+                for key in skipped:
+                    self.evict_queue.add(key)
+                    self.evict_queue.touch(key)
+        finally:
+            self.evict_lock.release()
+
+    def _evict_victim(self, key, skipped: list):
+        """Evicts a page no longer tracked, or adds it to skipped if in use."""
+        if self._evict_page(key):
+            with self.evict_queue_lock:
+                self.buffer_used -= self.page_costs[key[1]]
+        else:
+            skipped.append(key)
+
+    def _evict_page(self, key) -> bool:
+        """
+        Evicts a page unless it's pinned or its entry is latched.
 
-    def _evict_latest_page(self):
-        # Remove location of page to evict from queue
-        pages_id, col = self.evict_queue.popitem(last=False)[0]
+        Returns whether the page is out of memory.
+        """
+        pages_id, col = key
 
         pages = self.page_table.get_entry(pages_id)
-        
+        if pages is None or pages[col] is None:
+            return True  # Already dropped along w/ its entry
+
         page = pages[col]
+        if not pages.latch.try_acquire_exclusive():
+            return False
+
+        try:
+            # Checked w/ the latch held (the background writer latches pages
+            # it pinned before copying them)
+            if page.pin_count:
+                return False
+
+            # Uncommitted changes stay in memory
+            if page.is_dirty and pages_id in self.uncommitted:
+                return False
+
+            # Base indirections are left to the background writer, which
+            # writes the tail records they point to first
+            if (page.is_dirty and col == MetaCol.INDIR and not pages_id % 2
+                    and self.table.page_writer.is_running()):
+                return False
+
+            is_entry_empty = self.page_table.remove_page(pages_id, col)
 
-        is_entry_empty = self.page_table.remove_page(pages_id, col)
+            # Also remove page from head/page trackers
+            if is_entry_empty:
+                tracker = self.tail_trackers if pages_id % 2 else self.base_trackers
+                tracker.pop(pages_id, None)
 
-        # Also remove page from head/page trackers
-        if is_entry_empty:
-            tracker = self.tail_trackers if pages_id % 2 else self.base_trackers
-            tracker.pop(pages_id, None)
+            # Write to disk (will check if dirty)
+            self._flush_page_to_disk(page, pages_id, col)
+        finally:
+            pages.latch.release_exclusive()
 
-        # Write to disk (will check if dirty)
-        self._flush_page_to_disk(page, pages_id, col)
+        return True
+
+    def _pin_dirty_pages(self, is_tail: int, limit: int = None, skipped=()) -> list:
+        """
+        Pins the dirty pages of base/tail entries so they're neither evicted
+        nor freed until written. Returns [(entry, [(col, page)])].
+        """
+        with self.page_table.lock:
+            entries = []
+            num_pages = 0
+            for pages_id, pages in self.page_table.ptable.items():
+                if pages_id % 2 != is_tail or pages_id in skipped:
+                    continue
+
+                dirty = [
+                    (col, page) for col, page in enumerate(pages.pages)
+                    if page is not None and page.is_dirty
+                ]
+                if limit is not None:
+                    dirty = dirty[:limit - num_pages]
+                if not dirty:
+                    continue
+
+                for _, page in dirty:
+                    page.pin_count += 1
+
+                entries.append((pages, dirty))
+                num_pages += len(dirty)
+                if limit is not None and num_pages >= limit:
+                    break
+
+        return entries
+
+    def _copy_dirty_pages(self, entries: list) -> tuple[list[tuple[int, int, bytes]], bool]:
+        """
+        Copies pinned pages w/ their entry latched so records aren't torn.
+        Flags are cleared first, later writes dirty the page again. Pages
+        changed by running transactions are left dirty.
+
+        Returns the copies as (pages id, col, data) and whether pages were left.
+        """
+        blocks = []
+        left = False
+        for pages, dirty in entries:
+            with pages.latch.shared():
+                if pages.pages_id in self.uncommitted:
+                    left = True
+                    continue
+
+                for col, page in dirty:
+                    if not page.is_dirty:
+                        continue  # Written on eviction meanwhile
+
+                    page.is_dirty = False
+                    blocks.append((pages.pages_id, col, bytes(page.data)))
+
+        return blocks, left
 
     def _flush_page_to_disk(self, page, pages_id, col):
-        """Currently writes page to disk."""
+        """Writes page to disk if dirty and marks it as clean."""
         if page is not None and page.is_dirty:
+            page.is_dirty = False
             self.table.disk.add_page(page, pages_id, col)
+
+
+class _HeldPages:
+    """
+    Handle of pages changed by the calling thread's transaction (kept in its
+    held locks until it ends, like record locks).
+    """
+    __slots__ = ("bufferpool", "pages_id")
+
+    def __init__(self, bufferpool, pages_id):
+        self.bufferpool = bufferpool
+        self.pages_id = pages_id
+
+    def release(self):
+        self.bufferpool._release_uncommitted(self.pages_id)
+
+
+def _is_scanning() -> bool:
+    return getattr(_scan_hints, "scanning", False)
+
+
+# Scan kernels -------------------
+
+def _snapshot(vals: memoryview) -> memoryview:
+    """Copy of typed page values (w/ the same format)."""
+    return memoryview(bytearray(vals)).cast(vals.format)
+
+
+def _scan_block(indirs, schemas, search_vals, agg_vals,
+                start_range, end_range, tail_bits, rel_version):
+    """
+    Scans the base records of a set of pages. Counts and sums (agg_vals) live
+    records whose search value is in range, and returns the slots of live
+    records that need their values read from tail records instead.
+    """
+    tombstone_mask = RID.tombstone_mask
+
+    count = total = 0
+    tail_slots = []
+    for offset, search_val in enumerate(search_vals):
+        if indirs[offset] & tombstone_mask:
+            continue
+
+        schema_encoding = schemas[offset]
+        if schema_encoding and (rel_version or (
+                schema_encoding != -1 and schema_encoding & tail_bits)):
+            tail_slots.append(offset)
+        elif start_range <= search_val <= end_range:
+            count += 1
+            if agg_vals is not None:
+                total += agg_vals[offset]
+
+    return count, total, tail_slots
+
+
+def _scan_block_np(indirs, schemas, search_vals, agg_vals,
+                   start_range, end_range, tail_bits, rel_version):
+    """
+    Same as _scan_block, vectorized over the whole block w/ NumPy.
+    """
+    indirs = np.frombuffer(indirs, dtype=np.int64)
+    schemas = np.frombuffer(schemas, dtype=schemas.format)
+    search_vals = np.frombuffer(search_vals, dtype=search_vals.format)
+
+    is_live = (indirs & RID.tombstone_mask) == 0
+
+    if rel_version:
+        needs_tail = schemas != 0
+    else:
+        needs_tail = (schemas != -1) & ((schemas & tail_bits) != 0)
+
+    matches = is_live & ~needs_tail & \
+        (search_vals >= start_range) & (search_vals <= end_range)
+
+    count = int(np.count_nonzero(matches))
+    total = 0
+    if agg_vals is not None and count:
+        agg_vals = np.frombuffer(agg_vals, dtype=agg_vals.format)
+        total = int(agg_vals[matches].sum(dtype=np.int64))
+
+    return count, total, np.flatnonzero(is_live & needs_tail).tolist()
@@ -1,284 +1,436 @@
 """
-Steps to the Merge Algorithm as we're implementing it:
-1. Get a batch of base pages could be from disk or buffer (buffer is probably faster)
-2. Get corresponding tail pages for the base RIDs. 
-3. Consolidate base records with updated tail records
-4. Put updated pages on disk in temp folder
-5. Swap out the disk's old base pages with new base pages
-
-# Stupid/simple questions:
-- How do we set up a "background thread" to run the merge manager?
-    - Do we use conncurrent.futures?
-- Also, how can I make the page directory modifacation work in the foreground?
-
-
-# Less stupid questions:
-- Granularity of the merge operation: 
-    - Easiest approach seems coarser-grained and less frequent merges?
-    - Is this a question of how many committed tail records we fetch in each batch??
-
+Merges the latest tail records of updated base records back into their base
+pages, so reads of the latest version don't have to follow indirections.
+
+The merge runs incrementally in a long-lived background thread:
+1. Tail writes note which tail pages have records that weren't merged yet, in
+   the order they were written.
+2. Every round, the oldest few of those tail pages are read sequentially,
+   newest record to oldest, and each page once. The first tail record seen of
+   a base record (via its base RID column) is its latest in the range, older
+   ones are skipped. Merge cost is thus proportional to the tail volume.
+3. The latest data of each base record is written to new versions of its base
+   data pages, which are swapped into the page directory at once (readers
+   still using the old versions are unaffected, and they are freed once
+   unused). The records are then marked as merged (schema encoding of -1).
+   Records updated again since (ie whose latest tail record is in a later
+   range) are left for a later round, and ones w/ uncommitted updates (write
+   locked by a transaction) are left unmerged.
+4. If config.MERGE_KEEP_VERSIONS is set, the chain of tail records of each
+   merged record is cut after that many versions (older versions read as the
+   oldest one kept). Chains are cut w/ the base record latched, and tail
+   pages whose records are all cut off are freed once every reader that
+   started before the cut is done (reader epochs), and their disk slots are
+   reused.
+5. Rounds are spaced out and the thread sleeps in proportion to the time it
+   spends merging, so foreground operations are never blocked on a merge.
 """
-from collections import defaultdict
 
-import os
-import shutil
+import threading
+import time
+
+from contextlib import contextmanager
 
 from lstore import config
 
 from lstore.page import Page
-from lstore.storage.disk import Disk
-from lstore.storage.rid import RID
 
-from lstore.storage.buffer.page_table import PageTable
+from lstore.storage.rid import RID
 
 from lstore.storage.meta_col import MetaCol
 
 class MergeManager:
     """
-    Returns a new consolidated set of read only base pages.
+    Background merge of tail records into base pages.
 
+    :param table: Reference to parent table
     """
     def __init__(self, table):
         self.table = table
 
         self.tcols = table.num_total_cols
 
-        #self.all_tail_page_ids = self.get_all_tail_page_ids()
-
-    def merge(self):
+        # Tail pages id -> [records merged, records written] (in write order)
+        self.tail_pages = dict()
+        self.num_pending = 0
+        self.lock = threading.Lock()
+
+        # Tail pages id -> records cut off from all version chains, and pages
+        # w/ only such records as (pages id, epoch they were cut off in)
+        self.dead = dict()
+        self._freeable = []
+
+        # Reader epochs: epoch -> number of readers following version chains
+        # that started in it. Pages cut off in an epoch are freed once no
+        # reader of that epoch or an earlier one is left
+        self.epoch = 0
+        self._readers = dict()
+        self._epoch_lock = threading.Lock()
+
+        # Space reclaim statistics
+        self.stats = {
+            "merged_records": 0,
+            "dead_tail_records": 0,
+            "freed_tail_pages": 0,
+            "freed_bytes": 0,
+        }
+
+        # Background worker (started on the first tail write)
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopping = False
+
+    def note_tail_records(self, pages_id: int, count: int = 1):
         """
-        Iterates the merge operation for a given batch size.
-        """
-        # Get all base page ids IN MEMORY
-        base_page_ids = self._get_base_page_ids()
+        Records that tail records were written to a tail page. Wakes the merge
+        right away if enough tail records are pending.
 
-        batch_size = config.MERGE_BATCH_SIZE
+        :param pages_id: Tail pages id
+        :param count: Number of new tail records
+        """
+        with self.lock:
+            self.tail_pages.setdefault(pages_id, [0, 0])[1] += count
+            self.num_pending += count
 
-        # base_paths = self._get_page_paths(mem_base_ids)
+            if self._thread is None and not self._stopping:
+                self._start()
 
-        for i in range(0, len(base_page_ids), batch_size):
-            # base_page_paths = self._get_batch_paths(
-            #     mem_base_ids, start=i, batch_size=batch_size)
-            # batch_paths = base_paths[i:i + batch_size]
-            batch_ids = base_page_ids[i:i + batch_size]
+        if self.num_pending >= config.MERGE_UPDATE_THRESHOLD:
+            self._wake.set()
 
-            # Load the base records and corresponding tail records
-            base_data: list[tuple[int]] = self._find_base_records(batch_ids)
-            updated_tails = self._find_latest_tail_records(base_data)
+    def request_merge(self):
+        """Wakes the background merge without waiting for it."""
+        self._wake.set()
 
-            # Merge the records (overwrites values in base data)
-            self._merge_records(base_data, updated_tails)
+    def stop(self):
+        """Stops the background merge, waiting for the current round to finish."""
+        with self.lock:
+            self._stopping = True
+            thread = self._thread
 
-            # Write all updated base pages as temp files
-            self._write_temp_to_disk(base_data)
+        self._wake.set()
+        if thread is not None:
+            thread.join()
 
-    def finalize_merge(self, merge_future):
-        page_path = os.path.join(self.table.db_path, "pages/")
-        temp_path = os.path.join(page_path, "temp/")
+        with self.lock:
+            self._thread = None
+            self._stopping = False
 
-        for filename in os.listdir(temp_path):
-            source = os.path.join(temp_path, filename)
-            dest = os.path.join(page_path, filename)
+    def merge(self):
+        """Merges all pending tail records in the foreground."""
+        while ranges := self._pick_ranges(config.MERGE_BATCH_SIZE):
+            self._merge_ranges(ranges)
 
-            shutil.move(source, dest)
+        self._free_tail_pages()
 
-    # Helpers ------------------
+    def get_stats(self) -> dict[str, int]:
+        """Gets merge and space reclaim statistics."""
+        with self.lock:
+            return dict(self.stats)
 
-    def _get_base_page_ids(self):
+    @contextmanager
+    def reading(self):
         """
-        Gets list of all base page ids IN MEMORY.
-
-        Inputs: The page table
-        Returns: A list of all the base page IDs
+        Registers the calling thread as a reader of tail records until exited,
+        so tail pages it may reach through version chains aren't freed under
+        it (readers holding the base record's latch don't need this).
         """
-        page_table = self.table.buffer.bufferpool.page_table
-
-        return [page_id for page_id in page_table if page_id % 2 == 0]
-    
-    def _get_page_paths(self, page_ids):
-        paths = []
+        with self._epoch_lock:
+            epoch = self.epoch
+            self._readers[epoch] = self._readers.get(epoch, 0) + 1
+
+        try:
+            yield
+        finally:
+            with self._epoch_lock:
+                self._readers[epoch] -= 1
+                if not self._readers[epoch]:
+                    del self._readers[epoch]
 
-        for page_id in page_ids:
-            for col in range(self.table.num_total_cols):
-                filename = f"base_{page_id}_{col}.bin"
-                filepath = os.path.join(self.table.db_path, "pages/", filename)
-                paths.append(filepath)
+    # Helpers ------------------
 
-        return paths
+    def _start(self):
+        self._thread = threading.Thread(
+            target=self._run, name=f"merge-{self.table.name}", daemon=True)
+        self._thread.start()
 
-    def _find_base_records(self, page_ids: list[int]) -> list[list[int]]:
+    def _run(self):
         """
-        Inputs: A list of paths to all the base pages in the batch/subset 
-        Returns: A list of tuples with all of the base records. 
+        Merges the oldest pending tail pages a few at a time, until stopped.
         """
-        page_table: PageTable = self.table.buffer.bufferpool.page_table
-        disk: Disk = self.table.disk
-        tcols = self.tcols
+        while not self._stopping:
+            self._wake.wait(config.MERGE_INTERVAL)
+            self._wake.clear()
 
-        base_data = []
+            ranges = self._pick_ranges(config.MERGE_BATCH_SIZE)
+            if not ranges:
+                continue
 
-        for page_id in page_ids:
-            # Get all pages associated with page id
-            pages = page_table.get_entry(page_id)
-            with pages:
-                for col in range(tcols):
-                    if pages[col] is None:
-                        pages[col] = disk.get_page(page_id, col)
+            start = time.perf_counter()
+            try:
+                self._merge_ranges(ranges)
+            except Exception as e:
+                if config.PRINT_ERRORS:
+                    print(f"Error merging tail pages {[r[0] for r in ranges]}: {e}")
 
-            # Get all rids in page
-            rid_page = pages[MetaCol.RID]
-            rids = [RID(rid) for rid in rid_page]
+            # Stay within the CPU budget
+            busy = time.perf_counter() - start
+            time.sleep(busy * (1 - config.MERGE_CPU_SHARE) / config.MERGE_CPU_SHARE)
 
-            # Get all data for each rid associated with page id
-            for rid in rids:
-                _, offset = rid.get_loc()
+    def _pick_ranges(self, count: int) -> list[tuple[int, int, int]]:
+        """
+        Claims the pending records of the oldest tail pages w/ any, as
+        (pages_id, start offset, end offset) ranges (oldest first).
+        """
+        ranges = []
+        with self.lock:
+            for pages_id, counts in list(self.tail_pages.items()):
+                merged, written = counts
+                if merged < written:
+                    ranges.append((pages_id, merged, written))
+                    counts[0] = written
 
-                base_tuple = [page.read(offset) for page in pages]
+                # Full pages are never written to again
+                if written >= Page.capacity:
+                    del self.tail_pages[pages_id]
 
-                base_data.append(base_tuple)
+                if len(ranges) >= count:
+                    break
 
-        return base_data
+        return ranges
 
-    def _find_latest_tail_records(self, base_data: list[list[int]]) -> dict[RID, list[int]]:
+    def _merge_ranges(self, ranges: list[tuple[int, int, int]]):
         """
-        Inputs: A list of base records (as tuples?)
-        Returns: The most up-to-date tail record (on disk) for each base record's RID
+        Merges the latest tail records of the given tail page ranges (oldest
+        first) into their base pages.
         """
-        def _get_tail_tuple():
-            tail_tuple = []
-            # Fetch the page for every column in the table
-            for col in range(tcols):
-                page = temp_table[page_id][col]
-                # Check if page is already in memory
-                if page is None:
-                    try: # If not, fetch it from disk
-                        page = disk.get_page(page_id, col)
-                        temp_table[page_id][col] = page
-                    except FileNotFoundError:
-                        return None
-
-                tail_tuple.append(page.read(offset))
-            # Tuple with all columns for a given tail RID
-            return tail_tuple
-
-        disk: Disk = self.table.disk
-        tcols = self.tcols
-
-        tail_data = dict()
-
-        temp_table = defaultdict(lambda: [None for _ in range(tcols)])
-
-        for base_tuple in base_data:
-            indir = RID(base_tuple[MetaCol.INDIR])
-            page_id, offset = indir.get_loc()
-
-            tail_tuple = _get_tail_tuple()
-            # Handles case tails aren't on disk for a given base record. Could be no writes yet, or on committed writes. 
-            if tail_tuple is None:
-                continue
-
-            tail_data[base_tuple[MetaCol.RID]] = _get_tail_tuple()
-
-        return tail_data
-        
-    def _merge_records(self, base_records: list[tuple[int]], updated_tails: dict[RID, tuple[int]]) -> dict:
+        # Free pages cut off before (if readers are done w/ them)
+        self._free_tail_pages()
+
+        try:
+            latest = self._scan_tails(ranges)
+
+            # Base pages id -> {offset: (tail RID, data)}
+            by_base = dict()
+            for base_rid, record in latest.items():
+                # Uncommitted updates are left unmerged, as their transaction
+                # may still undo them (it holds the record's write lock until
+                # it ends). Ones committed or undone since aren't the latest
+                # tail record anymore if updated again, and are skipped then
+                if self.table.lock_mgr.is_write_locked(base_rid):
+                    continue
+
+                pages_id, offset = RID(base_rid).get_loc()
+                by_base.setdefault(pages_id, dict())[offset] = record
+
+            # Base pages id -> tail RIDs of the records marked as merged
+            merged = dict()
+            for pages_id, records in by_base.items():
+                merged[pages_id] = self._merge_pages(pages_id, records)
+
+            with self.lock:
+                self.stats["merged_records"] += sum(map(len, merged.values()))
+
+            if config.MERGE_KEEP_VERSIONS is not None:
+                self._cut_versions(merged, config.MERGE_KEEP_VERSIONS)
+        finally:
+            with self.lock:
+                self.num_pending -= sum(end - start for _, start, end in ranges)
+
+    def _scan_tails(self, ranges: list[tuple[int, int, int]]) -> dict:
         """
-        Conceuptually, a left-outer join
-        Inputs: Original base data (list of tuples) and most up-to-date tail records (dict)
-        Returns: ?Dictionary? with the updated base records.
+        Reads tail page ranges newest to oldest (each page once) and gets the
+        latest tail record of each base record, as base RID -> (tail RID, data).
+        Deletes and copies of base records (nothing to merge) hide older ones.
         """
-        meta_len = len(MetaCol)
-
-        for base_record in base_records:
-            base_rid = base_record[MetaCol.RID]
-
-            if base_rid in updated_tails:
-                base_record[meta_len:] = updated_tails[base_rid][meta_len:]
-
-                base_record[MetaCol.SCHEMA] = -1
-
-    def _write_temp_to_disk(self, data):
-        tcols = self.tcols
-        
-        cache_table = defaultdict(lambda: [None for _ in range(tcols)])
-
-        # Create new pages
-        for data_tuple in data:
-            rid = RID(data_tuple[MetaCol.RID])
-            page_id, offset = rid.get_loc()
-
-            for col in range(tcols):
-                # Attempt to get page from cache. If not in, grab from disk
-                page = cache_table[page_id][col] if page_id in cache_table else None
-                if page is None:
-                    page = Page(page_id)
-                    cache_table[page_id][col] = page
-
-                page.update(data_tuple[col], offset)
-                page._increment_offset()  # 9 out of 10 dentists agree
-
-        temp_filepath = os.path.join(self.table.db_path, "pages/temp")
-        os.makedirs(temp_filepath, exist_ok=True)
-
-        # Save new pages as temp files
-        for page_id, pages in cache_table.items():
-            for col in range(tcols):
-                page = pages[col]
-
-                path = os.path.join(temp_filepath, f"base_{page_id}_{col}.bin")
-
-                with open(path, "wb") as file:
-                    file.write(page.data)
-
-
-    # Helpers ----------------------------
-
+        bufferpool = self.table.buffer.bufferpool
+
+        seen = set()
+        latest = dict()
+        for pages_id, start, end in reversed(ranges):
+            pages = [bufferpool._pin_page(col, pages_id) for col in range(self.tcols)]
+
+            try:
+                rids = pages[MetaCol.RID].vals[start:end].tolist()
+                base_rids = pages[MetaCol.BASE_RID].vals[start:end].tolist()
+                schemas = pages[MetaCol.SCHEMA].vals[start:end].tolist()
+                data = [
+                    pages[col].vals[start:end].tolist()
+                    for col in range(len(MetaCol), self.tcols)
+                ]
+            finally:
+                for page in pages:
+                    bufferpool._unpin_page(page)
+
+            for i in reversed(range(end - start)):
+                base_rid = base_rids[i]
+                if base_rid in seen:
+                    continue
+                seen.add(base_rid)
+
+                if schemas[i] == 0 or RID(rids[i]).tombstone:
+                    continue
+
+                latest[base_rid] = (rids[i], [col_vals[i] for col_vals in data])
+
+        return latest
+
+    def _merge_pages(self, pages_id: int, records: dict[int, tuple[int, list]]) -> list[int]:
+        """
+        Merges the latest tail records of records of a set of base pages,
+        given as offset -> (tail RID, data).
 
-    def _get_page_records(self, page):
+        Returns the tail RIDs of the records marked as merged.
         """
-        Inputs: a single page_id
-        Returns: all the committed records for a given page_id
+        bufferpool = self.table.buffer.bufferpool
+
+        # Base latch held throughout, so no record is inserted into (or linked
+        # to a new tail record in) the pages between copying and swapping them
+        pages_b = bufferpool._latch_entry(pages_id)
+        try:
+            pages = [bufferpool._pin_page(col, pages_id) for col in range(self.tcols)]
+            try:
+                indir_page, schema_page = pages[MetaCol.INDIR], pages[MetaCol.SCHEMA]
+
+                # Skip records updated again since (merged w/ a later range)
+                records = {
+                    offset: record for offset, record in records.items()
+                    if indir_page.vals[offset] == record[0]
+                }
+
+                if not records:
+                    return []
+
+                # Write merged data to new versions of the data pages and swap
+                # them in at once. Readers that got the old pages before keep
+                # reading them, either version is fine for unmerged records
+                new_pages = {
+                    col: pages[col].copy() for col in range(len(MetaCol), self.tcols)}
+                for offset, (_, data) in records.items():
+                    for col, val in enumerate(data, len(MetaCol)):
+                        new_pages[col].vals[offset] = val
+
+                for page in new_pages.values():
+                    page.is_dirty = True
+
+                bufferpool._swap_pages(pages_id, new_pages)
+
+                # Mark records as merged
+                for offset in records:
+                    schema_page.update(-1, offset)
+                schema_page.is_dirty = True
+
+                return [tail_rid for tail_rid, _ in records.values()]
+            finally:
+                for page in pages:
+                    bufferpool._unpin_page(page)
+        finally:
+            pages_b.latch.release_exclusive()
+
+    def _cut_versions(self, merged: dict[int, list[int]], keep: int):
         """
-        buffer = self.buffer
-
-        # How to get all RIDs for a given page? Should this method be in page.py or disk.py?
-        # Probably a method in page.py, because it keeps each page modular with its own RIDs. 
-        page_rids = page.get_all_page_rids() 
-        
-        page_records = {}
-        for i, rid in enumerate(page_rids):
-            record = (i) # Uses the read method from bufferpool.py??
-
-
-        return page_records
-    
-
-# ----- Garbage Code -----
+        Cuts the version chains of merged records (given by base pages id ->
+        their latest tail records) after keep versions, and counts the tail
+        records cut off per tail page. Pages w/ only such records are freed
+        once readers that may still reach them are done.
+        """
+        bufferpool = self.table.buffer.bufferpool
+
+        def read_indir(rid):
+            pages_id, offset = rid.get_loc()
+            page = bufferpool._pin_page(MetaCol.INDIR, pages_id)
+            try:
+                return RID(page.vals[offset])
+            finally:
+                bufferpool._unpin_page(page)
+
+        # Heads of the cut off parts of the chains
+        cut = []
+        for pages_id, tail_rids in merged.items():
+            # Readers follow the chains of base records w/ their latch held
+            pages_b = bufferpool._latch_entry(pages_id)
+            try:
+                for tail_rid in tail_rids:
+                    # Oldest tail record to keep (if the chain is long enough)
+                    rid = RID(tail_rid)
+                    for _ in range(keep - 1):
+                        rid = read_indir(rid)
+                        if rid <= 0 or rid.is_base:
+                            break
+                    else:
+                        pages_id_t, offset_t = rid.get_loc()
+                        indir_page = bufferpool._pin_page(MetaCol.INDIR, pages_id_t)
+                        try:
+                            older = RID(indir_page.vals[offset_t])
+                            if older <= 0 or older.is_base:
+                                continue
+
+                            # Unlink older versions
+                            indir_page.update(0, offset_t)
+                            indir_page.is_dirty = True
+                        finally:
+                            bufferpool._unpin_page(indir_page)
+
+                        cut.append(older)
+            finally:
+                pages_b.latch.release_exclusive()
+
+        # Readers starting from now on can't reach the cut off records
+        with self._epoch_lock:
+            epoch = self.epoch
+            self.epoch += 1
+
+        # Count cut off tail records
+        dead = dict()
+        for older in cut:
+            while older > 0 and not older.is_base:
+                pages_id, offset = older.get_loc()
+                dead[pages_id] = dead.get(pages_id, 0) + 1
+                older = read_indir(older)
+
+        with self.lock:
+            for pages_id, count in dead.items():
+                self.stats["dead_tail_records"] += count
+
+                self.dead[pages_id] = self.dead.get(pages_id, 0) + count
+                if self.dead[pages_id] >= Page.capacity:
+                    del self.dead[pages_id]
+                    self._freeable.append((pages_id, epoch))
+
+    def _free_tail_pages(self):
+        """
+        Frees tail pages w/ only cut off records, from memory and disk. Pages
+        cut off in an epoch readers are still in, still pinned or w/ records
+        pending a merge are kept for later.
+        """
+        bufferpool = self.table.buffer.bufferpool
 
-    # def get_all_tail_page_ids(self):
-    #     """
-    #     Inputs: The page table
-    #     Returns: A list of all the tail page IDs
-    #     """
-    #     return [page_id for page_id in self.page_table.ptable if page_id % 2 != 0]
+        with self._epoch_lock:
+            oldest_epoch = min(self._readers, default=self.epoch)
 
+        with self.lock:
+            pages, self._freeable = self._freeable, []
 
-    # def _get_batch_paths(self, base_page_ids, start=0, batch_size=None):
-    #     """
-    #     Inputs: Every base page_ids
-    #     Returns: List of base page paths for the merge operation.
-    #     """
-    #     page_table: PageTable = self.page_table
-    #     subst_ids = base_page_ids[start:start + batch_size]
-    #     page_paths = []
+        kept = []
+        for pages_id, epoch in pages:
+            if epoch >= oldest_epoch:
+                kept.append((pages_id, epoch))
+                continue
 
-    #     for page_id in subst_ids:
-    #         page_entry = self.page_table.get_pages(page_id)
-    #         if page_entry:
-    #             for col in range(len(page_entry)):
-    #                 path = self.buffer.disk._get_page_path(page_id, col, 0) # TODO: Should the offset argument be = 0??
-    #                 print(path)
-    #                 page_paths.append(path)
+            with self.lock:
+                counts = self.tail_pages.get(pages_id)
+            if counts is not None and counts[0] < counts[1]:
+                kept.append((pages_id, epoch))
+                continue
 
+            freed = bufferpool._free_pages(pages_id)
+            if freed is None:
+                kept.append((pages_id, epoch))
+                continue
 
+            with self.lock:
+                self.stats["freed_tail_pages"] += 1
+                self.stats["freed_bytes"] += freed
 
+        with self.lock:
+            self._freeable += kept
@@ -5,7 +5,6 @@ The PageTable is a wrapper around a dictionary of PageTableEntries, which are
 themselves wrappers around lists of pages per column.
 """
 
-import threading
 from collections import OrderedDict
 import threading
 
@@ -14,26 +13,29 @@ from lstore import config
 from lstore.page import Page
 from lstore.storage.uid_gen import UIDGenerator
 from lstore.storage.rid import RID
-from lstore.storage.thread_lock import ThreadLock
+from lstore.storage.latch import Latch
 
 class PageTableEntry:
     # Cache config params
-    record_size = config.RECORD_SIZE
-    page_size = config.PAGE_SIZE
+    capacity = Page.capacity
 
-    def __init__(self, pages_id: int, total_cols: int, offset=None) -> None:
-        self.pages = [None for _ in range(total_cols)]
+    def __init__(self, pages_id: int, record_sizes: list[int], offset=None) -> None:
+        self.pages = [None for _ in range(len(record_sizes))]
 
         self.pages_id = pages_id
-        self.total_cols = total_cols
+        self.record_sizes = record_sizes
+        self.total_cols = len(record_sizes)
 
         self.page_count = 0
         
-        # Offset in bytes, ie how many bytes are occupied by each page
-        self.offset = Page.header_size
+        # Offset in slots, ie how many records are occupied by each page
+        self.offset = 0
+
+        # Latch guarding the pages' contents while records are read/written
+        self.latch = Latch()
 
-        # self.lock = threading.Lock()
-        self.lock = ThreadLock()
+        # Bumped whenever new versions of pages are swapped in (ie merges)
+        self.version = 0
 
     def __getitem__(self, index: int) -> Page:
         return self.pages[index]
@@ -45,25 +47,46 @@ class PageTableEntry:
         return len(self.pages)
     
     def create_new_pages(self, pages_id: int):
-        self.pages = [Page(pages_id) for _ in range(self.total_cols)]
+        self.pages = [Page(pages_id, size) for size in self.record_sizes]
         self.page_count = self.total_cols
 
     def add_page(self, page: Page, col: int):
         self[col] = page
         self.page_count += 1
 
+    def swap_pages(self, pages: dict[int, Page]):
+        """
+        Publishes new versions of pages (col -> page) at once. Readers holding
+        the old pages keep a consistent view until they let go of them.
+        """
+        for col, page in pages.items():
+            if self.pages[col] is None:
+                self.page_count += 1
+
+            self.pages[col] = page
+
+        self.version += 1
+
     def get_loc(self) -> tuple[int, int]:
         return self.pages_id, self.offset
     
     def has_capacity(self) -> bool:
-        return self.offset + PageTableEntry.record_size <= PageTableEntry.page_size
+        return self.offset < PageTableEntry.capacity
     
     def write_vals(self, columns):
         for col, page in enumerate(self.pages):
             page.write(columns[col])
             page.is_dirty = True
 
-        self.offset += PageTableEntry.record_size
+        self.offset += 1
+
+    def write_cols(self, columns):
+        """Writes several records given as one sequence of values per column"""
+        for col, page in enumerate(self.pages):
+            page.write_many(columns[col])
+            page.is_dirty = True
+
+        self.offset += len(columns[0])
 
     def delete_page(self, col: int) -> bool:
         self.pages[col] = None
@@ -83,10 +106,11 @@ class PageTable:
         cls.tail_id_gen = UIDGenerator("tail_pages_id", db_path,
             RID.pages_id_bits, even_only=True)
 
-    def __init__(self, tcols) -> None:
+    def __init__(self, record_sizes: list[int]) -> None:
         self.ptable = dict()
         
-        self.tcols = tcols
+        self.record_sizes = record_sizes
+        self.tcols = len(record_sizes)
         self.size = 0
 
         self.lock = threading.Lock()
@@ -105,7 +129,7 @@ class PageTable:
             pages_id = PageTable.tail_id_gen.next_uid() - 1  # Odd
         
         # Init table entry and populate with pages
-        pages = PageTableEntry(pages_id, self.tcols)
+        pages = PageTableEntry(pages_id, self.record_sizes)
         pages.create_new_pages(pages_id)
 
         self.ptable[pages_id] = pages
@@ -116,7 +140,7 @@ class PageTable:
     
     def init_pages(self, pages_id) -> PageTableEntry:
         # Create page entry with no pages (filled with None)
-        page_entry = PageTableEntry(pages_id, self.tcols)
+        page_entry = PageTableEntry(pages_id, self.record_sizes)
 
         self.ptable[pages_id] = page_entry
 
@@ -125,6 +149,14 @@ class PageTable:
     def get_entry(self, pages_id) -> PageTableEntry:
         return self.ptable.get(pages_id, None)
     
+    def remove_entry(self, pages_id) -> PageTableEntry | None:
+        pages = self.ptable.pop(pages_id, None)
+
+        if pages is not None:
+            self.size -= pages.page_count
+
+        return pages
+
     def remove_page(self, pages_id, col) -> bool:
         if pages_id in self.ptable:
             pages = self.get_entry(pages_id)
@@ -0,0 +1,190 @@
+"""
+Writes dirty pages to disk in the background, so eviction and close rarely
+have to write pages themselves and a crash loses only recent changes.
+
+1. A long-lived thread wakes every config.WRITER_INTERVAL seconds and writes
+   a batch of dirty pages. The disk sorts the batch by slot and coalesces
+   pages in adjacent slots into single writes. Pages of the latest base entry
+   are skipped since they're dirtied again by every insert.
+2. Pages are copied (w/ their entry latched shared) and marked as clean before
+   the copies are written, so changes made meanwhile dirty them again. Tail
+   pages are copied after base pages and written before them, so records on
+   disk never point to tail records missing from it. Eviction leaves dirty
+   base indirection pages to the writer for the same reason.
+   Pages changed by transactions still running are neither written nor
+   evicted until they end (no-steal), so only committed changes reach disk
+   and the log never has to undo anything.
+3. Every config.CHECKPOINT_INTERVAL seconds, a checkpoint is taken without
+   blocking queries: the last LSN in the log is noted, then all dirty pages
+   are written and segments synced. Changes logged up to that LSN are on disk
+   then, so it's recorded w/ the deleted keys in the table's checkpoint file
+   (unless pages were left for running transactions). Replay on open starts
+   after it, and the log drops the lines all tables have on disk.
+"""
+
+import os
+import json
+import threading
+import time
+
+from lstore import config
+
+class PageWriter:
+    """
+    Background writer of dirty pages and fuzzy checkpoints.
+
+    :param table: Reference to parent table
+    """
+    checkpoint_file = "checkpoint.json"
+
+    def __init__(self, table):
+        self.table = table
+
+        self.last_checkpoint = time.monotonic()
+
+        # LSN up to which the table's logged changes are on disk
+        self.redo_lsn = 0
+
+        # Write statistics
+        self.stats = {
+            "pages_written": 0,
+            "writes": 0,
+            "checkpoints": 0,
+        }
+        self.lock = threading.Lock()
+
+        # Background worker (started once the table has pages in memory)
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopping = False
+
+    def start(self):
+        """Starts the background writer if enabled and not running yet."""
+        if self._thread is not None or config.WRITER_INTERVAL is None:
+            return
+
+        with self.lock:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"writer-{self.table.name}", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stops the background writer, waiting for the current round to finish."""
+        with self.lock:
+            self._stopping = True
+            thread = self._thread
+
+        self._wake.set()
+        if thread is not None:
+            thread.join()
+
+        with self.lock:
+            self._thread = None
+            self._stopping = False
+
+    def is_running(self) -> bool:
+        """Whether the background writer is running."""
+        return self._thread is not None and not self._stopping
+
+    def write_round(self) -> int:
+        """
+        Writes a batch of dirty pages in the foreground. Returns the number of
+        pages written.
+        """
+        bufferpool = self.table.buffer.bufferpool
+
+        num_pages, num_writes, _ = bufferpool.write_dirty_pages(
+            config.WRITER_BATCH_PAGES, skip_latest=True)
+
+        with self.lock:
+            self.stats["pages_written"] += num_pages
+            self.stats["writes"] += num_writes
+
+        return num_pages
+
+    def checkpoint(self):
+        """
+        Takes a checkpoint: writes all dirty pages and syncs them to stable
+        storage, then records the LSN up to which logged changes are on disk
+        and truncates the log up to where all tables are.
+        """
+        bufferpool = self.table.buffer.bufferpool
+        disk = self.table.disk
+        wal = self.table.wal
+
+        # Changes are applied before being logged, so pages hold all changes
+        # up to this LSN (and keys deleted by them) from now on
+        start = time.time()
+        lsn = wal.get_last_lsn() if wal is not None else 0
+        delete_tracker = list(self.table.delete_tracker.copy())
+
+        num_pages, num_writes, pages_left = bufferpool.write_dirty_pages()
+        disk.sync()
+
+        # Pages left may hold changes up to the LSN too, keep the previous one
+        if not pages_left:
+            self.redo_lsn = lsn
+
+            # Replace the previous checkpoint atomically
+            path = os.path.join(disk.path, PageWriter.checkpoint_file)
+            temp_path = path + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump({
+                    "time": start,
+                    "redo_lsn": lsn,
+                    "delete_tracker": delete_tracker,
+                }, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, path)
+
+        if wal is not None:
+            wal.set_redo_lsn(self.table.name, self.redo_lsn)
+            wal.truncate(wal.get_redo_lsn())
+
+        self.last_checkpoint = time.monotonic()
+
+        with self.lock:
+            self.stats["pages_written"] += num_pages
+            self.stats["writes"] += num_writes
+            self.stats["checkpoints"] += 1
+
+    def restore_checkpoint(self):
+        """
+        Restores the redo LSN and deleted keys recorded by the last checkpoint
+        (if any), so replay only redoes changes made since.
+        """
+        path = os.path.join(self.table.disk.path, PageWriter.checkpoint_file)
+        if not os.path.exists(path):
+            return
+
+        with open(path, "r") as file:
+            checkpoint: dict = json.load(file)
+
+        self.redo_lsn = checkpoint.get("redo_lsn", 0)
+        if "delete_tracker" in checkpoint:
+            self.table.delete_tracker = set(checkpoint["delete_tracker"])
+
+    def get_stats(self) -> dict[str, int]:
+        """Gets write and checkpoint statistics."""
+        with self.lock:
+            return dict(self.stats)
+
+    # Helpers ------------------
+
+    def _run(self):
+        """Writes a batch of dirty pages every interval, until stopped."""
+        while not self._stopping:
+            self._wake.wait(config.WRITER_INTERVAL)
+            if self._stopping:
+                break
+
+            try:
+                self.write_round()
+
+                if time.monotonic() - self.last_checkpoint >= config.CHECKPOINT_INTERVAL:
+                    self.checkpoint()
+            except Exception as e:
+                if config.PRINT_ERRORS:
+                    print(f"Error writing dirty pages of table {self.table.name}: {e}")
@@ -0,0 +1,205 @@
+"""
+Replacement policies deciding which page the bufferpool evicts next.
+
+Pages are tracked by key, ie (pages_id, col). The bufferpool adds pages once
+they are in memory, touches them on every access and asks for a victim when
+it's over capacity.
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class ReplacementPolicy(ABC):
+    """
+    Blueprint of replacement policies.
+
+    :param capacity: Number of pages the bufferpool holds
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+
+    @abstractmethod
+    def add(self, key):
+        """Starts tracking a page that was just brought into memory."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def touch(self, key):
+        """Records an access to a page (ignored if not tracked)."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def remove(self, key):
+        """Stops tracking a page that's dropped w/o eviction (if tracked)."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def evict(self):
+        """Picks the next page to evict and stops tracking it."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def __len__(self):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def __contains__(self, key):
+        raise NotImplementedError()
+
+
+class LRUPolicy(ReplacementPolicy):
+    """Evicts the least recently used page."""
+    def __init__(self, capacity: int):
+        super().__init__(capacity)
+        self.queue = OrderedDict()
+
+    def add(self, key):
+        self.queue[key] = None
+
+    def touch(self, key):
+        try:
+            self.queue.move_to_end(key)
+        except KeyError:
+            pass  # Not tracked (or evicted meanwhile)
+
+    def remove(self, key):
+        self.queue.pop(key, None)
+
+    def evict(self):
+        return self.queue.popitem(last=False)[0]
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __contains__(self, key):
+        return key in self.queue
+
+
+class MRUPolicy(LRUPolicy):
+    """Evicts the most recently used page (new pages are evicted last)."""
+    def touch(self, key):
+        try:
+            self.queue.move_to_end(key, last=False)
+        except KeyError:
+            pass
+
+
+class ClockPolicy(ReplacementPolicy):
+    """
+    Approximates LRU w/ a reference bit per page. The clock hand skips (and
+    clears) pages referenced since it last passed them.
+    """
+    def __init__(self, capacity: int):
+        super().__init__(capacity)
+
+        # Keys in clock order (the hand is at the front), and the set
+        # reference bits. Touches only set a bit, never reorder the clock
+        self.clock = OrderedDict()
+        self.referenced = set()
+
+    def add(self, key):
+        self.clock[key] = None
+        self.referenced.add(key)
+
+    def touch(self, key):
+        self.referenced.add(key)
+
+    def remove(self, key):
+        self.clock.pop(key, None)
+        self.referenced.discard(key)
+
+    def evict(self):
+        while True:
+            key = self.clock.popitem(last=False)[0]
+            if key not in self.referenced:
+                return key
+
+            # Second chance
+            self.referenced.discard(key)
+            self.clock[key] = None
+
+    def __len__(self):
+        return len(self.clock)
+
+    def __contains__(self, key):
+        return key in self.clock
+
+
+class TwoQPolicy(ReplacementPolicy):
+    """
+    2Q: pages seen once wait in a FIFO (A1in) and are evicted from there
+    first, so one-off accesses never push out pages in the main LRU (Am).
+    Keys of pages evicted from the FIFO are remembered (A1out), and pages
+    that come back while remembered go straight to the main LRU.
+    """
+    in_share = 0.25   # Share of capacity for A1in
+    out_share = 0.5   # Share of capacity remembered in A1out
+
+    def __init__(self, capacity: int):
+        super().__init__(capacity)
+
+        self.max_in = max(1, int(capacity * TwoQPolicy.in_share))
+        self.max_out = max(1, int(capacity * TwoQPolicy.out_share))
+
+        self.a1_in = OrderedDict()
+        self.a1_out = OrderedDict()
+        self.am = OrderedDict()
+
+    def add(self, key):
+        if key in self:
+            return
+
+        if key in self.a1_out:
+            del self.a1_out[key]
+            self.am[key] = None
+        else:
+            self.a1_in[key] = None
+
+    def touch(self, key):
+        try:
+            self.am.move_to_end(key)
+        except KeyError:
+            pass
+
+    def remove(self, key):
+        self.a1_in.pop(key, None)
+        self.am.pop(key, None)
+
+    def evict(self):
+        if self.a1_in and (len(self.a1_in) > self.max_in or not self.am):
+            key = self.a1_in.popitem(last=False)[0]
+
+            # Remember it in case it comes back
+            self.a1_out[key] = None
+            if len(self.a1_out) > self.max_out:
+                self.a1_out.popitem(last=False)
+
+            return key
+
+        return self.am.popitem(last=False)[0]
+
+    def __len__(self):
+        return len(self.a1_in) + len(self.am)
+
+    def __contains__(self, key):
+        return key in self.a1_in or key in self.am
+
+
+POLICIES = {
+    "lru": LRUPolicy,
+    "mru": MRUPolicy,
+    "clock": ClockPolicy,
+    "2q": TwoQPolicy,
+}
+
+
+def make_policy(name: str, capacity: int) -> ReplacementPolicy:
+    """Creates a replacement policy given its name (see POLICIES)."""
+    try:
+        policy_cls = POLICIES[name.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Replacement policy {name} not supported, use one of {sorted(POLICIES)}")
+
+    return policy_cls(capacity)
@@ -1,60 +1,201 @@
+"""
+Pages on disk are stored in segment files. Every column of a table has one
+segment for base pages and one for tail pages, where each page lives in a
+fixed slot (slot * block size). A catalog per page type maps pages ids to
+slots and is persisted as a list of pages ids (index == slot). Slots of freed
+pages are marked in the catalog and reused by new pages.
+
+Segments are kept open, so reading or writing a page is a single positioned
+read/write on a long-lived file descriptor. Optionally, base segments are
+memory mapped (read-only) so clean base pages are views of the mapping (the OS
+page cache then acts as their buffer and reads need no syscalls or copies).
+Pages are copied out of the mapping on their first write and written back like
+any other page, so nothing reaches the file before the bufferpool writes it.
+"""
+
 import os
+import mmap
+import threading
+from array import array
+from types import SimpleNamespace
 
 from lstore import config
 
 from lstore.page import Page
 from lstore.storage.meta_col import MetaCol
-from lstore.storage.rid import RID
+
+_OPEN_FLAGS = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+
+# Positioned I/O (falls back to seek + read/write where unavailable, ie Windows)
+if hasattr(os, "preadv") and hasattr(os, "pwrite"):
+    def _read_into(fd, data, pos):
+        return os.preadv(fd, [data], pos)
+
+    def _write_from(fd, data, pos):
+        return os.pwrite(fd, data, pos)
+else:
+    _seek_lock = threading.Lock()
+
+    def _read_into(fd, data, pos):
+        with _seek_lock:
+            os.lseek(fd, pos, os.SEEK_SET)
+            chunk = os.read(fd, len(data))
+
+        data[:len(chunk)] = chunk
+        return len(chunk)
+
+    def _write_from(fd, data, pos):
+        with _seek_lock:
+            os.lseek(fd, pos, os.SEEK_SET)
+            return os.write(fd, data)
+
 
 class Disk:
     PAGE_SIZE = config.PAGE_SIZE  # 4KB page size
+    page_types = ("base", "tail")
+
+    free_slot = -1  # Catalog entry of a freed slot
 
-    def __init__(self, table) -> None:
+    def __init__(self, table, path=None, use_mmap=None) -> None:
         self.table = table
 
-    def _get_page_path(self, pages_id: int, col: int):
-        """
-        Generates a file path for a given RID.
-        """
-        page_type = "tail" if pages_id % 2 else "base"
+        # Whether base pages are views of memory mapped segments
+        self.use_mmap = config.MMAP_BASE_PAGES if use_mmap is None else use_mmap
+
+        # Directory holding the table's segments and catalogs
+        if path is None:
+            path = os.path.join(table.db_path, "pages", table.name)
+        self.path = path
 
-        return os.path.join(self.table.db_path,
-            f"pages/{page_type}_{pages_id}_{col}.bin")
+        self.lock = threading.Lock()
+
+        self._open()
 
     def get_page(self, pages_id: int, col: int):
         """
-        Reads a 4KB page from disk corresponding to the given RID.
-        Returns the page data as bytes.
+        Reads a page from its column segment given its pages id.
+        Returns the page wrapping the data read.
         """
-        page_path = self._get_page_path(pages_id, col)
+        page_type = Disk._get_page_type(pages_id)
 
-        # Check if page file exists
-        if not os.path.exists(page_path):
+        # Check if page exists on disk
+        slot = self._slots[page_type].get(pages_id)
+        if slot is None:
             raise FileNotFoundError(f"Page with ID {pages_id} not found on disk.")
 
-        # Read and return page data
-        with open(page_path, "rb") as file:
-            data = file.read(self.PAGE_SIZE)
+        record_size = self.table.record_sizes[col]
+        block_size = Page.block_size(record_size)
+        start = slot * block_size
+
+        if self.use_mmap and page_type == "base":
+            data = self._get_mapped_block(col, start, block_size)
+            if data is not None:
+                return Page.from_data(data, pages_id, record_size)
+
+        data = bytearray(block_size)
+        _read_into(self._get_fd(page_type, col), data, start)
+
+        return Page.from_data(data, pages_id, record_size)
 
-        return Page.from_data(data, pages_id)
-    
     def add_page(self, page: Page, pages_id: int, col: int):
         """
-        Writes or updates a 4KB page on disk corresponding to the given RID.
-        :param rid: RID to identify the page location.
-        :param page_data: Byte data of the page to be written to disk.
+        Writes or updates a page in its column segment (allocates a slot in
+        the catalog for new pages ids).
+        :param page: Page to write.
+        :param pages_id: Pages id of the page (same for all its columns).
+        :param col: Column of the page (including metadata columns).
         """
-        # if page.num_records * config.RECORD_SIZE != self.PAGE_SIZE:
-        #     raise ValueError("Page data must be exactly 4KB.")
-        
-        page_path = self._get_page_path(pages_id, col)
+        page_type = Disk._get_page_type(pages_id)
+
+        slot = self._slots[page_type].get(pages_id)
+        if slot is None:
+            slot = self._allocate_slot(page_type, pages_id)
 
-        # Write page data to the file
-        with open(page_path, "wb") as file:
-            file.write(page.data)
+        _write_from(self._get_fd(page_type, col), page.data, slot * len(page.data))
 
         if config.DEBUG_PRINT:
-            print(f"Page {pages_id} written to {page_path}")
+            print(f"Page {pages_id} written to {page_type}_{col} slot {slot}")
+
+    def write_pages(self, pages: list[tuple[int, int, bytes]]) -> int:
+        """
+        Writes many pages at once, given as (pages id, col, data). Pages are
+        sorted by slot per segment and pages in adjacent slots are coalesced
+        into a single write.
+
+        Returns the number of writes issued.
+        """
+        # (page type, col) -> [(slot, data)]
+        by_segment = dict()
+        for pages_id, col, data in pages:
+            page_type = Disk._get_page_type(pages_id)
+
+            slot = self._slots[page_type].get(pages_id)
+            if slot is None:
+                slot = self._allocate_slot(page_type, pages_id)
+
+            by_segment.setdefault((page_type, col), []).append((slot, data))
+
+        num_writes = 0
+        for (page_type, col), blocks in by_segment.items():
+            fd = self._get_fd(page_type, col)
+            block_size = Page.block_size(self.table.record_sizes[col])
+
+            blocks.sort(key=lambda block: block[0])
+
+            # Runs of consecutive slots
+            start = 0
+            for end in range(1, len(blocks) + 1):
+                if end < len(blocks) and blocks[end][0] == blocks[end - 1][0] + 1:
+                    continue
+
+                first_slot = blocks[start][0]
+                _write_from(
+                    fd, b"".join(data for _, data in blocks[start:end]),
+                    first_slot * block_size)
+                num_writes += 1
+
+                if config.DEBUG_PRINT:
+                    print(f"{end - start} page(s) written to {page_type}_{col} "
+                          f"slots {first_slot}-{blocks[end - 1][0]}")
+
+                start = end
+
+        return num_writes
+
+    def sync(self):
+        """Flushes written segments and catalogs to stable storage."""
+        with self.lock:
+            fds = [*self._fds.values(), *self._catalog_fds.values()]
+
+        for fd in fds:
+            os.fsync(fd)
+
+    def get_pages_ids(self, is_base=True) -> list[int]:
+        """Gets pages ids of all base or tail pages on disk (in slot order)."""
+        page_type = "base" if is_base else "tail"
+
+        return [
+            pages_id for pages_id in self._catalogs[page_type]
+            if pages_id != Disk.free_slot
+        ]
+
+    def free_page(self, pages_id: int) -> int:
+        """
+        Frees the slot of a set of pages (all columns) for reuse by new pages.
+        Returns the number of bytes freed (0 if the pages weren't on disk).
+        """
+        page_type = Disk._get_page_type(pages_id)
+
+        with self.lock:
+            slot = self._slots[page_type].pop(pages_id, None)
+            if slot is None:
+                return 0
+
+            self._catalogs[page_type][slot] = Disk.free_slot
+            self._write_catalog_entry(page_type, slot)
+            self._free_slots[page_type].append(slot)
+
+        return sum(Page.block_size(size) for size in self.table.record_sizes)
 
     def write_all_pages(self, pages):
         """
@@ -68,69 +209,196 @@ class Disk:
 
     def scan_base_records(self, index_cols: list[int]):
         """
-        Generates RID & column value pairs where the column values are tuples
-        of data values corresponding to the given index columns.
+        Generates the RIDs and column values of each set of base pages, reading
+        every page once. Yields a list of RIDs (as ints) and, for each of the
+        given index columns, a list of values aligned with the RIDs.
         """
-        path = f"{self.table.db_path}/pages/"
-
-        # Get all filepaths for base pages with RIDs
-        rid_filepaths = self._get_rid_filepaths(path, is_base=True)
-
-        # Offset index column indices to match page names on disk
+        # Offset index column indices to match columns of segments
         num_metadata_cols = len(MetaCol)
         real_index_cols = [col + num_metadata_cols for col in index_cols]
 
-        # For each RID page
-        for rid_path in rid_filepaths:
-            pages_id = int(rid_path.split("_")[1])  # Get pages_id from name
+        # For each set of base pages
+        for pages_id in self.get_pages_ids(is_base=True):
+            rid_page = self.get_page(pages_id, MetaCol.RID)
+            num_records = rid_page.offset
 
-            # Read page from disk
-            with open(rid_path, "rb") as file:
-                bytes = file.read(self.PAGE_SIZE)
-                rid_page = Page.from_data(bytes, pages_id)
+            # Slot of a record == its RID's offset, so values line up w/ RIDs
+            rids = rid_page.vals[:num_records].tolist()
+            columns = [
+                self.get_page(pages_id, col).vals[:num_records].tolist()
+                for col in real_index_cols
+            ]
 
-            # For each rid, get its corresponding index column data
-            for rid in rid_page:
-                rid = RID(rid)
-                _, offset = rid.get_loc()
+            yield rids, columns
 
-                columns = []
+    def get_sorted_column(self, col: int) -> tuple[array, array]:
+        """
+        Gets all values of a data column in base pages with their RIDs, sorted
+        by value (then RID), as arrays ready for bulk loading an index.
+        """
+        pairs = []
+        for rids, (vals,) in self.scan_base_records([col]):
+            pairs.extend(zip(vals, rids))
 
-                for col in real_index_cols:
-                    data_path = os.path.join(path, f"base_{pages_id}_{col}.bin")
+        pairs.sort()
 
-                    # TODO: cache pages
-                    with open(data_path, "rb") as file:
-                        bytes = file.read(self.PAGE_SIZE)
-                        data_page = Page.from_data(bytes, pages_id)
+        return (array("q", [val for val, _ in pairs]),
+                array("q", [rid for _, rid in pairs]))
 
-                    columns.append(data_page.read(offset))
+    def close(self):
+        """Closes all open segments, catalogs and memory maps."""
+        with self.lock:
+            for mapping in self._maps.values():
+                try:
+                    mapping.close()
+                except BufferError:
+                    pass  # Still viewed by pages in memory, closed once freed
+            self._maps.clear()
 
-                yield rid, columns
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
 
-        # for pages_id, page_entry in self.bufferpool.page_table:
-        #     if not page_entry.data[0].is_base:  # Skip tail pages
-        #         continue
+            for fd in self._catalog_fds.values():
+                os.close(fd)
+            self._catalog_fds.clear()
 
-        #     for offset in range(page_entry.bytes // config.RECORD_SIZE):
-        #         rid = RID.from_params(pages_id, offset, is_base=1, tombstone=0)
-        #         try:
-        #             record = self.get_record(rid, [1] * self.table.num_columns, rel_version=0)
-        #             yield rid, record.columns
-        #         except Exception as e:
-        #             print(f"Error scanning base record {rid}: {e}")
+    def clear(self):
+        """Closes and deletes all segments and catalogs."""
+        self.close()
 
-    def _get_rid_filepaths(self, dir, is_base=True):
-        """Gets filepaths of base or tail pages for given index columns."""
-        page_type = "base" if is_base else "tail"
+        with self.lock:
+            for filename in os.listdir(self.path):
+                os.remove(os.path.join(self.path, filename))
+
+            self._open()
 
-        with os.scandir(dir) as entries:
-            rid_idx_substr = f"_{MetaCol.RID}."
+    # Helpers ------------------
 
-            # Get all filepaths of given type and with a indexed column label
-            filepaths = [
-                os.path.join(dir, entry.name) for entry in entries if 
-                all(substr in entry.name for substr in (page_type, rid_idx_substr))
+    @staticmethod
+    def _get_page_type(pages_id: int):
+        return "tail" if pages_id % 2 else "base"
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        # Long-lived file descriptors for each (page type, col) segment
+        self._fds = dict()
+
+        # Memory maps of base segments per col (if using mmap)
+        self._maps = dict()
+
+        # Catalogs (slot -> pages id), lookup (pages id -> slot), freed slots
+        # & catalog fds
+        self._catalogs = dict()
+        self._slots = dict()
+        self._free_slots = dict()
+        self._catalog_fds = dict()
+
+        for page_type in Disk.page_types:
+            catalog = self._load_catalog(page_type)
+
+            self._catalogs[page_type] = catalog
+            self._slots[page_type] = {
+                pages_id: slot for slot, pages_id in enumerate(catalog)
+                if pages_id != Disk.free_slot
+            }
+            self._free_slots[page_type] = [
+                slot for slot, pages_id in enumerate(catalog)
+                if pages_id == Disk.free_slot
             ]
 
-        return filepaths
\ No newline at end of file
+    def _get_fd(self, page_type, col):
+        fd = self._fds.get((page_type, col))
+
+        if fd is None:
+            with self.lock:
+                fd = self._fds.get((page_type, col))
+                if fd is None:
+                    path = os.path.join(self.path, f"{page_type}_{col}.seg")
+                    fd = os.open(path, _OPEN_FLAGS)
+                    self._fds[(page_type, col)] = fd
+
+        return fd
+
+    def _get_mapped_block(self, col, start, size):
+        """
+        Gets a read-only view of a block in a base segment's memory map.
+        Remaps if the segment grew past the current map and returns None if
+        the block isn't in the file yet.
+        """
+        mapping = self._maps.get(col)
+
+        if mapping is None or start + size > len(mapping):
+            fd = self._get_fd("base", col)
+
+            with self.lock:
+                length = os.fstat(fd).st_size
+                if start + size > length:
+                    return None
+
+                # Views of the old map keep it alive, both share the file
+                mapping = mmap.mmap(fd, length, access=mmap.ACCESS_READ)
+                self._maps[col] = mapping
+
+        return memoryview(mapping)[start:start + size]
+
+    def _get_catalog_path(self, page_type):
+        return os.path.join(self.path, f"{page_type}.cat")
+
+    def _load_catalog(self, page_type):
+        catalog = array("q")
+
+        path = self._get_catalog_path(page_type)
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                catalog.frombytes(file.read())
+
+        return catalog
+
+    def _allocate_slot(self, page_type, pages_id):
+        with self.lock:
+            slots = self._slots[page_type]
+
+            # Another thread may have allocated while waiting for the lock
+            slot = slots.get(pages_id)
+            if slot is not None:
+                return slot
+
+            # Reuse a freed slot before growing the segments
+            catalog = self._catalogs[page_type]
+            free_slots = self._free_slots[page_type]
+            if free_slots:
+                slot = free_slots.pop()
+                catalog[slot] = pages_id
+            else:
+                slot = len(catalog)
+                catalog.append(pages_id)
+
+            self._write_catalog_entry(page_type, slot)
+            slots[pages_id] = slot
+
+            return slot
+
+    def _write_catalog_entry(self, page_type, slot):
+        """Persists a catalog entry (caller holds the lock)."""
+        fd = self._catalog_fds.get(page_type)
+        if fd is None:
+            fd = os.open(self._get_catalog_path(page_type), _OPEN_FLAGS)
+            self._catalog_fds[page_type] = fd
+
+        entry = array("q", [self._catalogs[page_type][slot]]).tobytes()
+        _write_from(fd, entry, slot * len(entry))
+
+
+def get_sorted_column(path: str, record_sizes: list[int], col: int):
+    """
+    Process pool entry point for rebuilding an index. Opens the segments in
+    path on its own and returns Disk.get_sorted_column for the column.
+    """
+    disk = Disk(SimpleNamespace(record_sizes=record_sizes), path, use_mmap=False)
+
+    try:
+        return disk.get_sorted_column(col)
+    finally:
+        disk.close()
@@ -0,0 +1,78 @@
+import threading
+
+class Latch:
+    """
+    Short-lived read/write latch guarding the physical contents of pages
+    while they're read or written (unlike transaction locks, it's never held
+    across operations). Many readers or one writer, and writers waiting keep
+    new readers out so they aren't starved.
+    """
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_shared(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+
+            self._readers += 1
+
+    def release_shared(self):
+        with self._cond:
+            self._readers -= 1
+
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_exclusive(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+
+            self._writer = True
+
+    def try_acquire_exclusive(self) -> bool:
+        """Acquires the latch exclusively if it's free, w/o waiting."""
+        with self._cond:
+            if self._writer or self._readers:
+                return False
+
+            self._writer = True
+            return True
+
+    def release_exclusive(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    def is_busy(self) -> bool:
+        """Whether anyone holds the latch (ie pages can't be evicted)."""
+        return self._writer or self._readers > 0
+
+    def shared(self):
+        return _Held(self.acquire_shared, self.release_shared)
+
+    def exclusive(self):
+        return _Held(self.acquire_exclusive, self.release_exclusive)
+
+
+class _Held:
+    """Context manager holding a latch in one mode."""
+    __slots__ = ("_acquire", "_release")
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._release()
@@ -0,0 +1,177 @@
+"""
+Record locks of a table for two-phase locking, so transactions touching
+different records never conflict (even if the records share pages).
+
+1. Locks are shared (reads) or exclusive (writes) and keyed by base RID, or
+   by ("key", primary key) for keys of rows being inserted (before they have
+   a RID). Lock states live in stripes, each guarded by its own mutex, so
+   threads locking different records rarely wait on the same mutex.
+2. Locks are held by the calling thread's transaction until it commits or
+   aborts, and are kept in its held locks by (manager, key). Outside
+   transactions nothing is locked.
+3. Conflicts are resolved by wait-die: a transaction older than every
+   holder waits for the lock, a younger one raises RollbackCurrentTransaction
+   and is retried later (w/ its timestamp, so it eventually is the oldest).
+   Waits only go from older to younger transactions, so there are no
+   deadlocks.
+"""
+
+import threading
+
+from lstore import config
+
+from lstore.storage.thread_local import ThreadLocalSingleton
+from lstore.storage.thread_lock import RollbackCurrentTransaction
+
+
+class _LockState:
+    """Holders of a record lock."""
+    __slots__ = ("owner", "readers")
+
+    def __init__(self):
+        self.owner = None       # Transaction holding it exclusively
+        self.readers = set()    # Transactions holding it shared
+
+
+class HeldLock:
+    """
+    Handle of a record lock held by the calling thread's transaction (kept in
+    its held locks, by (manager, key), until released).
+    """
+    __slots__ = ("manager", "key")
+
+    def __init__(self, manager, key):
+        self.manager = manager
+        self.key = key
+
+    def release(self):
+        self.manager.release(self.key)
+
+
+class LockManager:
+    """
+    Shared/exclusive record locks w/ striped mutexes.
+
+    :param stripes: Number of stripes (None for config.LOCK_STRIPES)
+    """
+    def __init__(self, stripes: int = None):
+        if stripes is None:
+            stripes = config.LOCK_STRIPES
+
+        self._conds = [threading.Condition(threading.Lock()) for _ in range(stripes)]
+        self._states = [dict() for _ in range(stripes)]
+
+        self.stats = {
+            "waits": 0,
+            "conflicts": 0,
+        }
+        self._stats_lock = threading.Lock()
+
+    def acquire_shared(self, key):
+        """Locks a record for reading by the running transaction (if any)."""
+        self._acquire(key, exclusive=False)
+
+    def acquire_exclusive(self, key):
+        """Locks a record for writing by the running transaction (if any)."""
+        self._acquire(key, exclusive=True)
+
+    def release(self, key):
+        """Releases the running transaction's lock on a record (if held)."""
+        thread_local = ThreadLocalSingleton.get_instance()
+        transaction = thread_local.transaction
+
+        stripe = hash(key) % len(self._conds)
+        with self._conds[stripe]:
+            states = self._states[stripe]
+
+            state = states.get(key)
+            if state is not None:
+                if state.owner is transaction:
+                    state.owner = None
+                state.readers.discard(transaction)
+
+                if state.owner is None and not state.readers:
+                    del states[key]
+
+                self._conds[stripe].notify_all()
+
+        thread_local.held_locks.pop((self, key), None)
+
+    def is_write_locked(self, key) -> bool:
+        """
+        Whether a transaction holds a record's exclusive lock, ie may have
+        changed it w/o committing yet.
+        """
+        stripe = hash(key) % len(self._conds)
+        with self._conds[stripe]:
+            state = self._states[stripe].get(key)
+            return state is not None and state.owner is not None
+
+    def get_stats(self) -> dict[str, int]:
+        """Gets the number of lock waits and of conflicts that rolled back."""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    # Helpers ------------------
+
+    def _acquire(self, key, exclusive: bool):
+        thread_local = ThreadLocalSingleton.get_instance()
+        transaction = thread_local.transaction
+        if transaction is None:
+            return
+
+        stripe = hash(key) % len(self._conds)
+        cond = self._conds[stripe]
+        with cond:
+            states = self._states[stripe]
+
+            waited = False
+            while True:
+                state = states.get(key)
+                if state is None:
+                    state = states[key] = _LockState()
+
+                is_new = state.owner is not transaction and transaction not in state.readers
+
+                # Already held in a mode that's good enough
+                if state.owner is transaction or (not exclusive and not is_new):
+                    return
+
+                holders = [] if state.owner is None else [state.owner]
+                if exclusive:
+                    holders.extend(t for t in state.readers if t is not transaction)
+
+                if not holders:
+                    break
+
+                # Wait-die: only wait for younger transactions
+                oldest = min(holders, key=_age)
+                if _age(transaction) >= _age(oldest):
+                    self._count("conflicts")
+                    if state.owner is None and not state.readers:
+                        del states[key]
+                    raise RollbackCurrentTransaction(oldest)
+
+                if not waited:
+                    self._count("waits")
+                    waited = True
+                cond.wait()
+
+            if exclusive:
+                state.readers.discard(transaction)
+                state.owner = transaction
+            else:
+                state.readers.add(transaction)
+
+        if is_new:
+            thread_local.held_locks[(self, key)] = HeldLock(self, key)
+
+    def _count(self, stat: str):
+        # Stripes are guarded by different mutexes, stats by their own
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+
+def _age(transaction):
+    """Orders transactions by start time (ties broken consistently)."""
+    return (transaction.ts, id(transaction))
@@ -1,8 +1,9 @@
 from enum import IntEnum
 
 class MetaCol(IntEnum):
-    INDIR = 0      # Base: RID of latest tail; Tail: RID of prev
+    INDIR = 0      # Base: RID of latest tail (or itself); Tail: RID of prev
     RID = 1        # Record ID (and index/location/hashable in page directory)
     SCHEMA = 2     # Bits representing cols, 1s where updated
+    BASE_RID = 3   # Base: its own RID; Tail: RID of its base record (for merges)
     
-    # TIME = 3       # Timestamp for both base and tail record
+    # TIME = 4       # Timestamp for both base and tail record
@@ -10,26 +10,24 @@ from typing import Literal
 from enum import IntEnum
 
 from lstore import config
-from lstore.storage.uid_gen import UIDGenerator
 
 # Setup -----------------------------------------
 
 
 class _RIDField(IntEnum):
     """RID attribute index"""
-    UID = 0
-    PAGES_ID = 1
-    PAGES_OFFSET = 2
-    IS_BASE = 3
-    TOMBSTONE = 4
+    PAGES_ID = 0
+    PAGES_OFFSET = 1
+    IS_BASE = 2
+    TOMBSTONE = 3
 
-_TOTAL_RID_BITS = 128
+# Fits in a signed 8 byte slot, location (pages_id, offset) is already unique
+_TOTAL_RID_BITS = 64
 _TOTAL_RID_BYTES = _TOTAL_RID_BITS // 8
 
 _RID_BITS = (
-    48,  # UID
     36,  # pages_id
-    12,  # offset (2^12 == 4096)
+    12,  # offset (slot of record in page, 2^12 == 4096)
     1,   # is_base
     1,   # tombstone
 )
@@ -54,13 +52,7 @@ _FIELD_MASKS = tuple(
 
 class RID:
     pages_id_bits = _RID_BITS[_RIDField.PAGES_ID]
-
-    # UID Generator
-    tail_id_gen = None
-
-    @classmethod
-    def initialize_uid_gen(cls, db_path):
-        cls.uid_gen = UIDGenerator("rid", db_path, _RID_BITS[_RIDField.UID])
+    tombstone_mask = _FIELD_MASKS[_RIDField.TOMBSTONE]
 
     def __init__(self, rid_int: int):
         self._rid = rid_int
@@ -76,9 +68,6 @@ class RID:
         """
         Constructor with parameters. ex rid = RID.from_params(...)
         """
-        # Set ID and ensure correct amount of bits
-        uid = cls.uid_gen.next_uid() & _RID_MASKS[_RIDField.UID]
-
         # Mask each input to ensure correct bit width
         pages_id &= _RID_MASKS[_RIDField.PAGES_ID]
         pages_offset &= _RID_MASKS[_RIDField.PAGES_OFFSET]
@@ -86,7 +75,6 @@ class RID:
         tombstone &= _RID_MASKS[_RIDField.TOMBSTONE]
 
         rid_int = (
-            (uid << _RID_SHIFTS[_RIDField.UID]) |
             (pages_id << _RID_SHIFTS[_RIDField.PAGES_ID]) |
             (pages_offset << _RID_SHIFTS[_RIDField.PAGES_OFFSET]) |
             (is_base << _RID_SHIFTS[_RIDField.IS_BASE]) |
@@ -101,10 +89,6 @@ class RID:
         # Gets actual integer, int(rid) is also supported
         return self._rid
 
-    @property
-    def uid(self):
-        return (self.rid & _FIELD_MASKS[_RIDField.UID]) >> _RID_SHIFTS[_RIDField.UID]
-    
     @property
     def pages_id(self):
         return (self.rid & _FIELD_MASKS[_RIDField.PAGES_ID]) >> _RID_SHIFTS[_RIDField.PAGES_ID]
@@ -11,12 +11,13 @@ class ThreadLocalSingleton:
     @classmethod
     def init_thread_local(cls):
         if not hasattr(cls._thread_local, "held_locks"):
-            cls._thread_local.held_locks = []
+            cls._thread_local.held_locks = dict()  # (manager, key) -> handle
         if not hasattr(cls._thread_local, "transaction"):
             cls._thread_local.transaction = None
 
     @property
     def held_locks(self):
+        self.init_thread_local()
         return self._thread_local.held_locks
     
     @held_locks.setter
@@ -25,6 +26,7 @@ class ThreadLocalSingleton:
 
     @property
     def transaction(self):
+        self.init_thread_local()
         return self._thread_local.transaction
     
     @transaction.setter
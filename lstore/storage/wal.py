@@ -0,0 +1,318 @@
+"""
+Redo log of a database, so committed changes survive a crash without pages
+being written on commit.
+
+Tables log their changes logically (inserted rows, updated columns and
+deleted keys, by primary key) to an append-only file, one line per group of
+records written at once:
+1. Changes made by a transaction are collected in its thread and appended as
+   a single line when it commits, so they're replayed all or not at all.
+   Changes outside transactions are appended right away.
+2. Group commit: a background thread writes and syncs everything appended so
+   far at once. A commit waits up to config.WAL_COMMIT_DELAY for others to
+   join its sync, then until the sync is done. Records outside transactions
+   are synced within config.WAL_FLUSH_INTERVAL without anyone waiting.
+3. Replay is idempotent (records are applied by primary key to whatever
+   state the pages are in). Pages w/ uncommitted changes are never written
+   (see the bufferpool), so there is nothing to undo.
+4. Lines are numbered (LSNs) from the start LSN in the file's header line, so
+   numbers keep growing across truncations. Checkpoints record the LSN up to
+   which a table's changes are on disk, replay skips those and the lines all
+   tables have on disk are dropped.
+"""
+
+import os
+import json
+import threading
+import time
+
+from lstore import config
+
+_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+
+# Redo records of the calling thread's transaction, per log (None -> no transaction)
+_transactions = threading.local()
+
+
+def begin_transaction():
+    """Starts collecting the calling thread's redo records until commit/abort."""
+    _transactions.records = dict()
+
+
+def commit_transaction():
+    """
+    Appends the redo records of the calling thread's transaction and waits
+    until they're durable.
+    """
+    records = getattr(_transactions, "records", None)
+    _transactions.records = None
+
+    if records:
+        lsns = [(wal, wal.append(ops)) for wal, ops in records.items()]
+        for wal, lsn in lsns:
+            wal.wait_durable(lsn)
+
+
+def abort_transaction():
+    """Drops the redo records of the calling thread's transaction."""
+    _transactions.records = None
+
+
+class WriteAheadLog:
+    """
+    Append-only redo log w/ group commit.
+
+    :param db_path: Directory of the database
+    """
+    file_name = "wal.log"
+
+    def __init__(self, db_path):
+        self.path = os.path.join(db_path, WriteAheadLog.file_name)
+
+        # LSN before the first line in the file. Rewritten w/ a header (and
+        # w/o a torn last line) so appends follow the last complete line
+        self._start_lsn, lines, is_clean = self._read_file()
+        if not is_clean:
+            self._write_file(self._start_lsn, lines)
+        self._fd = os.open(self.path, _OPEN_FLAGS, 0o644)
+
+        # Lines appended but not written yet, and sequence numbers (LSNs) of
+        # the last line appended and the last one synced
+        self._pending = []
+        self._last_lsn = self._start_lsn + len(lines)
+        self._durable_lsn = self._last_lsn
+
+        # Table name -> LSN up to which its changes are on disk
+        self._redo_lsns = dict()
+
+        self._waiters = 0
+        self._cond = threading.Condition()
+
+        # Serializes writes and syncs of the file
+        self._write_lock = threading.Lock()
+
+        self.stats = {
+            "lines": 0,
+            "commits": 0,
+            "syncs": 0,
+        }
+
+        # Background group commit (started on the first append)
+        self._thread = None
+        self._stopping = False
+
+    def log(self, op: dict):
+        """
+        Logs a change. Collected until commit inside a transaction, appended
+        right away (and synced w/o waiting) otherwise.
+        """
+        records = getattr(_transactions, "records", None)
+        if records is not None:
+            records.setdefault(self, []).append(op)
+        else:
+            self.append([op])
+
+    def append(self, ops: list[dict]) -> int:
+        """Appends a group of records as one line. Returns its LSN."""
+        line = (json.dumps(ops, separators=(",", ":")) + "\n").encode()
+
+        with self._cond:
+            self._pending.append(line)
+            self._last_lsn += 1
+
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(
+                    target=self._run, name="wal-group-commit", daemon=True)
+                self._thread.start()
+
+            return self._last_lsn
+
+    def commit(self, ops: list[dict]):
+        """Appends a group of records and waits until they're durable."""
+        self.wait_durable(self.append(ops))
+
+    def wait_durable(self, lsn: int):
+        """Waits until the line w/ the given LSN (and all before it) is synced."""
+        with self._cond:
+            if self._durable_lsn >= lsn:
+                return
+
+            self._waiters += 1
+            self._cond.notify_all()
+
+            while self._durable_lsn < lsn:
+                self._cond.wait()
+
+            self._waiters -= 1
+            self.stats["commits"] += 1
+
+    def read(self) -> list[tuple[int, list[dict]]]:
+        """
+        Reads the groups of records in the log w/ their LSNs, in order. A torn
+        last line (ie crash while appending) is ignored.
+        """
+        start_lsn, lines, _ = self._read_file()
+
+        return [(start_lsn + i + 1, json.loads(line)) for i, line in enumerate(lines)]
+
+    def get_last_lsn(self) -> int:
+        """Gets the LSN of the last line appended."""
+        with self._cond:
+            return self._last_lsn
+
+    def set_redo_lsn(self, name: str, lsn: int):
+        """
+        Records the LSN up to which the changes of a table are on disk (None ->
+        forgets the table, ie dropped).
+        """
+        with self._cond:
+            if lsn is None:
+                self._redo_lsns.pop(name, None)
+            else:
+                self._redo_lsns[name] = lsn
+
+    def get_redo_lsn(self) -> int:
+        """Gets the LSN up to which the changes of all tables are on disk."""
+        with self._cond:
+            return min(self._redo_lsns.values(), default=self._durable_lsn)
+
+    def sync(self):
+        """Writes and syncs everything appended so far (in the foreground)."""
+        with self._write_lock:
+            with self._cond:
+                lines, self._pending = self._pending, []
+                lsn = self._last_lsn
+
+            if lines:
+                data = memoryview(b"".join(lines))
+                while data:
+                    data = data[os.write(self._fd, data):]
+                os.fsync(self._fd)
+
+            with self._cond:
+                self._durable_lsn = max(self._durable_lsn, lsn)
+                self._cond.notify_all()
+
+                if lines:
+                    self.stats["lines"] += len(lines)
+                    self.stats["syncs"] += 1
+
+    def truncate(self, lsn: int = None):
+        """
+        Drops the lines up to an LSN once their changes are on disk (lines not
+        written yet too). The rest is copied to a new file that replaces the
+        log atomically.
+
+        :param lsn: Last LSN to drop (None -> empties the log, ie clean close)
+        """
+        with self._write_lock:
+            with self._cond:
+                if lsn is None or lsn > self._last_lsn:
+                    lsn = self._last_lsn
+
+                # Lines in the file are the ones synced (under the write lock)
+                num_lines = self._durable_lsn - self._start_lsn
+                if lsn > self._durable_lsn:
+                    del self._pending[:lsn - self._durable_lsn]
+                    self._durable_lsn = lsn
+                    self._cond.notify_all()
+
+            if lsn <= self._start_lsn:
+                return
+
+            kept = []
+            if lsn < self._start_lsn + num_lines:
+                _, lines, _ = self._read_file()
+                kept = lines[lsn - self._start_lsn:num_lines]
+
+            os.close(self._fd)
+            try:
+                self._write_file(lsn, kept)
+                self._start_lsn = lsn
+            finally:
+                self._fd = os.open(self.path, _OPEN_FLAGS, 0o644)
+
+    def close(self):
+        """Stops the group commit, syncs what's left and closes the file."""
+        with self._cond:
+            self._stopping = True
+            thread = self._thread
+            self._cond.notify_all()
+
+        if thread is not None:
+            thread.join()
+
+        self.sync()
+        os.close(self._fd)
+
+    def get_stats(self) -> dict[str, int]:
+        """Gets group commit statistics (lines per sync, commits)."""
+        with self._cond:
+            return dict(self.stats)
+
+    # Helpers ------------------
+
+    def _read_file(self) -> tuple[int, list[bytes], bool]:
+        """
+        Reads the start LSN and the complete lines of the log file, and whether
+        the file holds nothing else (a header and no torn line).
+        """
+        start_lsn, lines, is_clean = 0, [], False
+        if not os.path.exists(self.path):
+            return start_lsn, lines, is_clean
+
+        with open(self.path, "rb") as file:
+            header = file.readline()
+            try:
+                start_lsn = json.loads(header)["start"]
+                is_clean = True
+            except (ValueError, TypeError, KeyError):
+                file.seek(0)  # Written before logs had headers
+
+            for line in file:
+                try:
+                    json.loads(line)
+                except ValueError:
+                    line = b""
+
+                if not line.endswith(b"\n"):
+                    is_clean = False
+                    break
+                lines.append(line)
+
+        return start_lsn, lines, is_clean
+
+    def _write_file(self, start_lsn: int, lines: list[bytes]):
+        """Replaces the log file w/ a header and the given lines atomically."""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(json.dumps({"start": start_lsn}).encode() + b"\n")
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+    def _run(self):
+        """Syncs appended lines whenever commits wait, until stopped."""
+        while True:
+            with self._cond:
+                # Wait for a commit, or sync records outside transactions
+                # every so often
+                while not self._stopping and not self._waiters:
+                    if not self._cond.wait(config.WAL_FLUSH_INTERVAL) and self._pending:
+                        break
+
+                if self._stopping:
+                    return
+
+                # Let other commits join this sync, up to the latency target
+                if self._waiters and config.WAL_COMMIT_DELAY:
+                    deadline = time.monotonic() + config.WAL_COMMIT_DELAY
+                    while not self._stopping and (remaining := deadline - time.monotonic()) > 0:
+                        self._cond.wait(remaining)
+
+            try:
+                self.sync()
+            except OSError as e:
+                if config.PRINT_ERRORS:
+                    print(f"Error syncing the log: {e}")
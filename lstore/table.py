@@ -6,15 +6,23 @@ buffer and indices for performant querying.
 
 from typing import Literal
 
+import os
+import threading
+import multiprocessing
 import concurrent.futures
+from itertools import repeat
+from operator import itemgetter
 
 from lstore.index import Index
+from lstore.page import Page, TYPECODES
 from lstore.storage.buffer.buffer import Buffer
 from lstore.storage.record import Record
 from lstore.storage.rid import RID
 from lstore.storage.meta_col import MetaCol
-from lstore.storage.disk import Disk
+from lstore.storage.disk import Disk, get_sorted_column
 from lstore.storage.buffer.merge_mgr import MergeManager
+from lstore.storage.buffer.page_writer import PageWriter
+from lstore.storage.lock_manager import LockManager
 
 from lstore.index_types.index_config import IndexConfig
 
@@ -28,6 +36,7 @@ class Table:
     :param name:         # Table name
     :param num_columns:  # Number of DATA columns (all columns are integer)
     :param key:          # Index of table key in columns (ie primary key, ex 2 if 3rd col)
+    :param record_size:  # Slot width in bytes (8, 4, 2 or 1) for all data columns or per column
     """
     class DuplicateKeyError(Exception):
         """Custom exception for duplicate primary keys."""
@@ -37,13 +46,18 @@ class Table:
         """Custom exception for missing primary keys."""
         pass
 
+    class ValueWidthError(Exception):
+        """Custom exception for values that don't fit in a column's slots."""
+        pass
+
     def __init__(self, 
         name: str,
         num_columns: int, 
         key: int,
         db_path: str,
         index_config: IndexConfig,
-        delete_tracker: list[int] = None
+        delete_tracker: list[int] = None,
+        record_size: int | list[int] = None
     ):
         if key >= num_columns:
             raise IndexError("Key index is greater than the number of columns")
@@ -56,6 +70,16 @@ class Table:
         self.num_columns = num_columns
         self.num_total_cols = num_columns + len(MetaCol)
 
+        # Slot width in bytes of every column (including metadata)
+        self.record_sizes = self._get_record_sizes(record_size)
+
+        # Range of values of every data column (8 byte ones too, values are
+        # checked before anything is written)
+        self._col_ranges = [
+            (col, -(1 << (8 * size - 1)), (1 << (8 * size - 1)) - 1)
+            for col, size in enumerate(self.record_sizes[len(MetaCol):])
+        ]
+
         # Index for faster querying on primary key and possibly other columns
         # Creates a index for every column
         self.index = Index(self, 0, num_columns, index_config)
@@ -65,10 +89,18 @@ class Table:
 
         self.disk: Disk = Disk(self)
 
-        self.num_updates = 0
-        self.merge_threshold = config.MERGE_UPDATE_THRESHOLD
+        # Merges tail records into base pages in the background
         self.merge_mgr: MergeManager = MergeManager(self)
 
+        # Writes dirty pages and checkpoints in the background
+        self.page_writer: PageWriter = PageWriter(self)
+
+        # Record locks of running transactions
+        self.lock_mgr: LockManager = LockManager()
+
+        # Redo log of the database (set by it, None -> changes aren't logged)
+        self.wal = None
+
         if delete_tracker is None:
             self.delete_tracker = set()
         else:
@@ -77,22 +109,21 @@ class Table:
     def reconstruct_index(self, index_cols: list[int]):
         """
         Rebuilds the index from the existing data in the table's base pages.
+
+        Each column is scanned and sorted independently (in a process pool if
+        there are several columns, processes can be forked and no other thread
+        runs), then bulk loaded into its index.
         """
         if config.DEBUG_PRINT:
             print(f"Reconstructing index for table '{self.name}'...")
         self.index.clear()  # Clear existing indices
 
-        # Scan all base records and insert them into the index
-        records_by_column = {i: [] for i in range(self.num_columns)}
-
-        for rid, record_values in self.disk.scan_base_records(index_cols):
-            # for col_index, value in enumerate(record_values):
-            for col_index, value in zip(index_cols, record_values):
-                records_by_column[col_index].append((value, rid))
+        # Scan reads segments, so make sure they hold everything in memory
+        self.flush_pages()
 
-        # Bulk insert into indices
-        for col_index, records in records_by_column.items():
-            self.index.bulk_insert(col_index, records)
+        # Bulk insert sorted (value, rid) runs into indices
+        for col_index, (vals, rids) in zip(index_cols, self._get_sorted_columns(index_cols)):
+            self.index.bulk_insert(col_index, zip(vals, map(RID, rids)))
 
         if config.DEBUG_PRINT:
             print(f"Index reconstruction completed for table '{self.name}'.")
@@ -106,10 +137,14 @@ class Table:
         Raises an exception if something went wrong.
 
         :param columns: New data values
+
+        :return: RID of the new record
         """
         try:
             primary_key = columns[self.key]
 
+            self._validate_widths(columns)
+
             # Check if primary key exists (raises error if not)
             self._validate_primary_key_insert(primary_key)
 
@@ -120,10 +155,47 @@ class Table:
             for col in self.index.index_cols:
                 self.index.insert_val(
                     col, columns[col], rid, is_prim_key=(col == self.key))
+
+            self._log({"op": "insert", "rows": [list(columns)]})
+
+            return rid
         except Table.DuplicateKeyError as e:
             # print(e)
             raise
 
+    def insert_batch(self, rows: list[tuple[int]], copy_tail: bool = None) -> list[RID]:
+        """
+        Inserts many new records at once. All rows are validated before any
+        is written, then they are written a page at a time and added to the
+        indices in sorted runs (bulk loaded if an index is empty).
+
+        Raises an exception (and inserts nothing) if something went wrong.
+
+        :param rows: New data values for each record
+        :param copy_tail: Whether to write a copy of each record as first tail
+            (None for config.COPY_TAIL_ON_INSERT)
+
+        :return: RIDs of the new records
+        """
+        rows = [tuple(columns) for columns in rows]
+
+        for columns in rows:
+            self._validate_widths(columns)
+
+        self._validate_primary_keys_insert([columns[self.key] for columns in rows])
+
+        rids = self.buffer.insert_records(rows, copy_tail)
+
+        # Update indexes
+        for col in self.index.index_cols:
+            pairs = sorted(
+                zip((columns[col] for columns in rows), rids), key=itemgetter(0))
+            self.index.bulk_insert(col, pairs)
+
+        self._log({"op": "insert", "rows": [list(columns) for columns in rows]})
+
+        return rids
+
     def select(
         self,
         search_key: int,
@@ -144,16 +216,8 @@ class Table:
         # Get rid (point query) or rids (range query) via index
         rid_list = self.index.locate(search_key_idx, search_key)
 
-        records = []
-        for rid in rid_list:
-            try:
-                records.append(
-                    self.buffer.get_record(rid, proj_col_idx, rel_version)
-                )
-            except KeyError:
-                pass
-
-        return records
+        # Deleted records are skipped
+        return self.buffer.get_records(rid_list, proj_col_idx, rel_version)
     
     def select_range(
         self,
@@ -164,13 +228,41 @@ class Table:
         rel_version: int = 0  # Default to newest tail (lastest version)
     ) -> list[Record]:
         rid_list = self.index.locate_range(start_range, end_range, search_key_idx, is_prim_key = (search_key_idx == self.key))
-        records = []
-        for rid in rid_list:
-            records.append(
-                self.buffer.get_record(rid, proj_col_idx, rel_version)
-            )
 
-        return records
+        # Deleted records are skipped
+        with self.buffer.scan_hint():
+            return self.buffer.get_records(rid_list, proj_col_idx, rel_version)
+
+    def scan_range(
+        self,
+        start_range: int,
+        end_range: int,
+        search_key_idx: int,
+        agg_col_idx: int | None = None,
+        rel_version: int = 0  # Default to newest tail (lastest version)
+    ) -> tuple[int, int]:
+        """
+        Aggregates records with values in a range by scanning the columns
+        (instead of the index and whole records).
+
+        :param start_range: Smallest value to include
+        :param end_range: Largest value to include
+        :param search_key_idx: Index of column to filter on (latest values)
+        :param agg_col_idx: Index of column to sum (None to only count)
+        :param rel_version: Relative record version. 0 is latest, -<n> are prev
+
+        :return: Number of records in range and sum of their agg_col_idx values
+        """
+        # Only the pages holding keys in range can match when filtering on the
+        # key (other columns aren't indexed uniquely, so all pages are scanned)
+        pages_ids = None
+        if search_key_idx == self.key:
+            rid_list = self.index.locate_range(start_range, end_range, self.key, is_prim_key=True)
+            pages_ids = sorted({rid.pages_id for rid in rid_list if rid is not None})
+
+        with self.buffer.scan_hint():
+            return self.buffer.scan_range(
+                search_key_idx, start_range, end_range, agg_col_idx, rel_version, pages_ids)
 
     def update(self, rid: RID, columns: tuple[int], primary_key: int):
         """
@@ -185,6 +277,7 @@ class Table:
         try:
             # Check that primary key exists
             self._validate_primary_key_update(primary_key)
+            self._validate_widths(columns)
 
             # Get old values to delete from indexes
             proj_idx = [1 if columns[i] is not None else 0 for i in range(len(columns))]
@@ -209,12 +302,87 @@ class Table:
 
             self.buffer.update_record(rid, columns)
 
-            self.num_updates += 1
-            if self.num_updates >= self.merge_threshold:
-                self.merge()
+            self._log({"op": "update", "updates": [[primary_key, list(columns)]]})
         except Table.DuplicateKeyError as e:
             print(e)
 
+    def update_batch(self, updates: list[tuple[int, tuple[int | None]]]):
+        """
+        Updates many records at once. All updates are validated before any is
+        applied, then index changes are applied per column in sorted order and
+        tail records are appended a page at a time. Updates are applied in the
+        given order, so a key may be updated several times.
+
+        Raises an exception (and updates nothing) if something went wrong.
+
+        :param updates: (primary key VALUE, new data values) for each update
+        """
+        # Find all RIDs in one sorted sweep of the primary key index
+        rid_lists = self.index.locate_many(self.key, [key for key, _ in updates])
+
+        rids = []
+        for (primary_key, columns), rid_list in zip(updates, rid_lists):
+            if not rid_list:
+                e = f"No record with key {primary_key} exists, skipping update."
+                raise Table.MissingKeyError(e)
+
+            self._validate_widths(columns)
+            rids.append(rid_list[0])
+
+        # Get old values of indexed columns that are updated
+        index_cols = [
+            col for col in self.index.index_cols
+            if any(columns[col] is not None for _, columns in updates)
+        ]
+        proj_idx = [1 if col in index_cols else 0 for col in range(self.num_columns)]
+        current = {
+            record.rid: dict(zip(index_cols, record.columns))
+            for record in self.buffer.get_records(list(set(rids)), proj_idx, 0)
+        }
+
+        # Collect (old, new, rid) index changes of each column, and the keys
+        # of records whose primary key changes
+        changes = {col: [] for col in index_cols}
+        old_keys = {}
+        for rid, (primary_key, columns) in zip(rids, updates):
+            if rid not in current:
+                e = f"Record with key {primary_key} was deleted, skipping update."
+                raise Table.MissingKeyError(e)
+
+            for col in index_cols:
+                new_value = columns[col]
+                old_value = current[rid][col]
+                if new_value is None or new_value == old_value:
+                    continue
+
+                if col == self.key:
+                    old_keys.setdefault(rid, old_value)
+
+                changes[col].append((old_value, new_value, rid))
+                current[rid][col] = new_value
+
+        # Ensure new primary keys don't already exist once the batch is applied
+        reused_keys = self._validate_primary_keys_move(
+            {rid: current[rid][self.key] for rid in old_keys}, old_keys)
+        for primary_key in reused_keys:
+            self._drop_deleted_rids(primary_key)
+
+        for col, col_changes in changes.items():
+            col_changes.sort(key=itemgetter(0))
+
+            for old_value, new_value, rid in col_changes:
+                self.index.update_val(col, old_value, new_value, rid)
+
+        # Keys of deleted records are reused
+        self.delete_tracker.difference_update(reused_keys)
+
+        self.buffer.update_records(rids, [columns for _, columns in updates])
+
+        self._log({
+            "op": "update",
+            "updates": [[primary_key, list(columns)] for primary_key, columns in updates],
+        })
+
     def delete(self, rid: RID, primary_key):
         """
         Deletes the record with the given RID by marking it invalid
@@ -226,6 +394,8 @@ class Table:
 
             self.buffer.delete_record(rid)
             self.delete_tracker.add(primary_key)
+
+            self._log({"op": "delete", "keys": [primary_key]})
         except Table.DuplicateKeyError as e:
             print(e)
 
@@ -245,22 +415,22 @@ class Table:
         self.flush_pages()
 
     def merge(self):
-        # self.flush_pages()
-
+        """
+        Wakes the background merge of tail records into base pages (doesn't
+        wait for it).
+        """
         if config.DEBUG_PRINT:
             print("Running merge...")
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            merge_future = executor.submit(self.merge_mgr.merge)
-        
-            merge_future.add_done_callback(
-                self.merge_mgr.finalize_merge)        
-
-        self.num_updates = 0
+        self.merge_mgr.request_merge()
 
     def rollback_insert(self, primary_key):
         try:
-            self.index.indices[self.key].delete(primary_key)
+            # Inserted record is the only one w/ its key (deleted ones are
+            # dropped when a key is reused), the key is free again after
+            for rid in self.index.locate(self.key, primary_key):
+                self.buffer.delete_record(rid)
+            self._drop_deleted_rids(primary_key)
 
             if config.DEBUG_PRINT:
                 print(f"Rollback insert: Restored record for '{primary_key}' to original values.")
@@ -269,7 +439,7 @@ class Table:
 
     def rollback_update(self, primary_key):
         try:
-            rid = self.index.locate(self.key, primary_key)
+            rid = self.index.locate(self.key, primary_key)[0]
 
             # Change base rid to tails indir (ie rollback)
             self.buffer.revert_update(rid)
@@ -277,20 +447,153 @@ class Table:
             if config.DEBUG_PRINT:
                 print(f"Rollback update: Restored record {int(rid)} to original values.")
         except Exception as e:
-            print(f"Error rolling back update for record {int(rid)}: {e}")
+            print(f"Error rolling back update for record w/ key {primary_key}: {e}")
 
     # Helpers ------------------------------------------------
 
+    def _get_sorted_columns(self, cols: list[int]):
+        """
+        Gets (values, rids) sorted by value from base pages for each column.
+        """
+        workers = config.INDEX_REBUILD_WORKERS
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(cols))
+
+        # Only fork, spawned processes would rerun scripts without main guards.
+        # Forking while other threads run could leave their locks held in the
+        # children, so the pool is only used before background threads start
+        # (ie while opening the database)
+        if (workers <= 1 or "fork" not in multiprocessing.get_all_start_methods()
+                or threading.active_count() > 1):
+            return [self.disk.get_sorted_column(col) for col in cols]
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            return list(executor.map(get_sorted_column,
+                repeat(self.disk.path), repeat(self.record_sizes), cols))
+
+    def _get_record_sizes(self, record_size) -> list[int]:
+        """
+        Resolves slot widths for all columns. Metadata RIDs need a full 8 bytes
+        while the schema encoding only needs one bit per data column (+ sign).
+        """
+        if record_size is None:
+            record_size = config.RECORD_SIZE
+
+        if isinstance(record_size, int):
+            data_sizes = [record_size] * self.num_columns
+        else:
+            data_sizes = list(record_size)
+
+        if len(data_sizes) != self.num_columns:
+            raise ValueError(
+                f"Got {len(data_sizes)} record sizes for {self.num_columns} columns")
+
+        for size in data_sizes:
+            if size not in TYPECODES:
+                raise ValueError(
+                    f"Record size {size} not supported, use one of {sorted(TYPECODES)}")
+
+        # One schema encoding bit per column (+ sign for merged records)
+        max_columns = 8 * Page.max_record_size - 1
+        if self.num_columns > max_columns:
+            raise ValueError(
+                f"Tables have at most {max_columns} columns, got {self.num_columns}")
+
+        schema_size = min(
+            size for size in TYPECODES if 8 * size - 1 >= self.num_columns)
+
+        meta_sizes = [None] * len(MetaCol)
+        meta_sizes[MetaCol.INDIR] = Page.max_record_size
+        meta_sizes[MetaCol.RID] = Page.max_record_size
+        meta_sizes[MetaCol.SCHEMA] = schema_size
+        meta_sizes[MetaCol.BASE_RID] = Page.max_record_size
+
+        return meta_sizes + data_sizes
+
+    def _log(self, op: dict):
+        """Logs a change to the redo log (if any), by primary key."""
+        if self.wal is not None:
+            op["table"] = self.name
+            self.wal.log(op)
+
+    def _validate_widths(self, columns):
+        for col, low, high in self._col_ranges:
+            val = columns[col]
+
+            if val is not None and not low <= val <= high:
+                e = f"Value {val} in column {col} doesn't fit in {self.record_sizes[len(MetaCol) + col]} byte(s)."
+                raise Table.ValueWidthError(e)
+
     def _validate_primary_key_insert(self, primary_key):
         if self.index.locate(self.key, primary_key):
             # If primary key exists but was deleted, remove from tracker and allow
             if primary_key in self.delete_tracker:
                 self.delete_tracker.discard(primary_key)
+                self._drop_deleted_rids(primary_key)
                 return
 
             e = f"A record with key {primary_key} already exists, skipping insert."
             raise Table.DuplicateKeyError(e)
 
+    def _validate_primary_keys_insert(self, primary_keys):
+        seen = set()
+        for primary_key in primary_keys:
+            if primary_key in seen or (
+                self.index.locate(self.key, primary_key)
+                and primary_key not in self.delete_tracker
+            ):
+                e = f"A record with key {primary_key} already exists, skipping insert."
+                raise Table.DuplicateKeyError(e)
+
+            seen.add(primary_key)
+
+        # Keys of deleted records are reused
+        for primary_key in seen & self.delete_tracker:
+            self._drop_deleted_rids(primary_key)
+        self.delete_tracker.difference_update(seen)
+
+    def _validate_primary_keys_move(self, new_keys: dict, old_keys: dict) -> set:
+        """
+        Checks that primary keys stay unique once records move from their old
+        to their new keys all at once (so keys may be swapped). Changes nothing.
+
+        :param new_keys: New primary key of each moved record's RID
+        :param old_keys: Primary key of each moved record's RID before moving
+
+        :return: New keys that belonged to deleted records (to be reused)
+        """
+        vacated = set(old_keys.values())
+
+        seen = set()
+        reused = set()
+        for new_key in new_keys.values():
+            if new_key in seen:
+                e = f"A record with key {new_key} already exists, skipping update."
+                raise Table.DuplicateKeyError(e)
+            seen.add(new_key)
+
+            if new_key in vacated or not self.index.locate(self.key, new_key):
+                continue
+
+            if new_key not in self.delete_tracker:
+                e = f"A record with key {new_key} already exists, skipping update."
+                raise Table.DuplicateKeyError(e)
+            reused.add(new_key)
+
+        return reused
+
+    def _drop_deleted_rids(self, primary_key):
+        """
+        Drops the deleted records of a primary key that's reused from the
+        primary key index, so the key only locates its live record.
+        """
+        index = self.index.indices[self.key]
+        for rid in list(index.get(primary_key)):
+            index.delete(primary_key, rid)
+
     def _validate_primary_key_update(self, primary_key):
         if not self.index.locate(self.key, primary_key):
             e = f"No record with key {primary_key} exists, skipping update."
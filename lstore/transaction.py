@@ -1,6 +1,7 @@
 import time
 
 from lstore.storage.thread_local import ThreadLocalSingleton
+from lstore.storage import wal
 
 class Transaction:
 
@@ -28,23 +29,33 @@ class Transaction:
 
     # If you choose to implement this differently this method must still return True if transaction commits or False on abort
     def run(self):
-        for query, table, args in self.queries:
-            # If transaction caused an issue with an early transaction, rollback
-            if self.state == "abort":
-                self.abort()
-
-            result = query(*args)
-            
-            # If the query fails, the transaction should abort
-            if result is False:
-                return self.abort()
-            
-            # Log changes for rollback
-            if query.__name__ == "insert":
-                self.insert_logs.append((query, table, args))
-            if query.__name__ in ("update", "delete"):
-                self.update_logs.append((query, table, args))
-            
+        # Retried after conflicts
+        self.state = "active"
+
+        # Redo records are logged at once on commit
+        wal.begin_transaction()
+
+        try:
+            for query, table, args in self.queries:
+                # If transaction caused an issue with an early transaction, rollback
+                if self.state == "abort":
+                    self.abort()
+
+                result = query(*args)
+
+                # If the query fails, the transaction should abort
+                if result is False:
+                    return self.abort()
+
+                # Log changes for rollback
+                if query.__name__ == "insert":
+                    self.insert_logs.append((query, table, args))
+                if query.__name__ in ("update", "delete"):
+                    self.update_logs.append((query, table, args))
+        except BaseException:
+            wal.abort_transaction()
+            raise
+
         return self.commit()
 
     def abort(self):
@@ -54,21 +65,22 @@ class Transaction:
         self.state = "aborted"
         print("Transaction aborted. Rolling back changes...")
 
-        # Rollback insertions
-        for query, table, args in reversed(self.insert_logs):
-            pass
+        # Changes never reach the redo log
+        wal.abort_transaction()
 
-        # Rollback updates
+        # Rollback updates (first, inserted records may have been updated)
         for query, table, args in reversed(self.update_logs):
             primary_key = args[0]
             table.rollback_update(primary_key)
 
+        # Rollback insertions
+        for query, table, args in reversed(self.insert_logs):
+            table.rollback_insert(args[table.key])
+
         self.insert_logs.clear()
         self.update_logs.clear()
 
-        thread_local = ThreadLocalSingleton.get_instance()
-        for lock in reversed(thread_local.held_locks):
-            lock.release()
+        self._release_locks()
 
         return False
 
@@ -76,11 +88,18 @@ class Transaction:
         """
         Finalizes the transaction and commits changes to the database.
         """
+        # Durable once the redo records are synced (w/ other commits)
+        wal.commit_transaction()
+
         self.state = "committed"
         print("Transaction committed successfully.")
         # Clear logs since changes are committed
         self.insert_logs.clear()
         self.update_logs.clear()
+
+        # Strict 2PL, record locks are held until now
+        self._release_locks()
+
         return True
 
     def log_update(self, rid, original_columns):
@@ -98,3 +117,13 @@ class Transaction:
         :param record: The full record being deleted.
         """
         self.delete_logs.append((rid, record))
+
+    @staticmethod
+    def _release_locks():
+        """
+        Releases the record locks held by the running transaction, and the
+        pages it changed (written to disk from now on).
+        """
+        held_locks = ThreadLocalSingleton.get_instance().held_locks
+        for lock in list(held_locks.values()):
+            lock.release()
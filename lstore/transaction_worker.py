@@ -2,7 +2,7 @@ import time
 import threading
 
 from lstore.storage.thread_local import ThreadLocalSingleton
-from lstore.storage.thread_lock import RollbackCurrentTransaction, RollbackOtherTransaction
+from lstore.storage.thread_lock import RollbackCurrentTransaction
 
 
 class TransactionWorker:
@@ -18,8 +18,6 @@ class TransactionWorker:
         else:
             self.transactions = transactions
 
-        self.priority_queue = []
-
         self.result = 0
         self.thread = None  # Thread for running transactions
 
@@ -55,14 +53,7 @@ class TransactionWorker:
             # each transaction returns True if committed or False if aborted
             self._run_transaction(transaction)
 
-            # If conflicts caused transactions to be pushed to queue, do them now
-            for priority_transaction in self.priority_queue:
-                self._run_transaction(priority_transaction)
-            self.priority_queue = []
-
-            # Release all locks acquired during transaction
-            for lock in self._thread_local.held_locks:
-                lock.release()
+        self._thread_local.transaction = None
 
         # stores the number of transactions that committed
         self.result = len(list(filter(lambda x: x, self.stats)))
@@ -71,21 +62,18 @@ class TransactionWorker:
     # Helpers -------------------------
 
     def _run_transaction(self, transaction):
-        try:
-            self.stats.append(transaction.run())
-        except RollbackCurrentTransaction as error:
-            other_transaction = error.other_transaction
-
-            transaction.abort()
-
-            while other_transaction.state != "commited":
-                time.sleep(0.1)
-
-            self.priority_queue.append(transaction)
-        except RollbackOtherTransaction as error:
-            other_transaction = error.transaction
-
-            other_transaction.state = "abort"
-
-            self.priority_queue.append(other_transaction)
-            
\ No newline at end of file
+        """
+        Runs a transaction until it commits or aborts on its own, retrying it
+        once the older transaction it conflicted with has ended.
+        """
+        while True:
+            try:
+                self.stats.append(transaction.run())
+                return
+            except RollbackCurrentTransaction as error:
+                other_transaction = error.other_transaction
+
+                transaction.abort()
+
+                while other_transaction.state == "active":
+                    time.sleep(0.001)
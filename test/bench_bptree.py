@@ -0,0 +1,89 @@
+"""
+Benchmark of B+ tree node sizes for the key distributions of our workloads.
+
+Run with: python test/bench_bptree.py [num_keys]
+"""
+
+import sys
+import os
+
+# Add root dir to path to find lstore
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# -----------------------
+
+import random
+
+from lstore.index_types.bptree import BPTreeIndex
+
+import test_util
+
+NODE_SIZES = (4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def gen_distributions(num_keys: int):
+    """Key distributions: (name, keys to insert, keys to look up)"""
+    # Sequential primary keys (ex student ids), inserted in order
+    sequential = list(range(906659671, 906659671 + num_keys))
+
+    # Unique keys inserted in random order (ex shuffled primary keys)
+    shuffled, _ = test_util.gen_keys(num_keys)
+
+    # Few distinct values with many duplicates (ex grade columns)
+    grades = [random.randint(0, 100) for _ in range(num_keys)]
+
+    return (
+        ("sequential", sequential),
+        ("shuffled", shuffled),
+        ("duplicates", grades),
+    )
+
+
+def bench(keys: list[int], node_size: int):
+    index = BPTreeIndex(node_size)
+
+    @test_util.timeit
+    def insert_all():
+        for rid, key in enumerate(keys):
+            index.insert(key, rid)
+
+    @test_util.timeit
+    def get_all():
+        for key in lookups:
+            index.get(key)
+
+    @test_util.timeit
+    def range_all():
+        for low in range_starts:
+            index.get_range_val(low, low + 100)
+
+    lookups = random.sample(keys, min(len(keys), 10_000))
+    range_starts = random.sample(keys, min(len(keys), 1_000))
+
+    _, insert_time = insert_all()
+    _, get_time = get_all()
+    _, range_time = range_all()
+
+    return insert_time, get_time, range_time
+
+
+def main():
+    num_keys = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    random.seed(42)
+
+    for name, keys in gen_distributions(num_keys):
+        print(f"\n{name} ({num_keys:,} keys)")
+        print(f"{'node size':>10} {'insert (s)':>12} {'get 10k (s)':>12} {'range 1k (s)':>13}")
+
+        results = []
+        for node_size in NODE_SIZES:
+            times = bench(keys, node_size)
+            results.append((sum(times), node_size))
+
+            print(f"{node_size:>10} {times[0]:>12.4f} {times[1]:>12.4f} {times[2]:>13.4f}")
+
+        print(f"Best node size: {min(results)[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Unit tests for the B+ tree index
+"""
+
+import sys
+import os
+
+# Add root dir to path to find lstore
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# -----------------------
+
+import random
+import threading
+
+from lstore.index_types.bptree import BPTreeIndex
+
+
+class TestBPTree:
+    # Config
+    num_keys = 2_000
+    node_sizes = (3, 4, 10, 100)
+
+    random.seed(42)
+    pairs = [(random.randint(-500, 500), rid) for rid in range(num_keys)]
+
+    def test_bulk_load(self):
+        for n in self.node_sizes:
+            for fill_factor in (0.5, 0.9, 1.0):
+                index = BPTreeIndex(n, fill_factor)
+                index.bulk_load(self.pairs)
+
+                self._check_tree(index)
+                self._check_contents(index, self.pairs)
+
+    def test_insert_after_bulk_load(self):
+        half = self.num_keys // 2
+
+        for n in self.node_sizes:
+            index = BPTreeIndex(n, 1.0)
+            index.bulk_load(self.pairs[:half])
+
+            for val, rid in self.pairs[half:]:
+                index.insert(val, rid)
+
+            self._check_tree(index)
+            self._check_contents(index, self.pairs)
+
+    def test_bulk_load_empty(self):
+        index = BPTreeIndex(10)
+        index.bulk_load([])
+
+        assert index.is_empty()
+        assert index.get(1) == []
+
+    def test_get_during_insert(self):
+        index = BPTreeIndex(10)
+        index.insert(1, 0)
+        index.insert(2, 1)
+
+        # A writer inserted the key but not its values yet
+        leaf = index.tree.root
+        leaf.keys.append(3)
+        writer = threading.Timer(0.05, leaf.values.append, [[2]])
+        writer.start()
+
+        assert index.get(3) == [2]
+        writer.join()
+
+    def test_get_many(self):
+        for n in self.node_sizes:
+            index = BPTreeIndex(n, 1.0)
+            index.bulk_load(self.pairs)
+
+            # Unsorted w/ repeats, missing keys and keys past both ends
+            vals = [val for val, _ in self.pairs[::7]] + [-1000, 1000, 3, 3, -500]
+            random.shuffle(vals)
+
+            assert index.get_many(vals) == [index.get(val) for val in vals]
+            assert index.get_many([]) == []
+
+    def test_concurrent_insert_and_read(self):
+        num_threads = 4
+        chunk = self.num_keys // num_threads
+
+        for n in self.node_sizes:
+            index = BPTreeIndex(n)
+            errors = []
+
+            def insert_chunk(pairs):
+                for val, rid in pairs:
+                    index.insert(val, rid)
+
+            def read_all():
+                # Readers only ever see whole, sorted leaves
+                try:
+                    for _ in range(20):
+                        keys = [key for key, _ in index.scan_all()]
+                        assert keys == sorted(keys)
+                        index.get_range_val(-100, 100)
+                        index.get(0)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=insert_chunk,
+                                        args=(self.pairs[i * chunk:(i + 1) * chunk],))
+                       for i in range(num_threads)]
+            threads += [threading.Thread(target=read_all) for _ in range(2)]
+
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            assert not errors
+            self._check_tree(index)
+            self._check_contents(index, self.pairs, ordered=False)
+
+    def test_delete(self):
+        for n in self.node_sizes:
+            index = BPTreeIndex(n)
+            for val, rid in self.pairs:
+                index.insert(val, rid)
+
+            # Delete half, tree stays balanced and at least half full
+            pairs = self.pairs[:]
+            random.shuffle(pairs)
+            half = self.num_keys // 2
+            for val, rid in pairs[:half]:
+                index.delete(val, rid)
+
+            # Remaining pairs in insertion order (latest rid per key)
+            deleted = set(pairs[:half])
+            remaining = [pair for pair in self.pairs if pair not in deleted]
+
+            self._check_tree(index, half_full=True)
+            self._check_contents(index, remaining)
+
+            # Delete the rest, only an empty root leaf is left
+            for val, rid in pairs[half:]:
+                index.delete(val, rid)
+
+            assert index.is_empty()
+            assert index.scan_all() == []
+
+    def test_update_churn(self):
+        for n in self.node_sizes:
+            index = BPTreeIndex(n)
+            pairs = dict()
+            for val, rid in self.pairs:
+                index.insert(val, rid)
+                pairs[rid] = val
+
+            height = self._get_height(index)
+
+            # Updates to new values don't leave empty keys behind
+            for _ in range(3):
+                for rid, val in pairs.items():
+                    new_val = val + 1_000
+                    index.update(val, new_val, rid)
+                    pairs[rid] = new_val
+
+            self._check_tree(index, half_full=True)
+            self._check_contents(index, [(val, rid) for rid, val in pairs.items()])
+            assert self._get_height(index) <= height
+
+    def test_concurrent_delete(self):
+        num_threads = 4
+        chunk = self.num_keys // num_threads
+
+        for n in self.node_sizes:
+            index = BPTreeIndex(n)
+            for val, rid in self.pairs:
+                index.insert(val, rid)
+
+            def delete_chunk(pairs):
+                for val, rid in pairs:
+                    index.delete(val, rid)
+
+            # Every other chunk is deleted while the rest is read
+            deleted = [self.pairs[i * chunk:(i + 1) * chunk] for i in range(0, num_threads, 2)]
+            threads = [threading.Thread(target=delete_chunk, args=(pairs,)) for pairs in deleted]
+            threads += [threading.Thread(target=index.scan_all) for _ in range(2)]
+
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            remaining = [self.pairs[i * chunk:(i + 1) * chunk] for i in range(1, num_threads, 2)]
+            self._check_tree(index, half_full=True)
+            self._check_contents(index, [pair for pairs in remaining for pair in pairs])
+
+    # Helpers -------------
+
+    def _get_height(self, index: BPTreeIndex):
+        node, height = index.tree.root, 1
+        while not node.is_leaf:
+            node, height = node.values[0], height + 1
+
+        return height
+
+    def _check_contents(self, index: BPTreeIndex, pairs, ordered=True):
+        expected = dict()
+        for val, rid in pairs:
+            expected.setdefault(val, []).append(rid)
+
+        # Point queries
+        for val, rids in expected.items():
+            assert sorted(index.get(val)) == sorted(rids)
+
+        # Full scan (sorted by key)
+        assert sorted(index.scan_all()) == sorted(pairs)
+        assert [key for key, _ in index.scan_all()] == sorted(val for val, _ in pairs)
+
+        # Range query (returns latest rid per key, any rid if inserted concurrently)
+        low, high = -100, 100
+        in_range = [rids for val, rids in sorted(expected.items()) if low <= val <= high]
+        results = index.get_range_val(low, high)
+        if ordered:
+            assert sorted(results) == sorted(rids[-1] for rids in in_range)
+        else:
+            # Results are in key order
+            assert len(results) == len(in_range)
+            assert all(rid in rids for rid, rids in zip(results, in_range))
+
+    def _check_tree(self, index: BPTreeIndex, half_full=False):
+        """Checks node sizes, key order, separators and parent pointers."""
+        tree = index.tree
+
+        def check(node, low, high, depth):
+            assert node.keys == sorted(node.keys)
+            assert len(node.keys) <= tree.n - 1
+            if half_full and node is not tree.root:
+                assert len(node.keys) >= tree._min_keys(node)
+            if node.is_leaf:
+                assert node.keys or node is tree.root
+            assert all(low is None or key >= low for key in node.keys)
+            assert all(high is None or key < high for key in node.keys)
+
+            if node.is_leaf:
+                assert len(node.keys) == len(node.values)
+                return [depth]
+
+            assert len(node.values) == len(node.keys) + 1
+
+            bounds = [low] + node.keys + [high]
+            depths = []
+            for i, child in enumerate(node.values):
+                assert child.parent_node is node
+                depths.extend(check(child, bounds[i], bounds[i + 1], depth + 1))
+
+            return depths
+
+        # All leaves at the same depth
+        assert len(set(check(tree.root, None, None, 0))) == 1
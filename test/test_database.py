@@ -1,8 +1,22 @@
+import os
+import json
+import time
+import threading
+import shutil
+import tempfile
+import concurrent.futures
 import unittest
+from unittest.mock import patch
+from lstore import config
 from lstore.db import Database
 from lstore.query import Query
+from lstore.table import Table
 from lstore.transaction import Transaction
 from lstore.transaction_worker import TransactionWorker
+from lstore.storage.meta_col import MetaCol
+from lstore.index_types.index_config import IndexConfig
+from lstore.storage.thread_local import ThreadLocalSingleton
+from lstore.storage.thread_lock import RollbackCurrentTransaction
 from random import randint, seed
 
 
@@ -15,6 +29,18 @@ class TestDatabase(unittest.TestCase):
     def tearDown(self):
         self.db.close()
 
+    def _open_temp_db(self):
+        """Reopens the database in a fresh directory removed after the test."""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        self.db.close()
+        self.db = Database()
+        self.db.open(temp_dir.name)
+        self.table = self.db.create_table('TestTable', 5, 0)
+
+        return temp_dir.name
+
     # Test case: Basic table creation and metadata validation
     def test_table_creation(self):
         self.assertEqual(self.table.name, 'TestTable')
@@ -93,6 +119,137 @@ class TestDatabase(unittest.TestCase):
         worker.join()
         self.assertEqual(worker.result, 10)  # Ensure all transactions committed
 
+    # Test case: Transactions on different records of the same pages don't conflict
+    def test_record_locks_in_shared_pages(self):
+        self._open_temp_db()
+        query = Query(self.table)
+        query.insert_many([(key, 0, 0, 0, 0) for key in range(200)])
+
+        workers = []
+        for first in (0, 100):
+            transactions = []
+            for key in range(first, first + 100):
+                transaction = Transaction()
+                transaction.add_query(query.select, self.table, key, 0, [1, 1, 1, 1, 1])
+                transaction.add_query(query.update, self.table, key, None, key, None, None, None)
+                transactions.append(transaction)
+            workers.append(TransactionWorker(transactions))
+
+        for worker in workers:
+            worker.run()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([worker.result for worker in workers], [100, 100])
+        self.assertEqual(self.table.lock_mgr.get_stats()["conflicts"], 0)
+        for key in range(200):
+            self.assertEqual(query.select(key, 0, [0, 1, 0, 0, 0])[0].columns, [key])
+
+    # Test case: Older transactions wait for record locks, younger ones roll back
+    def test_record_lock_wait_die(self):
+        self._open_temp_db()
+        lock_mgr = self.table.lock_mgr
+        thread_local = ThreadLocalSingleton.get_instance()
+
+        older, younger = Transaction(), Transaction()
+        younger.ts = older.ts + 1
+
+        thread_local.transaction = younger
+        lock_mgr.acquire_exclusive(7)
+
+        # The older transaction waits until the younger one releases it
+        acquired = threading.Event()
+        release = threading.Event()
+        def run_older():
+            ThreadLocalSingleton.get_instance().transaction = older
+            lock_mgr.acquire_shared(7)
+            acquired.set()
+            release.wait()
+            lock_mgr.release(7)
+
+        thread = threading.Thread(target=run_older)
+        thread.start()
+        self.assertFalse(acquired.wait(0.2))
+
+        lock_mgr.release(7)
+        self.assertTrue(acquired.wait(5))
+        self.assertEqual(thread_local.held_locks, {})
+
+        # Shared locks are compatible, writing rolls back the younger one
+        lock_mgr.acquire_shared(7)
+        with self.assertRaises(RollbackCurrentTransaction):
+            lock_mgr.acquire_exclusive(7)
+
+        lock_mgr.release(7)
+        release.set()
+        thread.join()
+        thread_local.transaction = None
+
+    # Test case: Transactions rolled back after inserting are retried w/o duplicates
+    def test_retry_after_insert(self):
+        self._open_temp_db()
+        query = Query(self.table)
+        query.insert(5, 0, 0, 0, 0)
+
+        lock_mgr = self.table.lock_mgr
+        thread_local = ThreadLocalSingleton.get_instance()
+
+        # An older transaction holds the record the worker updates
+        older = Transaction()
+        thread_local.transaction = older
+        lock_mgr.acquire_exclusive(int(self.table.index.locate(0, 5)[0]))
+
+        transaction = Transaction()
+        transaction.add_query(query.insert, self.table, *[6, 1, 1, 1, 1])
+        transaction.add_query(query.update, self.table, 5, *[None, 2, None, None, None])
+        worker = TransactionWorker([transaction])
+        worker.run()
+
+        # The insert is undone while the worker waits to retry
+        for _ in range(100):
+            if not self.table.index.locate(0, 6):
+                break
+            time.sleep(0.01)
+        inserted = query.select(6, 0, [1, 1, 1, 1, 1])
+
+        older.state = "committed"
+        older._release_locks()
+        thread_local.transaction = None
+        worker.join()
+
+        self.assertFalse(inserted)
+        self.assertEqual(worker.result, 1)
+        self.assertEqual(query.select(6, 0, [1, 1, 1, 1, 1])[0].columns, [6, 1, 1, 1, 1])
+        self.assertEqual(query.select(5, 0, [0, 1, 0, 0, 0])[0].columns, [2])
+
+    # Test case: Inserts lock their key first, so a key deleted by a running transaction isn't reused
+    def test_insert_locks_key_first(self):
+        self._open_temp_db()
+        query = Query(self.table)
+        query.insert(6, 0, 0, 0, 0)
+
+        thread_local = ThreadLocalSingleton.get_instance()
+        older, younger = Transaction(), Transaction()
+        younger.ts = older.ts + 1
+
+        thread_local.transaction = older
+        query.delete(6)
+        older.update_logs.append((query.delete, self.table, (6,)))
+
+        # Rolled back before inserting anything
+        thread_local.transaction = younger
+        with self.assertRaises(RollbackCurrentTransaction):
+            query.insert(6, 1, 1, 1, 1)
+        self.assertEqual(len(self.table.index.locate(0, 6)), 1)
+
+        thread_local.transaction = older
+        older.abort()
+        thread_local.transaction = None
+
+        self.assertEqual(thread_local.held_locks, {})
+        self.assertEqual(query.select(6, 0, [1, 1, 1, 1, 1])[0].columns, [6, 0, 0, 0, 0])
+        self.assertEqual(query.count(0, 10, 0), 1)
+
     # Test case: Sum operation
     def test_sum_operation(self):
         query = Query(self.table)
@@ -121,6 +278,804 @@ class TestDatabase(unittest.TestCase):
         selected_record = query.select(1, 0, [1, 1, 1, 1, 1])[0]
         self.assertEqual(selected_record.columns, [1, 11, 20, 30, 40])
 
+    # Test case: Narrow column widths round trip and reject overflowing values
+    def test_narrow_record_size(self):
+        self._open_temp_db()
+        table = self.db.create_table('NarrowTable', 3, 0, record_size=[4, 1, 2])
+        query = Query(table)
+        record = [1, -100, 30000]
+        query.insert(*record)
+        selected_record = query.select(1, 0, [1, 1, 1])[0]
+        self.assertEqual(selected_record.columns, record)
+        with self.assertRaises(Exception):  # 200 doesn't fit in a signed byte
+            query.insert(*[2, 200, 0])
+
+    # Test case: Values too wide for 8 byte slots are rejected before anything is written
+    def test_wide_values_rejected(self):
+        with tempfile.TemporaryDirectory() as path:
+            db = Database()
+            db.open(path)
+            query = Query(db.create_table('WideTable', 2, 0))
+
+            with self.assertRaises(Table.ValueWidthError):
+                query.insert(1, 2 ** 63)
+            with self.assertRaises(Table.ValueWidthError):
+                query.insert_many([(1, 0), (2, -2 ** 63 - 1)])
+
+            query.insert(2, 5)
+            with self.assertRaises(Table.ValueWidthError):
+                query.update_many([(2, [None, 2 ** 63])])
+            with self.assertRaises(Table.ValueWidthError):
+                query.update(2, None, 2 ** 64)
+
+            self.assertEqual(query.count(0, 10, 0), 1)
+            self.assertEqual(query.select(2, 0, [1, 1])[0].columns, [2, 5])
+            self.assertEqual(query.insert(1, 2 ** 63 - 1), True)
+
+            # One schema encoding bit per column
+            with self.assertRaises(ValueError):
+                db.create_table('ManyColumnsTable', 70, 0)
+            db.close()
+
+            # Metadata w/o slot widths is from the old 16 byte slot format
+            metadata_path = os.path.join(path, 'metadata.json')
+            with open(metadata_path) as file:
+                metadata = json.load(file)
+            del metadata['tables']['WideTable']['record_sizes']
+            with open(metadata_path, 'w') as file:
+                json.dump(metadata, file)
+
+            with self.assertRaises(ValueError):
+                Database().open(path)
+
+    # Test case: Sum versions and count skip deleted records and follow updates
+    def test_sum_and_count_after_updates(self):
+        self._open_temp_db()
+        table = self.db.create_table('ScanTable', 3, 0)
+        query = Query(table)
+        for key in range(1, 6):
+            query.insert(key, 10 * key, 1)
+        query.update(2, None, 100, None)
+        query.update(3, None, None, 2)
+        query.delete(4)
+
+        self.assertEqual(query.sum(1, 5, 1), 10 + 100 + 30 + 50)
+        self.assertEqual(query.sum_version(1, 5, 1, -1), 10 + 20 + 30 + 50)
+        self.assertEqual(query.sum(2, 3, 2), 1 + 2)
+        self.assertEqual(query.count(1, 1, 2), 3)
+        self.assertEqual(query.count(10, 50, 1), 3)
+
+    # Test case: Scans filtering on the key only read the pages holding keys in range
+    def test_sum_scans_key_range_pages(self):
+        self._open_temp_db()
+        table = self.db.create_table('KeyScanTable', 2, 0)
+        query = Query(table)
+        query.insert_many([(key, 1) for key in range(4 * 511)])
+        query.update(0, 10 ** 6, 2)
+
+        bufferpool = table.buffer.bufferpool
+        def scanned_pages(scan, *args):
+            with patch.object(bufferpool, '_latch_entry', wraps=bufferpool._latch_entry) as latch:
+                result = scan(*args)
+            return result, {call.args[0] for call in latch.call_args_list}
+
+        second_page = table.index.locate(0, 511)[0].pages_id
+        self.assertEqual(scanned_pages(query.sum, 511, 1021, 1), (511, {second_page}))
+
+        first_page = table.index.locate(0, 10 ** 6)[0].pages_id
+        self.assertEqual(scanned_pages(query.sum, 10 ** 5, 10 ** 6, 1), (2, {first_page}))
+        self.assertEqual(scanned_pages(query.sum, -5, -1, 1), (0, set()))
+
+        # Other columns aren't filtered through the index
+        count, pages_ids = scanned_pages(query.count, 1, 1, 1)
+        self.assertEqual((count, len(pages_ids)), (4 * 511 - 1, 4))
+
+    # Test case: Inserts w/o tail copies don't create tail pages until updated
+    def test_insert_without_tail_copy(self):
+        self._open_temp_db()
+        table = self.db.create_table('NoCopyTable', 3, 0)
+        query = Query(table)
+        for key in range(1, 11):
+            query.insert(key, 10 * key, 1)
+        bufferpool = table.buffer.bufferpool
+        self.assertFalse(bufferpool.tail_trackers)
+
+        query.update(3, None, 31, None)
+        self.assertEqual(len(bufferpool.tail_trackers), 1)
+        self.assertEqual(query.select_version(3, 0, [0, 1, 0], -1)[0].columns, [30])
+        self.assertEqual(query.select_version(3, 0, [0, 1, 0], -5)[0].columns, [30])
+        self.assertEqual(query.select_version(4, 0, [0, 1, 0], -1)[0].columns, [40])
+
+    # Test case: Range select returns versions in key order and skips deleted
+    def test_select_range_versions(self):
+        self._open_temp_db()
+        table = self.db.create_table('RangeTable', 3, 0)
+        query = Query(table)
+        for key in range(1, 6):
+            query.insert(key, 10 * key, 1)
+        query.update(2, None, 100, None)
+        query.update(2, None, 200, None)
+        query.delete(4)
+
+        records = query.select_version_range(1, 5, 0, [1, 1, 0], 0)
+        self.assertEqual([r.columns for r in records], [[1, 10], [2, 200], [3, 30], [5, 50]])
+        records = query.select_version_range(1, 5, 0, [0, 1, 0], -1)
+        self.assertEqual([r.columns for r in records], [[10], [100], [30], [50]])
+        records = query.select_version_range(1, 5, 0, [0, 1, 0], -2)
+        self.assertEqual([r.columns for r in records], [[10], [20], [30], [50]])
+
+    # Test case: Bulk insert across pages, w/ and w/o the initial tail copy
+    def test_insert_many(self):
+        self._open_temp_db()
+        for copy_tail in (True, False):
+            table = self.db.create_table(f'BulkTable{int(copy_tail)}', 3, 0)
+            query = Query(table)
+            self.assertTrue(query.insert_many(
+                [(key, key % 7, 1) for key in range(1, 1201)], copy_tail=copy_tail))
+
+            query.update(600, None, 100, None)
+            query.delete(700)
+
+            self.assertEqual(query.select(600, 0, [1, 1, 1])[0].columns, [600, 100, 1])
+            self.assertEqual(query.select_version(600, 0, [0, 1, 0], -1)[0].columns, [600 % 7])
+            self.assertEqual(query.select(1200, 0, [1, 1, 1])[0].columns, [1200, 1200 % 7, 1])
+            self.assertEqual(query.count(1, 1200, 0), 1199)
+            self.assertEqual(query.sum(1, 1200, 2), 1199)
+
+            # Duplicate keys (in table or batch) fail without inserting anything
+            with self.assertRaises(Exception):
+                query.insert_many([(1201, 0, 0), (1, 0, 0)])
+            with self.assertRaises(Exception):
+                query.insert_many([(1202, 0, 0), (1202, 0, 0)])
+            self.assertFalse(query.select(1201, 0, [1, 1, 1]))
+
+    # Test case: Batched updates (repeated keys, secondary index, all or none)
+    def test_update_many(self):
+        self._open_temp_db()
+        query = Query(self.table)
+        query.insert_many([(key, 0, key, 0, 0) for key in range(1, 1001)])
+
+        updates = [(key, (None, key % 3, None, None, None)) for key in range(1000, 0, -1)]
+        updates += [(5, (None, None, 500, None, None)), (5, (None, 9, None, None, None))]
+        self.assertTrue(query.update_many(updates))
+
+        self.assertEqual(query.select(5, 0, [1, 1, 1, 1, 1])[0].columns, [5, 9, 500, 0, 0])
+        self.assertEqual(query.select_version(5, 0, [0, 1, 1, 0, 0], -1)[0].columns, [2, 500])
+        self.assertEqual(query.select_version(5, 0, [0, 1, 1, 0, 0], -2)[0].columns, [2, 5])
+        self.assertEqual(query.select(999, 0, [0, 1, 0, 0, 0])[0].columns, [0])
+        self.assertEqual(len(query.select(500, 2, [1, 0, 0, 0, 0])), 2)
+        self.assertFalse(query.select(5, 2, [1, 0, 0, 0, 0]))
+
+        # Missing key fails without applying any update
+        self.assertFalse(query.update_many([(1, (None, 7, None, None, None)), (2000, (None, 7, None, None, None))]))
+        self.assertEqual(query.select(1, 0, [0, 1, 0, 0, 0])[0].columns, [1])
+
+    # Test case: Primary keys changed by a batch are unique once it's applied
+    def test_update_many_primary_keys(self):
+        self._open_temp_db()
+        query = Query(self.table)
+        query.insert_many([(key, key, 0, 0, 0) for key in range(1, 11)])
+        query.delete(10)
+
+        # Two records moved to the same new key
+        self.assertFalse(query.update_many([(1, (20, None, None, None, None)), (2, (20, None, None, None, None))]))
+        self.assertFalse(query.select(20, 0, [1, 1, 1, 1, 1]))
+        self.assertEqual(query.select(2, 0, [0, 1, 0, 0, 0])[0].columns, [2])
+
+        # Failing later doesn't reuse the deleted key of an earlier update
+        self.assertFalse(query.update_many([(3, (10, None, None, None, None)), (4, (5, None, None, None, None))]))
+        self.assertIn(10, self.table.delete_tracker)
+        self.assertEqual(query.select(3, 0, [0, 1, 0, 0, 0])[0].columns, [3])
+
+        # Keys swapped, and a key vacated by one record taken by another
+        self.assertTrue(query.update_many([
+            (1, (2, None, None, None, None)),
+            (2, (1, None, None, None, None)),
+            (3, (30, None, None, None, None)),
+            (4, (3, None, None, None, None)),
+        ]))
+        self.assertEqual(query.select(1, 0, [0, 1, 0, 0, 0])[0].columns, [2])
+        self.assertEqual(query.select(2, 0, [0, 1, 0, 0, 0])[0].columns, [1])
+        self.assertEqual(query.select(3, 0, [0, 1, 0, 0, 0])[0].columns, [4])
+        self.assertEqual(query.select(30, 0, [0, 1, 0, 0, 0])[0].columns, [3])
+        self.assertFalse(query.select(4, 0, [1, 1, 1, 1, 1]))
+
+    # Test case: Background merge keeps latest and older versions readable
+    def test_merge(self):
+        self._open_temp_db()
+        table = self.db.create_table('MergeTable', 3, 0)
+        query = Query(table)
+        query.insert_many([(key, key, 0) for key in range(1, 1001)])
+        for key in range(1, 1001, 2):
+            query.update(key, None, key + 1, None)
+        query.update(1, None, None, 5)
+        query.delete(3)
+
+        bufferpool = table.buffer.bufferpool
+        rid = table.index.locate(0, 5)[0]
+        pages_id, offset = rid.get_loc()
+        old_page = bufferpool._get_page(len(MetaCol) + 1, pages_id)
+
+        table.merge()
+        for _ in range(100):
+            if not table.merge_mgr.num_pending:
+                break
+            time.sleep(0.05)
+        self.assertEqual(table.merge_mgr.num_pending, 0)
+
+        self.assertEqual(bufferpool._read_val(MetaCol.SCHEMA, pages_id, offset), -1)
+
+        # Merged data pages were swapped in as new versions
+        self.assertEqual(bufferpool.page_table.get_entry(pages_id).version, 1)
+        self.assertEqual(bufferpool._read_val(len(MetaCol) + 1, pages_id, offset), 6)
+        self.assertEqual(old_page.read(offset), 5)
+
+        self.assertEqual(query.select(1, 0, [1, 1, 1])[0].columns, [1, 2, 5])
+        self.assertEqual(query.select_version(1, 0, [1, 1, 1], -2)[0].columns, [1, 1, 0])
+        self.assertEqual(query.sum(1, 10, 1), 2 + 2 + 4 + 6 + 6 + 8 + 8 + 10 + 10)
+        self.assertEqual(query.sum_version(1, 10, 1, -1), 2 + 2 + 4 + 5 + 6 + 7 + 8 + 9 + 10)
+        self.assertFalse(query.select(3, 0, [1, 1, 1]))
+
+        # Updates after a merge go through tail records again
+        query.update(5, None, 50, None)
+        self.assertEqual(query.select(5, 0, [0, 1, 0])[0].columns, [50])
+        self.assertEqual(query.select_version(5, 0, [0, 1, 0], -1)[0].columns, [6])
+
+    # Test case: Merge of a tail range skips records updated in a later range
+    def test_merge_tail_ranges(self):
+        self._open_temp_db()
+        # Keep the background merge from claiming the ranges first
+        with patch.object(config, 'MERGE_INTERVAL', 60):
+            self._merge_tail_ranges()
+
+    def _merge_tail_ranges(self):
+        table = self.db.create_table('MergeRangeTable', 2, 0)
+        query = Query(table)
+        query.insert_many([(key, 0) for key in range(1, 11)])
+        for val in range(1, 4):
+            query.update(1, None, val)
+        query.update(2, None, 7)
+
+        bufferpool = table.buffer.bufferpool
+        merge_mgr = table.merge_mgr
+        ranges = merge_mgr._pick_ranges(config.MERGE_BATCH_SIZE)
+        query.update(2, None, 8)
+
+        merge_mgr._merge_ranges(ranges)
+        pages_id, offset_1 = table.index.locate(0, 1)[0].get_loc()
+        offset_2 = table.index.locate(0, 2)[0].get_loc()[1]
+        self.assertEqual(bufferpool._read_val(MetaCol.SCHEMA, pages_id, offset_1), -1)
+        self.assertEqual(bufferpool._read_val(len(MetaCol) + 1, pages_id, offset_1), 3)
+        self.assertNotEqual(bufferpool._read_val(MetaCol.SCHEMA, pages_id, offset_2), -1)
+        self.assertEqual(query.select(2, 0, [0, 1])[0].columns, [8])
+
+        merge_mgr.merge()
+        self.assertEqual(merge_mgr.num_pending, 0)
+        self.assertEqual(bufferpool._read_val(MetaCol.SCHEMA, pages_id, offset_2), -1)
+        self.assertEqual(query.select(2, 0, [0, 1])[0].columns, [8])
+        self.assertEqual(query.select_version(1, 0, [0, 1], -2)[0].columns, [1])
+
+    # Test case: Merging the latest base pages keeps records inserted meanwhile
+    def test_merge_during_insert(self):
+        self._open_temp_db()
+        with patch.object(config, 'MERGE_INTERVAL', 60):
+            self._merge_during_insert()
+
+    def _merge_during_insert(self):
+        table = self.db.create_table('MergeInsertTable', 2, 0)
+        query = Query(table)
+        query.insert_many([(key, key) for key in range(10)])
+        query.update(1, None, 100)
+
+        bufferpool = table.buffer.bufferpool
+        swap_pages = bufferpool._swap_pages
+        inserter = threading.Thread(target=query.insert, args=(10, 10))
+
+        # Insert into the pages after they're copied. It's blocked until the
+        # merged pages are swapped in, or else written to the old pages
+        def insert_and_swap(pages_id, pages):
+            inserter.start()
+            inserter.join(0.2)
+            swap_pages(pages_id, pages)
+
+        with patch.object(bufferpool, '_swap_pages', insert_and_swap):
+            table.merge_mgr.merge()
+        inserter.join()
+
+        self.assertEqual(query.select(1, 0, [1, 1])[0].columns, [1, 100])
+        self.assertEqual(query.select(10, 0, [1, 1])[0].columns, [10, 10])
+        self.assertEqual(query.sum(0, 10, 1), sum(range(11)) + 99)
+
+    # Test case: Merge keeps a limited number of versions and frees older tail pages
+    def test_merge_keep_versions(self):
+        self._open_temp_db()
+        with patch.object(config, 'MERGE_KEEP_VERSIONS', 2):
+            table = self.db.create_table('GCTable', 2, 0)
+            query = Query(table)
+            query.insert_many([(key, 0) for key in range(1, 11)])
+            for val in range(1, 1201):
+                query.update(1, None, val)
+            query.update(2, None, 7)
+
+            table.flush_pages()
+            num_tail_pages = len(table.disk.get_pages_ids(is_base=False))
+
+            merge_mgr = table.merge_mgr
+            merge_mgr.merge()
+            stats = merge_mgr.get_stats()
+            self.assertEqual(stats["merged_records"], 2)
+            self.assertEqual(stats["dead_tail_records"], 1200 - 1)
+            self.assertEqual(stats["freed_tail_pages"], 2)
+            self.assertGreater(stats["freed_bytes"], 0)
+            self.assertEqual(len(table.disk.get_pages_ids(is_base=False)), num_tail_pages - 2)
+
+            self.assertEqual(query.select(1, 0, [0, 1])[0].columns, [1200])
+            self.assertEqual(query.select_version(1, 0, [0, 1], -1)[0].columns, [1199])
+            self.assertEqual(query.select_version(1, 0, [0, 1], -5)[0].columns, [1199])
+            self.assertEqual(query.select_version(2, 0, [0, 1], -1)[0].columns, [0])
+
+            query.update(1, None, 1201)
+            self.assertEqual(query.select_version(1, 0, [0, 1], -1)[0].columns, [1200])
+
+    # Test case: Cut off tail pages are only freed once earlier readers are done
+    def test_merge_frees_after_readers(self):
+        self._open_temp_db()
+        with patch.object(config, 'MERGE_KEEP_VERSIONS', 1), \
+                patch.object(config, 'MERGE_INTERVAL', 60), \
+                patch.object(config, 'MERGE_UPDATE_THRESHOLD', 10 ** 6):
+            table = self.db.create_table('EpochTable', 2, 0)
+            query = Query(table)
+            query.insert_many([(key, 0) for key in range(1, 11)])
+            for val in range(1, 1101):
+                query.update(1, None, val)
+
+            merge_mgr = table.merge_mgr
+            with merge_mgr.reading():
+                merge_mgr.merge()
+                self.assertEqual(merge_mgr.get_stats()["freed_tail_pages"], 0)
+                self.assertEqual(len(merge_mgr._freeable), 2)
+
+            # Readers starting after the cut don't keep the pages
+            with merge_mgr.reading():
+                merge_mgr.merge()
+                self.assertEqual(merge_mgr.get_stats()["freed_tail_pages"], 2)
+
+            self.assertEqual(query.select(1, 0, [0, 1])[0].columns, [1100])
+            self.assertEqual(query.select_version(1, 0, [0, 1], -3)[0].columns, [1100])
+
+    # Test case: Uncommitted updates aren't merged, so aborting still undoes them
+    def test_merge_skips_uncommitted_updates(self):
+        self._open_temp_db()
+        with patch.object(config, 'MERGE_INTERVAL', 60), \
+                patch.object(config, 'MERGE_UPDATE_THRESHOLD', 10 ** 6):
+            table = self.db.create_table('UncommittedTable', 3, 0)
+            query = Query(table)
+            query.insert(2, 12, 22)
+            query.insert(3, 13, 23)
+
+            def merge_and_abort():
+                table.merge_mgr.merge()
+                self.assertEqual(query.select(2, 0, [1, 1, 1])[0].columns, [2, 77, 22])
+                return False
+
+            transaction = Transaction()
+            transaction.add_query(query.update, table, 2, *[None, 77, None])
+            transaction.add_query(query.update, table, 3, *[None, 88, None])
+            transaction.add_query(merge_and_abort, table)
+            worker = TransactionWorker([transaction])
+            worker.run()
+            worker.join()
+            self.assertEqual(worker.result, 0)
+
+            self.assertEqual(table.merge_mgr.get_stats()["merged_records"], 0)
+            self.assertEqual(query.select(2, 0, [1, 1, 1])[0].columns, [2, 12, 22])
+            self.assertEqual(query.select(3, 0, [1, 1, 1])[0].columns, [3, 13, 23])
+
+            # Committed updates are merged
+            query.update(2, None, 78, None)
+            table.merge_mgr.merge()
+            self.assertEqual(table.merge_mgr.get_stats()["merged_records"], 1)
+            self.assertEqual(query.select(2, 0, [1, 1, 1])[0].columns, [2, 78, 22])
+
+    # Test case: Scans cycle through their ring instead of evicting cached pages
+    def test_scan_keeps_cached_pages(self):
+        self._open_temp_db()
+        with patch.object(config, 'MAX_BUFFER_PAGES', 30), patch.object(config, 'SCAN_RING_PAGES', 8):
+            table = self.db.create_table('ScanRingTable', 2, 0)
+            query = Query(table)
+            query.insert_many([(key, 1) for key in range(20 * 511)])
+
+            # Hot page is one of the first scanned (newest pages come first)
+            bufferpool = table.buffer.bufferpool
+            pages_id = table.index.locate(0, 18 * 511)[0].get_loc()[0]
+            self.assertEqual(query.select(18 * 511, 0, [1, 1])[0].columns, [18 * 511, 1])
+            self.assertIn((pages_id, len(MetaCol)), bufferpool.evict_queue)
+
+            self.assertEqual(query.sum(0, 20 * 511, 1), 20 * 511)
+            self.assertIn((pages_id, len(MetaCol)), bufferpool.evict_queue)
+            self.assertLessEqual(len(bufferpool.scan_ring), 8)
+            self.assertLessEqual(len(bufferpool.evict_queue) + len(bufferpool.scan_ring), 30)
+
+    def test_pinned_page_not_evicted(self):
+        self._open_temp_db()
+        with patch.object(config, 'MAX_BUFFER_PAGES', 30):
+            table = self.db.create_table('PinTable', 2, 0)
+            query = Query(table)
+            query.insert_many([(key, key) for key in range(20 * 511)])
+
+            # Reading a record of every page cycles the whole cache
+            bufferpool = table.buffer.bufferpool
+            pages_id = table.index.locate(0, 0)[0].get_loc()[0]
+            page = bufferpool._pin_page(len(MetaCol) + 1, pages_id)
+            try:
+                for key in range(0, 20 * 511, 511):
+                    self.assertEqual(query.select(key, 0, [1, 1])[0].columns, [key, key])
+                self.assertIs(bufferpool.page_table.get_entry(pages_id)[len(MetaCol) + 1], page)
+            finally:
+                bufferpool._unpin_page(page)
+
+    # Test case: Reading a record counts one access per page, not one per value
+    def test_record_read_touches_pages_once(self):
+        self._open_temp_db()
+        table = self.db.create_table('TouchTable', 3, 0)
+        query = Query(table)
+        query.insert_many([(key, key, key) for key in range(10)])
+        query.update(3, None, 7, None)
+
+        bufferpool = table.buffer.bufferpool
+        rid = table.index.locate(0, 3)[0]
+        reads = (
+            lambda: query.select(3, 0, [1, 1, 1]),
+            lambda: bufferpool.read(rid, [1, 1, 1], 0),
+        )
+        for read in reads:
+            with patch.object(bufferpool, '_update_evict_queue') as touch:
+                read()
+            touched = [call.args for call in touch.call_args_list]
+            self.assertTrue(touched)
+            self.assertEqual(len(touched), len(set(touched)))
+
+    def test_buffer_memory_budget(self):
+        self._open_temp_db()
+        with patch.object(config, 'MAX_BUFFER_MB', 0.25):
+            table = self.db.create_table('BudgetTable', 2, 0, record_size=[8, 1])
+            query = Query(table)
+            query.insert_many([(key, key % 100) for key in range(40 * 511)])
+            query.update(5, None, 99)
+
+            for key in range(0, 40 * 511, 511):
+                self.assertEqual(query.select(key, 0, [1, 1])[0].columns, [key, key % 100])
+            self.assertEqual(query.sum(0, 40 * 511, 1), sum(key % 100 for key in range(40 * 511)) + 94)
+
+            # Tracked pages are accounted for by size and fit in the budget
+            bufferpool = table.buffer.bufferpool
+            tracked = [*bufferpool.scan_ring, *bufferpool.evict_queue.queue]
+            self.assertEqual(bufferpool.buffer_used, sum(bufferpool.page_costs[col] for _, col in tracked))
+            self.assertLessEqual(bufferpool.buffer_used, 0.25 * 2**20)
+
+    def test_background_writer_and_checkpoint(self):
+        self._open_temp_db()
+        with patch.object(config, 'WRITER_INTERVAL', None):
+            table = self.db.create_table('WriterTable', 2, 0)
+            query = Query(table)
+            query.insert_many([(key, key) for key in range(3 * 511)])
+
+            # Full pages are written coalesced (one write per segment), the
+            # latest pages are left dirty
+            writer = table.page_writer
+            self.assertEqual(writer.write_round(), 2 * table.num_total_cols)
+            self.assertEqual(writer.get_stats()["writes"], table.num_total_cols)
+
+            latest = next(reversed(table.buffer.bufferpool.base_trackers))
+            dirty = table.buffer.bufferpool.get_dirty_pages()
+            self.assertEqual(dirty, [(latest, col) for col in range(table.num_total_cols)])
+
+            # Checkpoints write all pages and record the log position
+            writer.checkpoint()
+            self.assertFalse(table.buffer.bufferpool.get_dirty_pages())
+            with open(os.path.join(table.disk.path, 'checkpoint.json')) as file:
+                self.assertEqual(json.load(file)["redo_lsn"], self.db.wal.get_last_lsn())
+
+            pages_id = table.index.locate(0, 0)[0].get_loc()[0]
+            self.assertEqual(table.disk.get_page(pages_id, len(MetaCol) + 1).vals[:3].tolist(), [0, 1, 2])
+
+    def test_parallel_index_rebuild(self):
+        path = self._open_temp_db()
+        table = self.db.create_table('RebuildTable', 3, 0, IndexConfig(index_columns=[0, 1, 2]))
+        Query(table).insert_many([(key, key % 13, -key) for key in range(2000)])
+        self.db.close()
+
+        process_pool = concurrent.futures.ProcessPoolExecutor
+        def reopen(workers):
+            self.db = Database()
+            with patch.object(config, 'INDEX_REBUILD_WORKERS', workers), \
+                    patch('lstore.index.Index.load_snapshot', return_value=False), \
+                    patch('concurrent.futures.ProcessPoolExecutor', wraps=process_pool) as pool:
+                self.db.open(path)
+            return pool
+
+        # Rebuilt on open in a process pool, or in process w/ a single worker
+        for workers, uses_pool in ((3, True), (1, False)):
+            self.assertEqual(reopen(workers).called, uses_pool)
+
+            query = Query(self.db.get_table('RebuildTable'))
+            self.assertEqual(len(query.select(5, 1, [1, 0, 0])), len(range(5, 2000, 13)))
+            self.assertEqual(query.select(-1999, 2, [1, 1, 1])[0].columns, [1999, 10, -1999])
+            self.db.close()
+
+        # Never forks while other threads run
+        self.db = Database()
+        self.db.open(path)
+        table = self.db.get_table('RebuildTable')
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        try:
+            with patch.object(config, 'INDEX_REBUILD_WORKERS', 3), \
+                    patch('concurrent.futures.ProcessPoolExecutor', wraps=process_pool) as pool:
+                table.reconstruct_index([0, 1, 2])
+        finally:
+            stop.set()
+            thread.join()
+        self.assertFalse(pool.called)
+        self.assertEqual(Query(table).select(-7, 2, [1, 1, 1])[0].columns, [7, 7, -7])
+
+    def test_index_snapshot_round_trip(self):
+        path = self._open_temp_db()
+        table = self.db.create_table('SnapshotTable', 3, 0, IndexConfig(index_columns=[0, 2]))
+        query = Query(table)
+        query.insert_many([(key, key, key % 7) for key in range(1500)])
+        query.update(5, None, None, 100)
+        query.delete(6)
+
+        # Stale stamp is rejected w/o touching the index, and the run is dropped
+        index = table.index
+        index.save_snapshot(table.disk.path, 42)
+        self.assertFalse(index.load_snapshot(table.disk.path, 41))
+        self.assertEqual(len(index.locate(2, 3)), len(range(3, 1500, 7)))
+        self.assertFalse(index.load_snapshot(table.disk.path, 42))
+
+        index.save_snapshot(table.disk.path, 42)
+        index.clear()
+        self.assertTrue(index.load_snapshot(table.disk.path, 42))
+        self.assertEqual(index.locate(2, 100), index.locate(0, 5))
+
+        # Reopening loads the snapshot saved on close instead of rebuilding
+        self.db.close()
+        self.db = Database()
+        with patch('lstore.table.Table.reconstruct_index') as reconstruct_index:
+            self.db.open(path)
+        reconstruct_index.assert_not_called()
+
+        query = Query(self.db.get_table('SnapshotTable'))
+        self.assertEqual(query.select(100, 2, [1, 1, 1])[0].columns, [5, 5, 100])
+        self.assertEqual(len(query.select(3, 2, [1, 0, 0])), len(range(3, 1500, 7)))
+        self.assertFalse(query.select(6, 0, [1, 1, 1]))
+
+    def test_mmap_base_pages_round_trip(self):
+        path = self._open_temp_db()
+        with patch.object(config, 'MMAP_BASE_PAGES', True):
+            table = self.db.create_table('MappedTable', 3, 0)
+            query = Query(table)
+            query.insert_many([(key, key, 0) for key in range(1200)])
+            self.db.close()
+
+            # Base pages read back through the maps are copied once changed
+            for value in (1, 2):
+                self.db = Database()
+                self.db.open(path)
+                table = self.db.get_table('MappedTable')
+                query = Query(table)
+                pages_id = table.index.locate(0, 0)[0].get_loc()[0]
+                self.assertIsInstance(table.disk.get_page(pages_id, len(MetaCol)).data, memoryview)
+                for key in range(0, 1200, 2):
+                    query.update(key, None, None, value)
+                table.merge_mgr.merge()
+                self.db.close()
+
+        self.db = Database()
+        self.db.open(path)
+        query = Query(self.db.get_table('MappedTable'))
+        self.assertEqual(query.sum(0, 1199, 1), sum(range(1200)))
+        self.assertEqual(query.sum(0, 1199, 2), 2 * 600)
+        self.assertEqual(query.select(2, 0, [1, 1, 1])[0].columns, [2, 2, 2])
+
+    def test_wal_replay_after_crash(self):
+        path = self._open_temp_db()
+        with patch.object(config, 'WRITER_INTERVAL', None):
+            table = self.db.create_table('WalTable', 3, 0)
+            Query(table).insert_many([(key, key, 0) for key in range(600)])
+            self.db.close()
+            self.db = Database()
+            self.db.open(path)
+
+            table = self.db.get_table('WalTable')
+            query = Query(table)
+            for key in range(0, 600, 3):
+                query.update(key, None, None, 1)
+
+            # Some of the changes reach disk before the crash
+            table.page_writer.write_round()
+
+            transaction = Transaction()
+            transaction.add_query(query.update, table, 1, *[None, 100, None])
+            transaction.add_query(query.delete, table, 2)
+            transaction.add_query(query.insert, table, *[1000, 1, 2])
+            self.assertTrue(transaction.run())
+
+            # Crash w/o flushing pages (only the log is synced), mid-append
+            for crashed_table in self.db.tables.values():
+                crashed_table.merge_mgr.stop()
+            self.db.wal.sync()
+            with open(self.db.wal.path, 'ab') as file:
+                file.write(b'[{"op":"delete","ta')
+
+            self.db = Database()
+            self.db.open(path)
+
+            query = Query(self.db.get_table('WalTable'))
+            self.assertEqual(query.select(1, 0, [1, 1, 1])[0].columns, [1, 100, 0])
+            self.assertFalse(query.select(2, 0, [1, 1, 1]))
+            self.assertEqual(query.select(1000, 0, [1, 1, 1])[0].columns, [1000, 1, 2])
+            self.assertEqual(query.sum(0, 599, 2), 200)
+            self.assertFalse(self.db.wal.read())
+
+    # Test case: Pages w/ uncommitted changes aren't written, so a crash loses them
+    def test_uncommitted_changes_not_written(self):
+        path = self._open_temp_db()
+        crash_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(crash_dir.cleanup)
+        crash_path = os.path.join(crash_dir.name, 'crash_image')
+        with patch.object(config, 'WRITER_INTERVAL', None):
+            table = self.db.create_table('NoStealTable', 3, 0)
+            query = Query(table)
+            query.insert_many([(key, 10 + key, 20 + key) for key in range(600)])
+
+            # Closing empties the log, so replay can't restore the rows
+            self.db.close()
+            self.db = Database()
+            self.db.open(path)
+            table = self.db.get_table('NoStealTable')
+            query = Query(table)
+            query.update(4, None, 14, None)
+
+            def crash_mid_transaction():
+                table.page_writer.write_round()
+                self.db.wal.sync()
+                shutil.copytree(path, crash_path)
+                return True
+
+            transaction = Transaction()
+            transaction.add_query(query.update, table, 3, *[None, 555, None])
+            transaction.add_query(crash_mid_transaction, table)
+            worker = TransactionWorker([transaction])
+            worker.run()
+            worker.join()
+            self.assertEqual(worker.result, 1)
+
+            # Written once committed
+            self.assertFalse(table.buffer.bufferpool.uncommitted)
+            self.assertGreater(table.page_writer.write_round(), 0)
+
+        crashed_db = Database()
+        crashed_db.open(crash_path)
+        query = Query(crashed_db.get_table('NoStealTable'))
+        self.assertEqual(query.select(3, 0, [1, 1, 1])[0].columns, [3, 13, 23])
+        self.assertEqual(query.select(4, 0, [1, 1, 1])[0].columns, [4, 14, 24])
+        crashed_db.close()
+
+    # Test case: Checkpoints truncate the log, replay starts after them
+    def test_checkpoint_truncates_log(self):
+        path = self._open_temp_db()
+        with patch.object(config, 'WRITER_INTERVAL', None):
+            table = self.db.create_table('CheckpointTable', 3, 0)
+            query = Query(table)
+            query.insert_many([(key, key, 0) for key in range(600)])
+            for key in range(0, 600, 2):
+                query.update(key, None, None, 1)
+            query.delete(5)
+
+            # Lines stay until every table has its changes on disk
+            table.page_writer.checkpoint()
+            self.assertTrue(self.db.wal.read())
+            self.db.tables['TestTable'].page_writer.checkpoint()
+            self.assertFalse(self.db.wal.read())
+
+            query.update(1, None, 100, None)
+            query.delete(3)
+            query.insert(5, 5, 5)
+
+            # Crash w/o flushing pages (only the log is synced)
+            for crashed_table in self.db.tables.values():
+                crashed_table.merge_mgr.stop()
+            self.db.wal.sync()
+            num_lines = len(self.db.wal.read())
+
+            self.db = Database()
+            with patch.object(Database, '_replay_op', autospec=True,
+                              side_effect=Database._replay_op) as replay_op:
+                self.db.open(path)
+            self.assertEqual(replay_op.call_count, num_lines)
+
+            query = Query(self.db.get_table('CheckpointTable'))
+            self.assertEqual(query.select(1, 0, [1, 1, 1])[0].columns, [1, 100, 0])
+            self.assertFalse(query.select(3, 0, [1, 1, 1]))
+            self.assertEqual(query.select(5, 0, [1, 1, 1])[0].columns, [5, 5, 5])
+            self.assertEqual(query.sum(0, 599, 2), 305)
+            self.assertFalse(self.db.wal.read())
+
+    def test_wal_replay_of_inserted_rows(self):
+        path = self._open_temp_db()
+        with patch.object(config, 'WRITER_INTERVAL', None):
+            table = self.db.create_table('WalInsertTable', 3, 0)
+            Query(table).insert_many([(key, key, 0) for key in range(3000)])
+            self.db.close()
+            self.db = Database()
+            self.db.open(path)
+
+            table = self.db.get_table('WalInsertTable')
+            query = Query(table)
+            for key in range(3000, 6000):
+                query.insert(key, key, 0)
+
+            # Some of the inserts reach disk, so replaying them replaces records
+            table.page_writer.write_round()
+
+            for key in range(0, 6000, 3):
+                query.update(key, None, None, 1)
+            for key in range(0, 6000, 10):
+                query.delete(key)
+
+            # Key reused after its delete, then changed again
+            query.insert(10, 10, 0)
+            query.update(10, None, 11, None)
+
+            for crashed_table in self.db.tables.values():
+                crashed_table.merge_mgr.stop()
+            self.db.wal.sync()
+
+            self.db = Database()
+            self.db.open(path)
+
+            query = Query(self.db.get_table('WalInsertTable'))
+            for key in range(6000):
+                records = query.select(key, 0, [1, 1, 1])
+                if key % 10 == 0 and key != 10:
+                    self.assertFalse(records)
+                else:
+                    self.assertEqual(records[0].columns, [key, key + (key == 10), int(key % 3 == 0)])
+
+    def test_concurrent_updates_and_reads(self):
+        self._open_temp_db()
+        with patch.object(config, 'MAX_BUFFER_PAGES', 40):
+            table = self.db.create_table('ConcurrentTable', 2, 0)
+            query = Query(table)
+            num_threads, per_thread = 4, 300
+            query.insert_many([(key, 0) for key in range(num_threads * per_thread)])
+
+            errors = []
+            def work(first):
+                try:
+                    for _ in range(3):
+                        for key in range(first, first + per_thread):
+                            value = query.select(key, 0, [0, 1])[0].columns[0]
+                            query.update(key, None, value + 1)
+                            query.select(randint(0, num_threads * per_thread - 1), 0, [1, 1])
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [
+                threading.Thread(target=work, args=(i * per_thread,))
+                for i in range(num_threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(errors, [])
+            for key in range(num_threads * per_thread):
+                self.assertEqual(query.select(key, 0, [0, 1])[0].columns, [3])
+
     # Edge case: Large number of records
     def test_large_number_of_records(self):
         query = Query(self.table)
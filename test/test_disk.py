@@ -0,0 +1,128 @@
+"""
+Unit tests for the segment files and page catalogs on disk
+"""
+
+import sys
+import os
+
+# Add root dir to path to find lstore
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# -----------------------
+
+from types import SimpleNamespace
+
+import pytest
+
+from lstore.page import Page
+from lstore.storage.disk import Disk
+
+
+# Metadata columns are 8 bytes, data columns narrower
+RECORD_SIZES = [8, 8, 8, 8, 4, 2]
+
+
+def make_disk(path, use_mmap=False):
+    return Disk(SimpleNamespace(record_sizes=RECORD_SIZES), path=str(path), use_mmap=use_mmap)
+
+
+def make_page(pages_id, col, values):
+    page = Page(pages_id, RECORD_SIZES[col])
+    page.write_many(values)
+    return page
+
+
+class TestDisk:
+    def test_round_trip(self, tmp_path):
+        disk = make_disk(tmp_path)
+
+        # Base pages (even ids) and tail pages (odd ids) in every column
+        for pages_id in (0, 1, 2):
+            for col in range(len(RECORD_SIZES)):
+                disk.add_page(make_page(pages_id, col, [pages_id, col, -1]), pages_id, col)
+        disk.close()
+
+        disk = make_disk(tmp_path)
+        assert disk.get_pages_ids(is_base=True) == [0, 2]
+        assert disk.get_pages_ids(is_base=False) == [1]
+
+        for pages_id in (0, 1, 2):
+            for col in range(len(RECORD_SIZES)):
+                page = disk.get_page(pages_id, col)
+                assert page.offset == 3
+                assert list(page) == [pages_id, col, -1]
+
+        with pytest.raises(FileNotFoundError):
+            disk.get_page(4, 0)
+        disk.close()
+
+    def test_write_pages_coalesces_slots(self, tmp_path):
+        disk = make_disk(tmp_path)
+
+        # New pages get slots 0-2, which are adjacent so they're written at once
+        pages = [(pages_id, 4, bytes(make_page(pages_id, 4, [pages_id]).data))
+                 for pages_id in (4, 0, 2)]
+        assert disk.write_pages(pages) == 1
+        assert disk.write_pages([(6, 4, bytes(make_page(6, 4, [6]).data))]) == 1
+        disk.close()
+
+        disk = make_disk(tmp_path)
+        for pages_id in (0, 2, 4, 6):
+            assert list(disk.get_page(pages_id, 4)) == [pages_id]
+        disk.close()
+
+    def test_slot_reuse(self, tmp_path):
+        disk = make_disk(tmp_path)
+        for pages_id in (0, 2):
+            disk.add_page(make_page(pages_id, 5, [pages_id]), pages_id, 5)
+
+        # Freed slot goes to the next new pages instead of growing the segment
+        assert disk.free_page(0) == sum(Page.block_size(size) for size in RECORD_SIZES)
+        assert disk.free_page(0) == 0
+        disk.add_page(make_page(8, 5, [8]), 8, 5)
+
+        size = os.path.getsize(os.path.join(tmp_path, "base_5.seg"))
+        assert size == 2 * Page.block_size(RECORD_SIZES[5])
+        disk.close()
+
+        # Catalog persisted w/ the reused slot
+        disk = make_disk(tmp_path)
+        assert disk.get_pages_ids(is_base=True) == [8, 2]
+        assert list(disk.get_page(8, 5)) == [8]
+        assert list(disk.get_page(2, 5)) == [2]
+        with pytest.raises(FileNotFoundError):
+            disk.get_page(0, 5)
+        disk.close()
+
+    def test_mmap_round_trip(self, tmp_path):
+        disk = make_disk(tmp_path, use_mmap=True)
+        for pages_id in (0, 1):
+            disk.add_page(make_page(pages_id, 4, [1, 2, 3]), pages_id, 4)
+
+        # Base pages are views of the mapped segment, tail pages are read
+        base_page = disk.get_page(0, 4)
+        tail_page = disk.get_page(1, 4)
+        assert isinstance(base_page.data, memoryview)
+        assert isinstance(tail_page.data, bytearray)
+        assert list(base_page) == list(tail_page) == [1, 2, 3]
+
+        # The first write copies the page, the file only changes once written
+        view = base_page.vals
+        base_page.update(99, 1)
+        assert isinstance(base_page.data, bytearray)
+        assert list(view[:3]) == [1, 2, 3]
+        assert list(disk.get_page(0, 4)) == [1, 2, 3]
+
+        disk.add_page(base_page, 0, 4)
+        disk.sync()
+        assert list(view[:3]) == [1, 99, 3]
+        del base_page, view
+        disk.close()
+
+        disk = make_disk(tmp_path, use_mmap=True)
+        assert list(disk.get_page(0, 4)) == [1, 99, 3]
+        disk.close()
+
+        disk = make_disk(tmp_path)
+        assert list(disk.get_page(0, 4)) == [1, 99, 3]
+        disk.close()
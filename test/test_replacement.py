@@ -0,0 +1,72 @@
+"""
+Unit tests for the bufferpool replacement policies
+"""
+
+import sys
+import os
+
+# Add root dir to path to find lstore
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# -----------------------
+
+import pytest
+
+from lstore.storage.buffer.replacement import make_policy
+
+
+class TestReplacement:
+    def test_lru_and_mru(self):
+        for name, victim in (("lru", 2), ("mru", 1)):
+            policy = make_policy(name, 3)
+            for key in range(3):
+                policy.add(key)
+            policy.touch(1)
+            policy.touch(0)
+            policy.touch(1)
+
+            assert policy.evict() == victim
+            assert len(policy) == 2 and victim not in policy
+
+    def test_clock_second_chance(self):
+        policy = make_policy("clock", 3)
+        for key in range(3):
+            policy.add(key)
+
+        # All referenced, so the hand clears every bit and comes back to 0
+        assert policy.evict() == 0
+
+        policy.touch(1)
+        assert policy.evict() == 2
+        assert policy.evict() == 1
+
+    def test_2q_one_off_pages_evicted_first(self):
+        policy = make_policy("2q", 8)
+
+        # Page 0 comes back after being evicted, so it's hot
+        policy.add(0)
+        assert policy.evict() == 0
+        policy.add(0)
+
+        # A scan of one-off pages only cycles through the FIFO
+        for key in range(1, 20):
+            policy.add(key)
+            if len(policy) > 8:
+                assert policy.evict() != 0
+
+        assert 0 in policy
+
+    def test_remove(self):
+        for name in ("lru", "mru", "clock", "2q"):
+            policy = make_policy(name, 4)
+            policy.add(0)
+            policy.add(1)
+            policy.remove(0)
+            policy.remove(5)
+
+            assert 0 not in policy and len(policy) == 1
+            assert policy.evict() == 1
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            make_policy("fifo", 4)